@@ -1,12 +1,23 @@
 import os
+import threading
 from dotenv import load_dotenv
-from openai import OpenAI
 
 # --------------------------------------------------
 # 1. 加载 .env 文件中的环境变量
 # --------------------------------------------------
 load_dotenv()  # 会从项目根目录下的 .env 文件中读取变量
 
+
+def _parse_mapping(raw: str | None) -> dict:
+    """解析 ``key=value,key2=value2`` 形式的环境变量。"""
+    mapping = {}
+    for item in (raw or "").split(","):
+        key, sep, value = item.partition("=")
+        if sep and key.strip() and value.strip():
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
 # --------------------------------------------------
 # 2. OpenAI 相关配置
 # --------------------------------------------------
@@ -21,6 +32,105 @@ MAX_TOKENS = int(os.getenv("MAX_TOKENS", 1000))
 # 温度参数（0~1）
 TEMPERATURE = float(os.getenv("TEMPERATURE", 0.7))
 
+# --------------------------------------------------
+# 2.1.1 提示词预算配置
+# --------------------------------------------------
+# 单次调用的输入 token 预算（Persona 提示词 + 历史 + 当前输入）
+PROMPT_INPUT_BUDGET = int(os.getenv("PROMPT_INPUT_BUDGET", 3000))
+# 组装提示词时最多考虑的历史消息条数
+PROMPT_HISTORY_LIMIT = int(os.getenv("PROMPT_HISTORY_LIMIT", 50))
+# 超出预算的早期对话是否调用模型压缩为摘要（否则直接丢弃）
+PROMPT_SUMMARISE_OVERFLOW = os.getenv("PROMPT_SUMMARISE_OVERFLOW", "False").lower() in ("true", "1", "yes")
+# 交给摘要模型的早期对话最多多少 token（只取最新的部分）；相同内容的摘要会被缓存复用
+PROMPT_SUMMARY_INPUT_BUDGET = int(os.getenv("PROMPT_SUMMARY_INPUT_BUDGET", 2000))
+
+# --------------------------------------------------
+# 2.1.2 模型路由与级联
+# --------------------------------------------------
+# 按路由指定模型，例如 "chat=gpt-4o-mini,summarise=gpt-4o-mini"；Persona 的 model 字段优先
+ROUTE_MODELS = _parse_mapping(os.getenv("ROUTE_MODELS"))
+# 开启后先用小模型作答，未通过置信度/长度检查再升级到路由模型
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "False").lower() in ("true", "1", "yes")
+CASCADE_SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "gpt-4o-mini")
+# 提示词超过该 token 数时直接使用大模型
+CASCADE_MAX_PROMPT_TOKENS = int(os.getenv("CASCADE_MAX_PROMPT_TOKENS", 800))
+# 小模型回答短于该字符数时视为失败
+CASCADE_MIN_RESPONSE_CHARS = int(os.getenv("CASCADE_MIN_RESPONSE_CHARS", 2))
+
+# --------------------------------------------------
+# 2.1.3 并行分支
+# --------------------------------------------------
+# 一次请求命中多个路由时最多并行执行的分支数（1 表示关闭并行分支）
+FANOUT_MAX_ROUTES = int(os.getenv("FANOUT_MAX_ROUTES", 3))
+# 单个分支的超时时间（秒），超时的分支会被丢弃；可按路由覆盖，如 "research=5,plan=2"
+BRANCH_TIMEOUT = float(os.getenv("BRANCH_TIMEOUT", 30.0))
+BRANCH_TIMEOUTS = {key: float(value) for key, value in _parse_mapping(os.getenv("BRANCH_TIMEOUTS")).items()}
+
+# 相同请求并发到达时只调用一次模型/图（single-flight 合并）
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "True").lower() in ("true", "1", "yes")
+# 合并的图调用中，跟随者最多等待领头调用的秒数；超时后自行执行一次
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", 120.0))
+
+# 路由关键词配置文件（留空使用 src/agent/personas/routes.yaml），文件修改后按该间隔（秒）检查并热加载
+ROUTES_CONFIG_PATH = os.getenv("ROUTES_CONFIG_PATH", "")
+ROUTES_RELOAD_INTERVAL = float(os.getenv("ROUTES_RELOAD_INTERVAL", 1.0))
+# 可选的意图分类模型（python -m src.train_intent 训练生成），关键词未命中时使用；置信度低于阈值则回退到对话路由
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "outputs/intent_model.npz")
+INTENT_THRESHOLD = float(os.getenv("INTENT_THRESHOLD", 0.6))
+# 路由决策日志（JSONL），用于重新训练意图分类器；留空则不记录
+ROUTING_LOG_PATH = os.getenv("ROUTING_LOG_PATH", "")
+
+# --------------------------------------------------
+# 2.1.4 用量与成本统计
+# --------------------------------------------------
+# 模型单价（美元 / 百万 token，输入/输出），如 "gpt-4o=2.5/10,gpt-4o-mini=0.15/0.6"；会覆盖同名默认值
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    **{
+        key: tuple(float(part) for part in value.split("/", 1))
+        for key, value in _parse_mapping(os.getenv("MODEL_PRICES")).items()
+        if value.count("/") == 1
+    },
+}
+# /usage 命令与 GET /usage 中“近期用量”统计的滚动窗口（秒）
+USAGE_WINDOW_SECONDS = float(os.getenv("USAGE_WINDOW_SECONDS", 3600.0))
+
+# --------------------------------------------------
+# 2.1.5 批处理（src/batch_runner.py）
+# --------------------------------------------------
+# 同时执行的请求数；在途请求最多为并发数的 BATCH_WINDOW_FACTOR 倍，保证内存占用平稳
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_WINDOW_FACTOR = int(os.getenv("BATCH_WINDOW_FACTOR", 4))
+# 已读取但未连续完成的行数上限：某一行迟迟不结束时暂停读取新行，避免断点中的 done 集合无限增长
+BATCH_REORDER_WINDOW = int(os.getenv("BATCH_REORDER_WINDOW", 1000))
+# 每完成多少条写一次断点文件
+BATCH_CHECKPOINT_EVERY = int(os.getenv("BATCH_CHECKPOINT_EVERY", 50))
+
+# --------------------------------------------------
+# 2.1.6 确定性节点缓存
+# --------------------------------------------------
+# 对输入与数据版本确定的专家节点（调研/规划/报告）缓存结果，键为 路由 + 输入 + 知识库版本
+MEMO_ENABLED = os.getenv("MEMO_ENABLED", "True").lower() in ("true", "1", "yes")
+MEMO_ROUTES = tuple(item.strip() for item in os.getenv("MEMO_ROUTES", "research,plan,docgen").split(",") if item.strip())
+# 内存 LRU 容量；MEMO_PATH 非空时同时持久化到该 SQLite 文件，重启后仍可命中
+MEMO_MAX_ENTRIES = int(os.getenv("MEMO_MAX_ENTRIES", 256))
+MEMO_PATH = os.getenv("MEMO_PATH", "")
+MEMO_DISK_MAX_ENTRIES = int(os.getenv("MEMO_DISK_MAX_ENTRIES", 10000))
+# 按输入命名的自动报告（auto_report_<摘要>.pdf）最多保留的份数，超出时删除最旧的文件
+AUTO_REPORT_LIMIT = int(os.getenv("AUTO_REPORT_LIMIT", 50))
+
+# --------------------------------------------------
+# 2.1.7 计划执行
+# --------------------------------------------------
+# 开启后规划器按“然后/then”等词划分阶段，同一阶段内的步骤互不依赖、可并行
+PLAN_PARALLEL = os.getenv("PLAN_PARALLEL", "False").lower() in ("true", "1", "yes")
+# 开启后规划路由会按依赖关系执行每个步骤（分派给专家或对话模型），而不只是列出步骤
+PLAN_EXECUTE = os.getenv("PLAN_EXECUTE", "False").lower() in ("true", "1", "yes")
+# 同时执行的计划步骤数上限
+PLAN_MAX_WORKERS = int(os.getenv("PLAN_MAX_WORKERS", 4))
+
 # --------------------------------------------------
 # 2.2 会话历史存储配置
 # --------------------------------------------------
@@ -31,6 +141,9 @@ HISTORY_CLOUD_TOKEN = os.getenv("HISTORY_CLOUD_TOKEN")
 HISTORY_CLOUD_TIMEOUT = float(os.getenv("HISTORY_CLOUD_TIMEOUT", 5.0))
 HISTORY_CLOUD_FALLBACK_PATH = os.getenv("HISTORY_CLOUD_FALLBACK_PATH")
 
+# 按 thread_id 持久化图状态的 SQLite 断点文件（需安装 langgraph-checkpoint-sqlite）
+GRAPH_CHECKPOINT_PATH = os.getenv("GRAPH_CHECKPOINT_PATH", "outputs/graph_checkpoints.db")
+
 # --------------------------------------------------
 # 2.2.1 日程与任务存储配置
 # --------------------------------------------------
@@ -48,9 +161,101 @@ KB_CLOUD_TIMEOUT = float(os.getenv("KB_CLOUD_TIMEOUT", 5.0))
 KB_CLOUD_FALLBACK_PATH = os.getenv("KB_CLOUD_FALLBACK_PATH")
 
 # --------------------------------------------------
-# 2.1 OpenAI 客户端实例
+# 2.4 任务队列（src/agent/queue）
 # --------------------------------------------------
-client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+# 队列数据库路径（后台 worker 与提醒共用）
+QUEUE_DB_PATH = os.getenv("QUEUE_DB_PATH", "queue.db")
+# SQLite 被其他进程加锁时的等待时间（秒）；队列使用 WAL 模式，多个 worker 进程可共享同一个 queue.db
+QUEUE_BUSY_TIMEOUT = float(os.getenv("QUEUE_BUSY_TIMEOUT", 5.0))
+# 数据库操作在独立线程中执行，事件循环不会因提交（fsync）阻塞；同时到达的写操作合并为一个事务提交，单个事务最多合并的写操作数
+QUEUE_WRITE_BATCH = int(os.getenv("QUEUE_WRITE_BATCH", 64))
+# 入队时立即唤醒空闲 worker（进程内事件 + <db>.notify/ 下的 UNIX 套接字）；轮询仅作兜底，间隔在下列范围内指数退避（秒）
+QUEUE_NOTIFY = os.getenv("QUEUE_NOTIFY", "True").lower() in ("true", "1", "yes")
+QUEUE_POLL_MIN = float(os.getenv("QUEUE_POLL_MIN", 0.05))
+QUEUE_POLL_MAX = float(os.getenv("QUEUE_POLL_MAX", 5.0))
+# 认领任务即获得租约（秒），运行期间由 worker 心跳续期；租约过期（worker 崩溃）的任务会被重新放回队列，
+# 重试间隔从 QUEUE_RETRY_BACKOFF 起指数增长（上限 QUEUE_RETRY_BACKOFF_MAX），尝试 QUEUE_MAX_ATTEMPTS 次后进入死信状态
+QUEUE_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", 60.0))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 5))
+QUEUE_RETRY_BACKOFF = float(os.getenv("QUEUE_RETRY_BACKOFF", 5.0))
+QUEUE_RETRY_BACKOFF_MAX = float(os.getenv("QUEUE_RETRY_BACKOFF_MAX", 300.0))
+# 带 dedup_key 入队时的去重窗口（秒）：同一键的任务未结束或创建时间在窗口内时，重复提交直接返回已有任务，不会再次执行
+QUEUE_DEDUP_WINDOW = float(os.getenv("QUEUE_DEDUP_WINDOW", 3600.0))
+# 后台 worker 同时执行的任务数、心跳间隔（秒），以及收到退出信号后等待运行中任务完成的时间（秒）
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 10.0))
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", 60.0))
+# HTTP API 中 GET /tasks/<id>?wait=秒 长轮询的最长等待时间（秒）
+API_TASK_WAIT_MAX = float(os.getenv("API_TASK_WAIT_MAX", 30.0))
+# 通过 /task add（带截止时间）和 /schedule 添加的条目会在到期前 REMINDER_LEAD_MINUTES 分钟入队一条提醒，
+# 由后台 worker 到点生成、正在运行的 CLI 订阅队列结果后显示并写入对话历史；需要运行 bg_worker
+REMINDER_QUEUE_ENABLED = os.getenv("REMINDER_QUEUE_ENABLED", "False").lower() in ("true", "1", "yes")
+REMINDER_LEAD_MINUTES = float(os.getenv("REMINDER_LEAD_MINUTES", 15))
+
+# --------------------------------------------------
+# 2.1 OpenAI 客户端（首次使用时创建，进程内共享连接池）
+# --------------------------------------------------
+# 连接池上限与 keep-alive 设置
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", 10))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 30.0))
+# 单次请求超时时间（秒）
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60.0))
+# 全局限流：每秒最多发起的模型请求数（0 表示不限）与突发上限
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", 0))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", 10))
+# 交互（CLI/API）与后台（队列/批处理）通道各自的并发上限
+LLM_INTERACTIVE_CONCURRENCY = int(os.getenv("LLM_INTERACTIVE_CONCURRENCY", 8))
+LLM_BACKGROUND_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", 2))
+# 各路由的模型调用硬超时（秒），如 "chat=20,summarise=40"；超时后返回降级回复
+LLM_ROUTE_TIMEOUTS = {key: float(value) for key, value in _parse_mapping(os.getenv("LLM_ROUTE_TIMEOUTS")).items()}
+LLM_DEFAULT_TIMEOUT = float(os.getenv("LLM_DEFAULT_TIMEOUT", 30.0))
+# 首次请求超过该路由 p95 延迟仍未返回时发送对冲请求；样本不足时使用 LLM_HEDGE_AFTER（秒）
+LLM_HEDGING = os.getenv("LLM_HEDGING", "True").lower() in ("true", "1", "yes")
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", 8.0))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+# 熔断：时间窗口内错误率超过阈值后暂停调用模型，冷却后放行探测请求
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", 0.5))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", 10))
+LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", 60.0))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30.0))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """返回共享的 OpenAI 客户端，首次调用时才导入 SDK 并建立连接池。"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                kwargs = {"api_key": OPENAI_API_KEY, "base_url": OPENAI_API_BASE, "timeout": OPENAI_TIMEOUT}
+                try:
+                    import httpx
+                except ImportError:  # pragma: no cover - httpx ships with the openai SDK
+                    httpx = None
+                if httpx is not None:
+                    kwargs["http_client"] = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                        ),
+                        timeout=OPENAI_TIMEOUT,
+                    )
+                _client = OpenAI(**kwargs)
+    return _client
+
+
+def __getattr__(name):
+    # 兼容旧代码的 ``config.client`` 访问方式，同时保持延迟创建
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # --------------------------------------------------
 # 3. 调试与日志级别
@@ -60,6 +265,12 @@ DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "yes")
 # 日志级别，可用值：DEBUG, INFO, WARNING, ERROR, CRITICAL
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+# 节点/工具/模型调用的耗时追踪，结果写入 metadata["trace"]
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "True").lower() in ("true", "1", "yes")
+# 追踪导出器，逗号分隔：log（写日志）、jsonl（追加到 TRACE_FILE_PATH）、memory（测试用）
+TRACE_EXPORTERS = os.getenv("TRACE_EXPORTERS", "log")
+TRACE_FILE_PATH = os.getenv("TRACE_FILE_PATH", "outputs/traces.jsonl")
+
 # --------------------------------------------------
 # 4. 数据库配置（若不使用可留空或注释）
 # --------------------------------------------------
@@ -3,8 +3,11 @@ from __future__ import annotations
 
 import sys
 import types
+import typing
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parent
 SRC = ROOT / "src"
 if str(SRC) not in sys.path:
@@ -23,13 +26,23 @@ if "dotenv" not in sys.modules:
 if "langgraph" not in sys.modules:
     langgraph_module = types.ModuleType("langgraph")
     langgraph_graph_module = types.ModuleType("langgraph.graph")
+    langgraph_checkpoint_module = types.ModuleType("langgraph.checkpoint")
+    langgraph_memory_module = types.ModuleType("langgraph.checkpoint.memory")
+
+    class DummyMemorySaver:
+        """Keeps the latest state and next node per thread, like a real checkpointer."""
+
+        def __init__(self):
+            self.storage = {}
 
     class DummyStateGraph:
         def __init__(self, _state_type=None):
+            self.state_type = _state_type
             self.nodes = {}
             self.entry = None
             self.finish = None
             self.edges = {}
+            self.conditional_edges = {}
 
         def add_node(self, name, func):
             self.nodes[name] = func
@@ -43,35 +56,107 @@ if "langgraph" not in sys.modules:
         def add_edge(self, start, end):
             self.edges[start] = end
 
-        def compile(self):
+        def add_conditional_edges(self, source, path, path_map=None):
+            self.conditional_edges[source] = path
+
+        def compile(self, checkpointer=None):
             nodes = self.nodes
             entry = self.entry
             finish = self.finish
             edges = self.edges
+            conditional_edges = self.conditional_edges
+            reducers = {}
+            if self.state_type is not None:
+                hints = typing.get_type_hints(self.state_type, include_extras=True)
+                reducers = {key: hint.__metadata__[0] for key, hint in hints.items() if hasattr(hint, "__metadata__")}
+
+            def apply(data, update):
+                for key, value in (update or {}).items():
+                    if key in reducers:
+                        data[key] = reducers[key](data.get(key), value)
+                    else:
+                        data[key] = value
+
+            def merge(data, update):
+                for key, value in (update or {}).items():
+                    if key not in reducers and isinstance(value, dict) and isinstance(data.get(key), dict):
+                        data[key] = {**data[key], **value}
+                    else:
+                        apply(data, {key: value})
+
+            def thread_of(config):
+                if checkpointer is None:
+                    return None
+                return ((config or {}).get("configurable") or {}).get("thread_id")
 
             class DummyGraph:
-                def invoke(self, state):
-                    current = entry
-                    data = dict(state)
+                def get_state(self, config):
+                    saved = checkpointer.storage.get(thread_of(config)) or {"values": {}, "next": None}
+                    next_nodes = (saved["next"],) if saved["next"] else ()
+                    return types.SimpleNamespace(values=dict(saved["values"]), next=next_nodes)
+
+                def invoke(self, state, config=None):
+                    thread_id = thread_of(config)
+                    saved = checkpointer.storage.get(thread_id) if thread_id else None
+                    data = dict(saved["values"]) if saved else {}
+                    if state is None:
+                        # Resume: continue from the node after the last checkpoint.
+                        current = saved["next"] if saved else None
+                    else:
+                        apply(data, state)
+                        current = entry
                     visited = set()
                     while current is not None:
                         visited.add(current)
                         update = nodes[current](data)
                         if update:
-                            data.update(update)
+                            apply(data, update)
                         if current == finish:
+                            current = None
                             break
-                        current = edges.get(current)
+                        if current in conditional_edges:
+                            targets = conditional_edges[current](data)
+                            if isinstance(targets, str):
+                                targets = [targets]
+                            if len(targets) > 1:
+                                # Parallel branches: run each on the same snapshot, then merge.
+                                snapshot = dict(data)
+                                for target in targets:
+                                    merge(data, nodes[target](dict(snapshot)))
+                                    visited.add(target)
+                                current = edges.get(targets[0])
+                            else:
+                                current = targets[0]
+                        else:
+                            current = edges.get(current)
                         if current in visited:
-                            break
+                            current = None
+                        if thread_id:
+                            checkpointer.storage[thread_id] = {"values": dict(data), "next": current}
+                    if thread_id:
+                        checkpointer.storage[thread_id] = {"values": dict(data), "next": None}
                     return data
 
             return DummyGraph()
 
     langgraph_graph_module.StateGraph = DummyStateGraph
+    langgraph_memory_module.MemorySaver = DummyMemorySaver
+    langgraph_checkpoint_module.memory = langgraph_memory_module
     langgraph_module.graph = langgraph_graph_module
+    langgraph_module.checkpoint = langgraph_checkpoint_module
     sys.modules["langgraph"] = langgraph_module
     sys.modules["langgraph.graph"] = langgraph_graph_module
+    sys.modules["langgraph.checkpoint"] = langgraph_checkpoint_module
+    sys.modules["langgraph.checkpoint.memory"] = langgraph_memory_module
+
+
+@pytest.fixture(autouse=True)
+def _reset_node_memo():
+    """Specialists are often faked per test; never serve one test's memoised result to another."""
+    from agent.memo import node_memo
+
+    node_memo.clear()
+    yield
 
 
 if "openai" not in sys.modules:
@@ -92,5 +177,8 @@ if "openai" not in sys.modules:
         def __init__(self, *_, **__):
             self.chat = DummyChat()
 
+        def with_options(self, **_):
+            return self
+
     openai_module.OpenAI = DummyOpenAI
     sys.modules["openai"] = openai_module
\ No newline at end of file
@@ -1,10 +1,23 @@
 import logging
 from datetime import timedelta
 from pathlib import Path
-from typing import Tuple
+from typing import Awaitable, Callable, Optional, Tuple
 
-from config import CALENDAR_DB_PATH, DEBUG, LOG_LEVEL, TASKS_FILE_PATH
+from config import (
+    CALENDAR_DB_PATH,
+    DEBUG,
+    LOG_LEVEL,
+    QUEUE_DB_PATH,
+    REMINDER_LEAD_MINUTES,
+    REMINDER_QUEUE_ENABLED,
+    TASKS_FILE_PATH,
+)
 from agent.graph import components
+from agent.usage import GROUP_FIELDS, format_summary, usage_ledger
+from agent.queue.bridge import QueueBridge
+from agent.queue.engine import AsyncTaskQueue
+from agent.queue.models import TaskStatus as QueueTaskStatus
+from agent.queue.reminders import REMINDER_KIND, cancel_reminder, schedule_event_reminder, schedule_task_reminder
 from graph_config import graph
 from memory import clear_history, get_history, save_message
 from tools import (
@@ -30,6 +43,48 @@ if DEBUG:
 
 calendar_client = CalendarClient(Path(CALENDAR_DB_PATH))
 task_manager = TaskManager(Path(TASKS_FILE_PATH))
+# 所有命令共用一个队列连接（首次使用时打开）
+reminder_queue = QueueBridge(Path(QUEUE_DB_PATH))
+
+
+def _queue_reminder(schedule: Callable[[AsyncTaskQueue], Awaitable[Optional[Tuple[int, bool]]]]) -> str:
+    """把提醒写入任务队列，由后台 worker 到点发送；返回附加在回复末尾的说明（未启用或失败时为空）。"""
+
+    if not REMINDER_QUEUE_ENABLED:
+        return ""
+    try:
+        scheduled = reminder_queue.call(schedule)
+    except Exception as exc:
+        logger.warning("提醒入队失败: %s", exc)
+        return ""
+    if scheduled is None:
+        return ""
+    _, created = scheduled
+    # 去重键命中已有提醒时不会新建，如实告知用户
+    return "，已设置提醒" if created else "，提醒已存在"
+
+
+async def _follow_reminders(queue: AsyncTaskQueue) -> None:
+    """订阅队列的完成事件，把 worker 发出的提醒显示给当前用户并写入本进程的对话历史。"""
+
+    async for task in queue.completions():
+        if task.payload.get("kind") != REMINDER_KIND or task.status is not QueueTaskStatus.COMPLETED:
+            continue
+        response = (task.result or {}).get("response")
+        if response:
+            print(f"\nBot: {response}\nYou: ", end="", flush=True)
+            save_message("bot", response)
+
+
+def _cancel_reminder(source: str, ref: int) -> None:
+    """任务完成或日程删除后撤销尚未发送的提醒。"""
+
+    if not REMINDER_QUEUE_ENABLED:
+        return
+    try:
+        reminder_queue.call(lambda queue: cancel_reminder(queue, source, ref))
+    except Exception as exc:
+        logger.warning("撤销提醒失败: %s", exc)
 
 
 def handle_user_input(user_input: str) -> Tuple[str, bool]:
@@ -134,7 +189,19 @@ def handle_user_input(user_input: str) -> Tuple[str, bool]:
             description=description,
         )
         event_id = calendar_client.add_event(event)
-        return f"已添加日程 (ID {event_id}): {format_event(event)}", True
+        lead = timedelta(minutes=REMINDER_LEAD_MINUTES)
+        suffix = _queue_reminder(lambda queue: schedule_event_reminder(queue, event, event_id=event_id, lead=lead))
+        return f"已添加日程 (ID {event_id}): {format_event(event)}{suffix}", True
+
+    if command_lower == "/unschedule":
+        try:
+            event_id = int(argument.strip())
+        except ValueError:
+            return "用法: /unschedule <日程ID>", True
+        if not calendar_client.delete_event(event_id):
+            return "未找到对应的日程 ID。", True
+        _cancel_reminder("calendar", event_id)
+        return f"已删除日程 {event_id}。", True
 
     if command_lower == "/agenda":
         days = 7
@@ -175,6 +242,9 @@ def handle_user_input(user_input: str) -> Tuple[str, bool]:
                 if task.due
                 else ""
             )
+            lead = timedelta(minutes=REMINDER_LEAD_MINUTES)
+            if task.due:
+                due_text += _queue_reminder(lambda queue: schedule_task_reminder(queue, task, lead=lead))
             return f"已添加任务 (ID {task.id}){due_text}。", True
         if sub == "done":
             task_id_raw = payload.strip()
@@ -188,6 +258,7 @@ def handle_user_input(user_input: str) -> Tuple[str, bool]:
             if not task:
                 return "未找到对应的任务 ID。", True
             if task.status == TaskStatus.COMPLETED:
+                _cancel_reminder("task", task_id)
                 return f"任务 {task_id} 已标记完成。", True
         return "未知的 /task 子命令，请使用 add 或 done。", True
 
@@ -240,6 +311,14 @@ def handle_user_input(user_input: str) -> Tuple[str, bool]:
             return f"未来 {days} 天没有需要提醒的任务或日程。", True
         return "\n".join(parts), True
 
+    if command_lower == "/usage":
+        options = argument.lower().split()
+        group_by = [name for name in options if name in GROUP_FIELDS] or list(GROUP_FIELDS)
+        recent = "recent" in options
+        rows = usage_ledger.summary(group_by=group_by, window=recent)
+        title = f"最近 {int(usage_ledger.window_seconds // 60)} 分钟模型用量:" if recent else "累计模型用量:"
+        return f"{title}\n{format_summary(rows)}", True
+
     save_message("user", user_input)
     result = graph.invoke({"input": user_input})
     response = result.get("response", "")
@@ -253,8 +332,11 @@ def main():
     print("=== LangGraph Agent ===")
     print("Type 'exit' or 'quit' to stop.")
     print(
-        "Commands: /summarize <text>, /search <query>, /plan <goal>, /research <query>, /report <body>, /schedule <title;start;end>, /agenda [days], /task <add/done>, /tasks [all], /remind [days], /history, /clear"
+        "Commands: /summarize <text>, /search <query>, /plan <goal>, /research <query>, /report <body>, /schedule <title;start;end>, /unschedule <id>, /agenda [days], /task <add/done>, /tasks [all], /remind [days], /usage [route|persona|model] [recent], /history, /clear"
     )
+    if REMINDER_QUEUE_ENABLED:
+        # 提醒由后台 worker 在另一个进程中生成，这里跟随队列结果显示
+        reminder_queue.spawn(_follow_reminders)
 
     while True:
         try:
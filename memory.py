@@ -21,6 +21,7 @@ except ImportError:  # pragma: no cover
 
     requests = _RequestsStub()  # type: ignore
 
+from agent.prompting import message_tokens
 from config import (
     HISTORY_BACKEND,
     HISTORY_CLOUD_FALLBACK_PATH,
@@ -41,7 +42,12 @@ def _normalize_entry(entry: Dict[str, str]) -> Dict[str, str]:
     role = entry.get("role", "")
     content = entry.get("content", "")
     timestamp = entry.get("timestamp") or _timestamp()
-    return {"role": role, "content": content, "timestamp": timestamp}
+    normalized = {"role": role, "content": content, "timestamp": timestamp}
+    if isinstance(entry.get("tokens"), int):
+        normalized["tokens"] = entry["tokens"]
+    # Cache the token count alongside the entry so prompt assembly never recounts it.
+    message_tokens(normalized)
+    return normalized
 
 
 class BaseHistoryStore(ABC):
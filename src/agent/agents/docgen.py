@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Sequence
+from typing import List, Sequence
 
 from agent.tools.io_utils import Table, export_table_to_csv, generate_pdf
 
@@ -16,6 +16,17 @@ class DocumentGenerationAgent:
         destination = self.output_directory / f"{title.replace(' ', '_').lower()}.pdf"
         return generate_pdf(body, destination)
 
+    def prune_reports(self, prefix: str, keep: int) -> List[Path]:
+        """Delete all but the ``keep`` newest ``<prefix>*.pdf`` reports; returns the deleted paths."""
+
+        reports = sorted(
+            self.output_directory.glob(f"{prefix}*.pdf"), key=lambda path: path.stat().st_mtime_ns, reverse=True
+        )
+        removed = reports[max(keep, 0):]
+        for path in removed:
+            path.unlink(missing_ok=True)
+        return removed
+
     def export_table(self, name: str, headers: Sequence[str], rows: Sequence[Sequence[str]]) -> Path:
         destination = self.output_directory / f"{name.replace(' ', '_').lower()}.csv"
         table = Table(headers=headers, rows=rows)
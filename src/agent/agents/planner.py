@@ -1,9 +1,15 @@
 """Planning agent that breaks requests into actionable steps."""
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from typing import List
 
+# Words that start a new stage: everything after them waits for the stage before.
+_SEQUENTIAL = re.compile(r"然后|接着|之后|随后|最后|\bthen\b|\bafterwards\b|\bfinally\b", re.IGNORECASE)
+# Separators between steps of the same stage, which may run side by side.
+_PARALLEL = re.compile(r"[.。;；\n]|同时|\balso\b", re.IGNORECASE)
+
 
 @dataclass
 class PlanStep:
@@ -13,12 +19,39 @@ class PlanStep:
 
 @dataclass
 class PlannerAgent:
+    """Splits a goal into steps.
+
+    By default every step depends on the one before it. With ``parallel``
+    set, steps are grouped into stages at sequencing words (然后, then, …);
+    steps within a stage are independent and each depends on every step of
+    the previous stage.
+    """
+
+    parallel: bool = False
+
     def run(self, goal: str) -> List[PlanStep]:
+        steps = self._staged(goal) if self.parallel else self._linear(goal)
+        if not steps:
+            steps.append(PlanStep(description=goal or "Clarify the request", depends_on=[]))
+        return steps
+
+    def _linear(self, goal: str) -> List[PlanStep]:
         chunks = [chunk.strip() for chunk in goal.replace("然后", ".").split(".") if chunk.strip()]
         steps: List[PlanStep] = []
         for index, chunk in enumerate(chunks, start=1):
             depends = [index - 1] if index > 1 else []
             steps.append(PlanStep(description=chunk, depends_on=depends))
-        if not steps:
-            steps.append(PlanStep(description=goal or "Clarify the request", depends_on=[]))
+        return steps
+
+    def _staged(self, goal: str) -> List[PlanStep]:
+        steps: List[PlanStep] = []
+        previous: List[int] = []
+        for stage in _SEQUENTIAL.split(goal):
+            chunks = [chunk.strip(" ,，、") for chunk in _PARALLEL.split(stage)]
+            current: List[int] = []
+            for chunk in chunks:
+                if chunk:
+                    steps.append(PlanStep(description=chunk, depends_on=list(previous)))
+                    current.append(len(steps))
+            previous = current or previous
         return steps
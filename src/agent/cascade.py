@@ -0,0 +1,137 @@
+"""Route-aware model selection and small-model-first cascading."""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from agent.personas.loader import Persona
+
+Judge = Callable[[Any], Optional[str]]
+
+DEFAULT_UNCERTAINTY_MARKERS = (
+    "我不确定",
+    "我不知道",
+    "无法回答",
+    "i'm not sure",
+    "i am not sure",
+    "i don't know",
+    "cannot answer",
+)
+
+
+class ModelSelector:
+    """Chooses the model for a request from persona and route configuration.
+
+    A persona-specific ``model`` wins, then the per-route mapping, then the
+    global default.
+    """
+
+    def __init__(self, route_models: Mapping[str, str], default_model: str) -> None:
+        self.route_models = dict(route_models)
+        self.default_model = default_model
+
+    def select(self, route: str, persona: Optional[Persona] = None) -> str:
+        if persona is not None and persona.model:
+            return persona.model
+        return self.route_models.get(route, self.default_model)
+
+
+@dataclass
+class CascadeResult:
+    completion: Any
+    model: str
+    tiers: List[Dict[str, Any]] = field(default_factory=list)
+
+    def as_metadata(self) -> Dict[str, Any]:
+        return {"model": self.model, "escalated": len(self.tiers) > 1, "tiers": list(self.tiers)}
+
+
+def completion_text(completion: Any) -> str:
+    try:
+        return (completion.choices[0].message.content or "").strip()
+    except (AttributeError, IndexError):
+        return ""
+
+
+class ResponseJudge:
+    """Default confidence check for small-model answers.
+
+    Returns the reason for escalating, or ``None`` when the answer is accepted.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_chars: int = 2,
+        markers: Sequence[str] = DEFAULT_UNCERTAINTY_MARKERS,
+    ) -> None:
+        self.min_chars = min_chars
+        self.markers = tuple(marker.lower() for marker in markers)
+
+    def __call__(self, completion: Any) -> Optional[str]:
+        text = completion_text(completion)
+        if len(text) < self.min_chars:
+            return "too_short"
+        finish_reason = getattr(completion.choices[0], "finish_reason", None)
+        if finish_reason == "length":
+            return "truncated"
+        lowered = text.lower()
+        if any(marker in lowered for marker in self.markers):
+            return "uncertain"
+        return None
+
+
+class ModelCascade:
+    """Tries a small model first and escalates to the target model on failure.
+
+    Prompts longer than ``max_prompt_tokens`` skip the small tier entirely,
+    since long contexts are where small models tend to fall over.
+    """
+
+    def __init__(
+        self,
+        small_model: str,
+        *,
+        max_prompt_tokens: int = 800,
+        judge: Judge | None = None,
+    ) -> None:
+        self.small_model = small_model
+        self.max_prompt_tokens = max_prompt_tokens
+        self.judge = judge or ResponseJudge()
+
+    def run(self, call: Callable[[str], Any], target_model: str, prompt_tokens: int) -> CascadeResult:
+        tiers: List[Dict[str, Any]] = []
+        if self.small_model and self.small_model != target_model and prompt_tokens <= self.max_prompt_tokens:
+            started = time.perf_counter()
+            reason: Optional[str]
+            try:
+                completion = call(self.small_model)
+                reason = self.judge(completion)
+            except Exception as exc:
+                completion, reason = None, f"error: {exc}"
+            tiers.append(_tier(self.small_model, started, reason))
+            if reason is None:
+                return CascadeResult(completion=completion, model=self.small_model, tiers=tiers)
+        started = time.perf_counter()
+        completion = call(target_model)
+        tiers.append(_tier(target_model, started, None))
+        return CascadeResult(completion=completion, model=target_model, tiers=tiers)
+
+
+def _tier(model: str, started: float, reason: Optional[str]) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        "accepted": reason is None,
+        "reason": reason,
+    }
+
+
+__all__ = [
+    "CascadeResult",
+    "ModelCascade",
+    "ModelSelector",
+    "ResponseJudge",
+    "completion_text",
+]
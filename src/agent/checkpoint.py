@@ -0,0 +1,35 @@
+"""Per-thread graph state persisted in a local SQLite checkpointer."""
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict
+
+try:  # pragma: no cover - optional dependency
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:  # pragma: no cover
+    SqliteSaver = None
+
+
+class CheckpointUnavailable(RuntimeError):
+    """The SQLite checkpointer package is not installed."""
+
+
+def open_sqlite_saver(path: Path) -> Any:
+    """Create a ``SqliteSaver`` storing every thread's checkpoints in ``path``."""
+
+    if SqliteSaver is None:
+        raise CheckpointUnavailable(
+            "使用图状态断点需要安装 langgraph-checkpoint-sqlite 包 (pip install langgraph-checkpoint-sqlite)。"
+        )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # The saver serialises access itself; the connection is shared by server threads.
+    connection = sqlite3.connect(str(path), check_same_thread=False)
+    return SqliteSaver(connection)
+
+
+def thread_config(thread_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+__all__ = ["CheckpointUnavailable", "SqliteSaver", "open_sqlite_saver", "thread_config"]
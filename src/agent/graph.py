@@ -1,7 +1,11 @@
 """Advanced LangGraph pipeline with routing and specialist agents."""
 from __future__ import annotations
 
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional
 
 from langgraph.graph import StateGraph
 
@@ -9,40 +13,164 @@ from agent.agents.docgen import DocumentGenerationAgent
 from agent.agents.planner import PlannerAgent
 from agent.agents.research import ResearchAgent
 from agent.agents.summarize import SummarizeAgent
+from agent.checkpoint import open_sqlite_saver, thread_config
 from agent.memory.vector import ProjectKnowledgeBase
-from agent.nodes import GraphComponents, build_executor_node, build_finalize_node, build_router_node
+from agent.nodes import (
+    BRANCH_ROUTES,
+    GraphComponents,
+    GraphState,
+    branch_node_name,
+    build_branch_node,
+    build_executor_node,
+    build_finalize_node,
+    build_join_node,
+    build_router_node,
+    select_branches,
+)
 from agent.personas.loader import PersonaRegistry
 from agent.routing import KnowledgeRouter
+from agent.singleflight import CoalescingGraph, SingleFlight
+from config import COALESCE_WAIT_TIMEOUT, FANOUT_MAX_ROUTES, GRAPH_CHECKPOINT_PATH, PLAN_PARALLEL
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 DATA_DIR = BASE_DIR / "data"
 OUTPUT_DIR = BASE_DIR / "outputs"
-OUTPUT_DIR.mkdir(exist_ok=True)
 
-registry = PersonaRegistry(BASE_DIR / "agent" / "personas" / "registry.yaml")
-registry.load()
 
-knowledge_base = ProjectKnowledgeBase(DATA_DIR / "kb")
-knowledge_base.load()
+# Heavy components are built on first use so that importing the graph (CLI
+# start-up, every worker process, every test module) stays cheap.
+@lru_cache(maxsize=None)
+def get_registry() -> PersonaRegistry:
+    persona_registry = PersonaRegistry(BASE_DIR / "agent" / "personas" / "registry.yaml")
+    persona_registry.load()
+    return persona_registry
+
+
+@lru_cache(maxsize=None)
+def get_knowledge_base() -> ProjectKnowledgeBase:
+    kb = ProjectKnowledgeBase(DATA_DIR / "kb")
+    kb.load()
+    return kb
+
+
+def _build_docgen() -> DocumentGenerationAgent:
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    return DocumentGenerationAgent(OUTPUT_DIR)
+
 
 components = GraphComponents(
-    router=KnowledgeRouter(registry),
-    summarise=SummarizeAgent(),
-    research=ResearchAgent(knowledge_base),
-    planner=PlannerAgent(),
-    docgen=DocumentGenerationAgent(OUTPUT_DIR),
+    factories={
+        "router": lambda: KnowledgeRouter(get_registry(), max_routes=FANOUT_MAX_ROUTES),
+        "summarise": SummarizeAgent,
+        "research": lambda: ResearchAgent(get_knowledge_base()),
+        "planner": lambda: PlannerAgent(parallel=PLAN_PARALLEL),
+        "docgen": _build_docgen,
+    }
 )
 
-builder = StateGraph(dict)
-builder.add_node("route", build_router_node(components))
-builder.add_node("execute", build_executor_node(components))
-builder.add_node("finalize", build_finalize_node())
 
-builder.set_entry_point("route")
-builder.add_edge("route", "execute")
-builder.add_edge("execute", "finalize")
-builder.set_finish_point("finalize")
+def build_graph(checkpointer: Any = None) -> Any:
+    builder = StateGraph(GraphState)
+    builder.add_node("route", build_router_node(components))
+    builder.add_node("execute", build_executor_node(components))
+    builder.add_node("join", build_join_node())
+    builder.add_node("finalize", build_finalize_node())
+    for route in BRANCH_ROUTES:
+        builder.add_node(branch_node_name(route), build_branch_node(components, route))
+        builder.add_edge(branch_node_name(route), "join")
+
+    builder.set_entry_point("route")
+    # A single route runs in "execute"; several routes fan out into parallel branches that meet in "join".
+    builder.add_conditional_edges(
+        "route",
+        select_branches,
+        ["execute", *(branch_node_name(route) for route in BRANCH_ROUTES)],
+    )
+    builder.add_edge("execute", "finalize")
+    builder.add_edge("join", "finalize")
+    builder.set_finish_point("finalize")
+    if checkpointer is None:
+        return builder.compile()
+    return builder.compile(checkpointer=checkpointer)
+
+
+graph = build_graph()
+# Shared entry point for servers and workers: identical concurrent inputs run once;
+# a follower stuck behind a slow leader runs the graph itself after COALESCE_WAIT_TIMEOUT.
+coalesced_graph = CoalescingGraph(graph, flight=SingleFlight(wait_timeout=COALESCE_WAIT_TIMEOUT))
+
+
+@lru_cache(maxsize=None)
+def get_checkpointed_graph() -> Any:
+    """Graph whose state is saved after every step, keyed by ``thread_id``."""
+
+    return build_graph(checkpointer=open_sqlite_saver(Path(GRAPH_CHECKPOINT_PATH)))
+
+
+# Two turns on one thread would both start from the same checkpoint and the
+# later write would drop the earlier turn, so turns on a thread run one at a
+# time. Entries are [lock, holders] and are dropped once nobody holds them.
+_thread_locks: Dict[str, List[Any]] = {}
+_thread_locks_guard = Lock()
+
+
+@contextmanager
+def _thread_turn(thread_id: str) -> Iterator[None]:
+    with _thread_locks_guard:
+        entry = _thread_locks.setdefault(thread_id, [Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _thread_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _thread_locks[thread_id]
+
+
+def run_thread(thread_id: str, user_input: str, *, compiled: Optional[Any] = None) -> Dict[str, Any]:
+    """Run one conversation turn on ``thread_id``, using that thread's own history.
+
+    Concurrent turns on the same thread (within this process) are serialised.
+    """
+
+    compiled = compiled or get_checkpointed_graph()
+    with _thread_turn(thread_id):
+        return compiled.invoke({"input": user_input, "thread_id": thread_id}, thread_config(thread_id))
+
+
+def resume_thread(thread_id: str, *, compiled: Optional[Any] = None) -> Dict[str, Any]:
+    """Finish an interrupted run from its last checkpoint without redoing completed steps."""
+
+    compiled = compiled or get_checkpointed_graph()
+    config = thread_config(thread_id)
+    with _thread_turn(thread_id):
+        snapshot = compiled.get_state(config)
+        if not snapshot.next:
+            return dict(snapshot.values)
+        return compiled.invoke(None, config)
+
+
+def __getattr__(name: str):
+    # ``registry`` and ``knowledge_base`` used to be eager module attributes; they
+    # stay reachable by name but are left out of __all__ so a star import does
+    # not build them.
+    if name == "registry":
+        return get_registry()
+    if name == "knowledge_base":
+        return get_knowledge_base()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-graph = builder.compile()
 
-__all__ = ["graph", "components", "knowledge_base", "registry"]
+__all__ = [
+    "build_graph",
+    "graph",
+    "coalesced_graph",
+    "components",
+    "get_checkpointed_graph",
+    "get_knowledge_base",
+    "get_registry",
+    "resume_thread",
+    "run_thread",
+]
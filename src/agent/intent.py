@@ -0,0 +1,198 @@
+"""Naive-Bayes intent classifier over hashed character n-grams."""
+from __future__ import annotations
+
+import json
+import logging
+import time
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:  # pragma: no cover - optional dependency
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIMENSIONS = 1 << 14
+DEFAULT_NGRAMS = (1, 3)
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("使用意图分类器需要安装 numpy 包 (pip install numpy)。")
+
+
+def feature_indices(text: str, dimensions: int, ngrams: Tuple[int, int] = DEFAULT_NGRAMS) -> List[int]:
+    """Hash every character n-gram of ``text`` into ``dimensions`` buckets.
+
+    Character n-grams work for Chinese and English alike without a tokenizer;
+    crc32 keeps the hashing stable across processes, unlike ``hash()``.
+    """
+
+    lowered = " ".join(text.lower().split())
+    low, high = ngrams
+    indices = []
+    for size in range(low, high + 1):
+        for start in range(len(lowered) - size + 1):
+            indices.append(zlib.crc32(lowered[start : start + size].encode("utf-8")) % dimensions)
+    return indices
+
+
+class IntentClassifier:
+    """Multinomial naive Bayes stored as two compact float32 arrays."""
+
+    def __init__(
+        self,
+        labels: Sequence[str],
+        log_prior: "np.ndarray",
+        feature_log_prob: "np.ndarray",
+        *,
+        ngrams: Tuple[int, int] = DEFAULT_NGRAMS,
+    ) -> None:
+        _require_numpy()
+        self.labels = list(labels)
+        self.log_prior = np.asarray(log_prior, dtype=np.float32)
+        self.feature_log_prob = np.asarray(feature_log_prob, dtype=np.float32)
+        self.ngrams = tuple(ngrams)
+
+    @property
+    def dimensions(self) -> int:
+        return int(self.feature_log_prob.shape[1])
+
+    @classmethod
+    def train(
+        cls,
+        examples: Iterable[Tuple[str, str]],
+        *,
+        dimensions: int = DEFAULT_DIMENSIONS,
+        alpha: float = 1.0,
+        ngrams: Tuple[int, int] = DEFAULT_NGRAMS,
+    ) -> "IntentClassifier":
+        _require_numpy()
+        labels: List[str] = []
+        label_index: Dict[str, int] = {}
+        rows: List[int] = []
+        columns: List[int] = []
+        doc_counts: List[int] = []
+        for text, label in examples:
+            if label not in label_index:
+                label_index[label] = len(labels)
+                labels.append(label)
+                doc_counts.append(0)
+            target = label_index[label]
+            doc_counts[target] += 1
+            features = feature_indices(text, dimensions, ngrams)
+            rows.extend([target] * len(features))
+            columns.extend(features)
+        if not labels:
+            raise ValueError("no training examples")
+        counts = np.zeros((len(labels), dimensions), dtype=np.float64)
+        np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)), 1.0)
+        smoothed = counts + alpha
+        feature_log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        priors = np.asarray(doc_counts, dtype=np.float64)
+        log_prior = np.log(priors / priors.sum())
+        return cls(labels, log_prior, feature_log_prob, ngrams=ngrams)
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        indices = np.asarray(feature_indices(text, self.dimensions, self.ngrams), dtype=np.intp)
+        # Gathering columns sums repeated n-grams too, without a dense count vector.
+        scores = self.log_prior + self.feature_log_prob[:, indices].sum(axis=1)
+        scores = np.exp(scores - scores.max())
+        probabilities = scores / scores.sum()
+        return {label: float(value) for label, value in zip(self.labels, probabilities)}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely label and its posterior probability."""
+
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.__getitem__)
+        return label, probabilities[label]
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as handle:
+            np.savez_compressed(
+                handle,
+                labels=np.asarray(self.labels),
+                log_prior=self.log_prior,
+                feature_log_prob=self.feature_log_prob,
+                ngrams=np.asarray(self.ngrams),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "IntentClassifier":
+        _require_numpy()
+        with np.load(path) as data:
+            return cls(
+                [str(label) for label in data["labels"]],
+                data["log_prior"],
+                data["feature_log_prob"],
+                ngrams=tuple(int(value) for value in data["ngrams"]),
+            )
+
+
+def load_intent_classifier(path: Path) -> Optional[IntentClassifier]:
+    """Load a trained model, or ``None`` when it (or numpy) is unavailable."""
+
+    if np is None or not path.exists():
+        return None
+    try:
+        return IntentClassifier.load(path)
+    except Exception as exc:
+        logger.warning("加载意图分类模型失败，将仅使用关键词路由: %s", exc)
+        return None
+
+
+class RoutingLog:
+    """Appends routing decisions to a JSONL file for later retraining."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = Lock()
+
+    def record(self, user_input: str, route: str, confidence: float, source: str) -> None:
+        line = json.dumps(
+            {"input": user_input, "route": route, "confidence": round(confidence, 4), "source": source, "ts": time.time()},
+            ensure_ascii=False,
+        )
+        try:
+            with self._lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as handle:
+                    handle.write(line + "\n")
+        except OSError as exc:  # pragma: no cover - logging must never break routing
+            logger.warning("写入路由日志失败: %s", exc)
+
+
+def read_examples(path: Path, *, sources: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, str]]:
+    """Yield ``(input, label)`` pairs from a labelled file or a routing log.
+
+    A ``label`` field (a human correction) wins over the logged ``route``.
+    With ``sources`` set, unlabelled log lines are only used when their
+    decision came from one of those sources (e.g. ``keyword``).
+    """
+
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            item: Dict[str, Any] = json.loads(line)
+            text = item.get("input")
+            label = item.get("label")
+            if label is None and (sources is None or item.get("source") in sources):
+                label = item.get("route")
+            if text and label:
+                yield str(text), str(label)
+
+
+__all__ = [
+    "IntentClassifier",
+    "RoutingLog",
+    "feature_indices",
+    "load_intent_classifier",
+    "read_examples",
+]
@@ -0,0 +1,448 @@
+"""Shared gateway for model calls with a global rate limiter and priority lanes."""
+from __future__ import annotations
+
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import BoundedSemaphore, Condition, Lock
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import config
+from agent.tracing import record_usage, tracer
+from agent.usage import usage_ledger
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_current_lane: ContextVar[str] = ContextVar("llm_lane", default=INTERACTIVE)
+_current_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+class LimiterTimeout(RuntimeError):
+    """Raised when a lane cannot obtain capacity in time."""
+
+
+class ModelUnavailable(RuntimeError):
+    """The model could not answer within its SLO; callers should degrade."""
+
+
+class ModelTimeout(ModelUnavailable):
+    """No attempt finished before the route's hard timeout."""
+
+
+class CircuitOpen(ModelUnavailable):
+    """The circuit breaker is open and the model is being skipped."""
+
+
+@contextmanager
+def use_lane(lane: str) -> Iterator[None]:
+    """Run model calls made inside the block on ``lane``."""
+
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane() -> str:
+    return _current_lane.get()
+
+
+@contextmanager
+def use_deadline(seconds: float) -> Iterator[None]:
+    """End model calls made inside the block within ``seconds``; an enclosing earlier deadline wins."""
+
+    deadline = time.monotonic() + seconds
+    outer = _current_deadline.get()
+    token = _current_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+class TokenBucket:
+    """Thread-safe token bucket where interactive waiters always go first.
+
+    Background callers only take a token when no interactive caller is
+    waiting, so bulk jobs cannot starve chat latency.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._interactive_waiting = 0
+        self._condition = Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, lane: str = INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        priority = lane == INTERACTIVE
+        with self._condition:
+            if priority:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    yielding = not priority and self._interactive_waiting > 0
+                    if self._tokens >= 1 and not yielding:
+                        self._tokens -= 1
+                        return True
+                    delay = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.01
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        delay = min(delay, remaining)
+                    self._condition.wait(max(delay, 0.001))
+            finally:
+                if priority:
+                    self._interactive_waiting -= 1
+                    self._condition.notify_all()
+
+
+class LaneLimiter:
+    """Per-lane concurrency caps in front of one shared token bucket."""
+
+    def __init__(self, concurrency: Dict[str, int], bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self._limits = dict(concurrency)
+        self._semaphores = {lane: BoundedSemaphore(max(1, limit)) for lane, limit in concurrency.items()}
+
+    def _semaphore(self, lane: str) -> BoundedSemaphore:
+        return self._semaphores.get(lane) or self._semaphores[INTERACTIVE]
+
+    def acquire(self, lane: str, timeout: Optional[float] = None) -> None:
+        """Take a concurrency slot and a rate token; pair with :meth:`release`."""
+
+        semaphore = self._semaphore(lane)
+        if not semaphore.acquire(timeout=timeout):
+            raise LimiterTimeout(f"no {lane} capacity available")
+        if not self.bucket.acquire(lane, timeout):
+            semaphore.release()
+            raise LimiterTimeout(f"rate limit exceeded on {lane} lane")
+
+    def try_acquire(self, lane: str) -> bool:
+        """Take capacity only if it is free right now."""
+
+        try:
+            self.acquire(lane, timeout=0)
+        except LimiterTimeout:
+            return False
+        return True
+
+    def release(self, lane: str) -> None:
+        self._semaphore(lane).release()
+
+    @contextmanager
+    def slot(self, lane: str, timeout: Optional[float] = None) -> Iterator[None]:
+        self.acquire(lane, timeout)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def limits(self) -> Dict[str, int]:
+        return dict(self._limits)
+
+
+limiter = LaneLimiter(
+    {INTERACTIVE: config.LLM_INTERACTIVE_CONCURRENCY, BACKGROUND: config.LLM_BACKGROUND_CONCURRENCY},
+    TokenBucket(config.LLM_RATE_LIMIT, config.LLM_RATE_BURST),
+)
+
+
+class LatencyTracker:
+    """Rolling per-route latency samples used to derive hedge thresholds."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = Lock()
+
+    def record(self, route: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, route: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(route, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def count(self, route: str) -> int:
+        with self._lock:
+            return len(self._samples.get(route, ()))
+
+
+class CircuitBreaker:
+    """Opens when the error rate inside a sliding time window spikes.
+
+    While open every call is rejected; after ``cooldown`` seconds a single
+    probe is let through and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, *, error_rate: float, min_calls: int, window: float, cooldown: float) -> None:
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def release_probe(self) -> None:
+        """Give up a probe that never reached the model; the next call may probe instead."""
+
+        with self._lock:
+            self._probing = False
+
+    def record(self, success: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                self._opened_at = None if success else now
+                self._outcomes.clear()
+                return
+            self._outcomes.append((now, success))
+            while self._outcomes and now - self._outcomes[0][0] > self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._opened_at = now
+                self._outcomes.clear()
+
+
+class HedgedCaller:
+    """Runs model calls under per-route latency budgets.
+
+    The first attempt gets until the route's p95 latency (or a configured
+    default before enough samples exist). If it is still running, a duplicate
+    attempt is sent and whichever succeeds first wins. Nothing is returned past
+    the hard timeout.
+
+    With a ``limiter``, capacity is taken before the clock starts, so local
+    queueing never counts as model latency or trips the breaker; a hedge is
+    only sent when a slot is free at once. ``fn`` receives the seconds left
+    until the hard timeout and should pass them to the client, so an abandoned
+    attempt ends (and releases its slot) by the deadline. The breaker records
+    model-side outcomes only: successes, errors raised by ``fn`` and timeouts.
+
+    Inside :func:`use_deadline` the limiter wait and the hard timeout are both
+    cut to what is left of the caller's deadline.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeouts: Dict[str, float],
+        default_timeout: float,
+        hedge_after: float,
+        min_samples: int,
+        hedging: bool = True,
+        breaker: CircuitBreaker | None = None,
+        max_workers: int = 32,
+    ) -> None:
+        self.timeouts = dict(timeouts)
+        self.default_timeout = default_timeout
+        self.hedge_after = hedge_after
+        self.min_samples = min_samples
+        self.hedging = hedging
+        self.breaker = breaker
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+        self._counters = {"calls": 0, "hedged": 0, "hedge_wins": 0, "timeouts": 0, "rejected": 0, "errors": 0}
+        self._lock = Lock()
+
+    def budget(self, route: str) -> Tuple[float, float]:
+        """Return ``(hedge_after, hard_timeout)`` for ``route`` in seconds."""
+
+        timeout = self.timeouts.get(route, self.default_timeout)
+        hedge_after = self.hedge_after
+        if self.latencies.count(route) >= self.min_samples:
+            hedge_after = self.latencies.percentile(route, 95) or hedge_after
+        return min(hedge_after, timeout), timeout
+
+    def call(
+        self,
+        route: str,
+        fn: Callable[[float], Any],
+        *,
+        lane: str = INTERACTIVE,
+        limiter: Optional["LaneLimiter"] = None,
+    ) -> Any:
+        self._bump("calls")
+        if self.breaker is not None and not self.breaker.allow():
+            self._bump("rejected")
+            raise CircuitOpen(f"model circuit open for route {route}")
+        hedge_after, timeout = self.budget(route)
+        deadline = _current_deadline.get()
+        try:
+            if limiter is not None:
+                limiter.acquire(lane, None if deadline is None else max(deadline - time.monotonic(), 0.0))
+            started = time.monotonic()
+            if deadline is not None and deadline - started < timeout:
+                timeout = deadline - started
+                hedge_after = min(hedge_after, timeout)
+                if timeout <= 0:
+                    if limiter is not None:
+                        limiter.release(lane)
+                    self._bump("timeouts")
+                    raise ModelTimeout(f"route {route} ran out of its caller's deadline")
+        except BaseException:
+            # Nothing was sent, so there is no model outcome to record; free a half-open probe.
+            if self.breaker is not None:
+                self.breaker.release_probe()
+            raise
+        futures: List[Future] = [self._submit(fn, timeout, lane, limiter)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done and self.hedging and (limiter is None or limiter.try_acquire(lane)):
+            futures.append(self._submit(fn, timeout - (time.monotonic() - started), lane, limiter))
+            self._bump("hedged")
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            remaining = timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.latencies.record(route, time.monotonic() - started)
+                    self._record(True)
+                    if future is not futures[0]:
+                        self._bump("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        self._record(False)
+        if pending:
+            self._bump("timeouts")
+            raise ModelTimeout(f"route {route} exceeded {timeout:.1f}s")
+        self._bump("errors")
+        raise error  # type: ignore[misc]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["breaker"] = self.breaker.state if self.breaker is not None else "disabled"
+        return counters
+
+    def _submit(
+        self, fn: Callable[[float], Any], remaining: float, lane: str, limiter: Optional["LaneLimiter"]
+    ) -> Future:
+        def attempt() -> Any:
+            try:
+                return fn(remaining)
+            finally:
+                if limiter is not None:
+                    limiter.release(lane)
+
+        # Copy the caller's context so the lane (and any tracing state) follows the attempt.
+        return self._executor.submit(contextvars.copy_context().run, attempt)
+
+    def _record(self, success: bool) -> None:
+        if self.breaker is not None:
+            self.breaker.record(success)
+
+    def _bump(self, key: str) -> None:
+        with self._lock:
+            self._counters[key] += 1
+
+
+hedged_caller = HedgedCaller(
+    timeouts=config.LLM_ROUTE_TIMEOUTS,
+    default_timeout=config.LLM_DEFAULT_TIMEOUT,
+    hedge_after=config.LLM_HEDGE_AFTER,
+    min_samples=config.LLM_HEDGE_MIN_SAMPLES,
+    hedging=config.LLM_HEDGING,
+    breaker=CircuitBreaker(
+        error_rate=config.LLM_BREAKER_ERROR_RATE,
+        min_calls=config.LLM_BREAKER_MIN_CALLS,
+        window=config.LLM_BREAKER_WINDOW,
+        cooldown=config.LLM_BREAKER_COOLDOWN,
+    ),
+)
+
+
+def chat_completion(*, lane: Optional[str] = None, route: Optional[str] = None, **request: Any) -> Any:
+    """Create a chat completion through the shared client and limiter.
+
+    With ``route`` set the call runs under that route's latency budget with
+    hedging and the circuit breaker, raising :class:`ModelUnavailable` when the
+    caller should fall back to a degraded answer. Every attempt that returns,
+    including a losing hedge, is billed to the usage ledger.
+    """
+
+    selected_lane = lane or current_lane()
+
+    def attempt(timeout: float) -> Any:
+        # The attempt's own deadline, without SDK retries, so an abandoned attempt stops by the hard timeout.
+        client = config.get_client().with_options(timeout=max(timeout, 0.001), max_retries=0)
+        completion = client.chat.completions.create(**request)
+        usage_ledger.record(request.get("model"), getattr(completion, "usage", None), route=route)
+        return completion
+
+    with tracer.span("llm.chat_completion", kind="llm", model=request.get("model"), lane=selected_lane, route=route):
+        if route is None:
+            with limiter.slot(selected_lane):
+                completion = config.get_client().chat.completions.create(**request)
+            usage_ledger.record(request.get("model"), getattr(completion, "usage", None), route=route)
+        else:
+            completion = hedged_caller.call(route, attempt, lane=selected_lane, limiter=limiter)
+        record_usage(getattr(completion, "usage", None))
+    return completion
+
+
+__all__ = [
+    "BACKGROUND",
+    "INTERACTIVE",
+    "CircuitBreaker",
+    "CircuitOpen",
+    "HedgedCaller",
+    "LaneLimiter",
+    "LatencyTracker",
+    "LimiterTimeout",
+    "ModelTimeout",
+    "ModelUnavailable",
+    "TokenBucket",
+    "chat_completion",
+    "current_lane",
+    "hedged_caller",
+    "limiter",
+    "use_deadline",
+    "use_lane",
+]
@@ -0,0 +1,73 @@
+"""Single-pass multi-keyword matching (Aho-Corasick)."""
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+
+class KeywordMatcher:
+    """Finds every occurrence of many keywords in one scan of the text.
+
+    Built once from ``(keyword, label)`` pairs; matching costs
+    O(len(text) + matches) no matter how many keywords there are. Keywords are
+    matched case-insensitively.
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, str]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for keyword, label in keywords:
+            self._insert(keyword.lower(), label)
+        self._link()
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def _insert(self, keyword: str, label: str) -> None:
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        if label not in self._output[state]:
+            self._output[state].append(label)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Inherit matches ending at the suffix state so a scan never walks fail links for output.
+                self._output[nxt].extend(label for label in self._output[self._fail[nxt]] if label not in self._output[nxt])
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """Yield ``(end_index, label)`` for every keyword occurrence."""
+
+        state = 0
+        goto, fail, output = self._goto, self._fail, self._output
+        for index, char in enumerate(text.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for label in output[state]:
+                yield index, label
+
+    def labels(self, text: str) -> Set[str]:
+        return {label for _, label in self.iter_matches(text)}
+
+
+__all__ = ["KeywordMatcher"]
@@ -0,0 +1,153 @@
+"""Memoisation of deterministic specialist results."""
+from __future__ import annotations
+
+import copy
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from agent.singleflight import SingleFlight, fingerprint
+from config import MEMO_DISK_MAX_ENTRIES, MEMO_MAX_ENTRIES, MEMO_PATH
+
+HIT = "hit"
+MISS = "miss"
+
+Validator = Callable[[Any], bool]
+
+
+def memo_key(route: str, user_input: str, generation: Any = None) -> str:
+    """Key for a specialist result: the route, its input and the data generation it read."""
+
+    return fingerprint(route, user_input, generation)
+
+
+class Memo:
+    """Bounded LRU of JSON-compatible results with optional SQLite persistence.
+
+    Lookups fall through to disk on an in-memory miss and promote what they
+    find. Concurrent misses for the same key compute the value once. Values are
+    deep-copied on the way in and out, so callers can never mutate a cached
+    entry.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        *,
+        path: Optional[Path] = None,
+        max_disk_entries: int = 10_000,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+        self._flight = SingleFlight()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "disk_hits": 0}
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(path), check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+
+    def get(self, key: Hashable, *, validate: Optional[Validator] = None) -> Optional[Any]:
+        with self._lock:
+            found = key in self._entries
+            value = self._entries.get(key)
+            if found:
+                self._entries.move_to_end(key)
+            else:
+                value = self._load(key)
+                found = value is not None
+                if found:
+                    self._counters["disk_hits"] += 1
+                    self._store(key, value)
+            if found and validate is not None and not validate(value):
+                self._entries.pop(key, None)
+                self._delete(key)
+                found = False
+            self._counters["hits" if found else "misses"] += 1
+            return copy.deepcopy(value) if found else None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store(key, value)
+            self._save(key, value)
+
+    def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Any],
+        *,
+        validate: Optional[Validator] = None,
+    ) -> Tuple[Any, str]:
+        """Return ``(value, "hit" | "miss")``, computing and storing on a miss."""
+
+        cached = self.get(key, validate=validate)
+        if cached is not None:
+            return cached, HIT
+
+        def fill() -> Any:
+            value = compute()
+            self.put(key, value)
+            return value
+
+        return self._flight.do(key, fill), MISS
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "size": len(self._entries)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM memo")
+                self._connection.commit()
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _load(self, key: Hashable) -> Optional[Any]:
+        if self._connection is None:
+            return None
+        row = self._connection.execute("SELECT value FROM memo WHERE key = ?", (str(key),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, key: Hashable, value: Any) -> None:
+        if self._connection is None:
+            return
+        self._connection.execute(
+            "INSERT OR REPLACE INTO memo (key, value, updated_at) VALUES (?, ?, ?)",
+            (str(key), json.dumps(value, ensure_ascii=False), time.time()),
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            # Keep the disk cache bounded too; the newest entries survive.
+            self._connection.execute(
+                "DELETE FROM memo WHERE key NOT IN (SELECT key FROM memo ORDER BY updated_at DESC LIMIT ?)",
+                (self.max_disk_entries,),
+            )
+        self._connection.commit()
+
+    def _delete(self, key: Hashable) -> None:
+        if self._connection is not None:
+            self._connection.execute("DELETE FROM memo WHERE key = ?", (str(key),))
+            self._connection.commit()
+
+
+node_memo = Memo(MEMO_MAX_ENTRIES, path=Path(MEMO_PATH) if MEMO_PATH else None, max_disk_entries=MEMO_DISK_MAX_ENTRIES)
+
+__all__ = ["HIT", "MISS", "Memo", "memo_key", "node_memo"]
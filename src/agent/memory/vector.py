@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import List, Sequence, Tuple
 
 from agent.tools.docs import Document, DocumentVectorStore, load_documents_from_directory
+from agent.tracing import traced
 from config import (
     KB_BACKEND,
     KB_CLOUD_FALLBACK_PATH,
@@ -48,5 +49,12 @@ class ProjectKnowledgeBase:
         else:
             self.store.add_documents(docs)
 
+    @property
+    def version(self) -> str:
+        """Index version used to key cached research results."""
+
+        return self.store.version
+
+    @traced("tool.kb_search")
     def search(self, query: str, k: int = 3) -> List[Tuple[Document, float]]:
         return self.store.similarity_search(query, k=k)
@@ -1,106 +1,494 @@
 """Reusable LangGraph nodes for the advanced agent."""
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, TypedDict
+import time
+from pathlib import Path
+from threading import RLock
+from typing import Annotated, Any, Callable, Dict, List, Optional, TypedDict
 
-from config import DEFAULT_MODEL, MAX_TOKENS, TEMPERATURE, client
+try:  # pragma: no cover - custom stream events need langgraph>=0.3
+    from langgraph.config import get_stream_writer
+except ImportError:  # pragma: no cover
+    get_stream_writer = None
+
+from config import (
+    AUTO_REPORT_LIMIT,
+    BRANCH_TIMEOUT,
+    BRANCH_TIMEOUTS,
+    CASCADE_ENABLED,
+    CASCADE_MAX_PROMPT_TOKENS,
+    CASCADE_MIN_RESPONSE_CHARS,
+    CASCADE_SMALL_MODEL,
+    COALESCE_REQUESTS,
+    DEFAULT_MODEL,
+    MAX_TOKENS,
+    MEMO_ENABLED,
+    MEMO_ROUTES,
+    PLAN_EXECUTE,
+    PLAN_MAX_WORKERS,
+    PLAN_PARALLEL,
+    PROMPT_HISTORY_LIMIT,
+    PROMPT_INPUT_BUDGET,
+    PROMPT_SUMMARISE_OVERFLOW,
+    PROMPT_SUMMARY_INPUT_BUDGET,
+    ROUTE_MODELS,
+    TEMPERATURE,
+)
 from memory import get_recent_history
+from tools import summarize_text_or_raise
 from agent.agents.docgen import DocumentGenerationAgent
-from agent.agents.planner import PlannerAgent
+from agent.agents.planner import PlannerAgent, PlanStep
 from agent.agents.research import ResearchAgent
 from agent.agents.summarize import SummarizeAgent
+from agent.cascade import ModelCascade, ModelSelector, ResponseJudge
+from agent.llm import ModelUnavailable, chat_completion, use_deadline
+from agent.memo import Validator, memo_key, node_memo
+from agent.plan_executor import OK, PlanExecutor, StepResult
+from agent.prompting import PromptBuilder, count_tokens, message_tokens
 from agent.routing import KnowledgeRouter
+from agent.singleflight import fingerprint, llm_flight
+from agent.tools.web import get_default_search
+from agent.tracing import annotate, tracer, traced_node
+from agent.usage import attribute_usage, merge_usage
+
+
+def merge_branches(current: Optional[Dict[str, Any]], update: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer for parallel branch results; ``None`` resets them for a new run."""
+
+    if update is None:
+        return {}
+    return {**(current or {}), **update}
+
+
+def append_history(current: Optional[List[Dict[str, Any]]], update: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Reducer for a thread's conversation turns, keeping the newest ``PROMPT_HISTORY_LIMIT``."""
+
+    if update is None:
+        return []
+    return [*(current or []), *update][-PROMPT_HISTORY_LIMIT:]
 
 
 class GraphState(TypedDict, total=False):
     input: str
+    thread_id: str
+    history: Annotated[List[Dict[str, Any]], append_history]
     route: str
+    routes: List[str]
+    branches: Annotated[Dict[str, Any], merge_branches]
+    plan_step: str
     persona_id: str
     persona_style: str
+    model: str
     response: str
     metadata: Dict[str, Any]
     artifacts: Dict[str, Any]
 
 
-@dataclass
 class GraphComponents:
+    """Specialists shared by the graph nodes.
+
+    Each field can be passed either as an instance or, through ``factories``,
+    as a zero-argument callable that is invoked the first time the field is
+    accessed. Lazy fields keep importing the graph cheap: the persona registry,
+    knowledge base and output directory are only touched by the requests that
+    need them.
+    """
+
+    FIELDS = ("router", "summarise", "research", "planner", "docgen", "models")
+
     router: KnowledgeRouter
     summarise: SummarizeAgent
     research: ResearchAgent
     planner: PlannerAgent
     docgen: DocumentGenerationAgent
+    models: ModelSelector
+
+    def __init__(
+        self,
+        *,
+        factories: Optional[Dict[str, Callable[[], Any]]] = None,
+        **instances: Any,
+    ) -> None:
+        unknown = (set(instances) | set(factories or {})) - set(self.FIELDS)
+        if unknown:
+            raise TypeError(f"unknown graph components: {sorted(unknown)}")
+        self._factories: Dict[str, Callable[[], Any]] = {
+            "models": lambda: ModelSelector(ROUTE_MODELS, DEFAULT_MODEL),
+            **(factories or {}),
+        }
+        self._lock = RLock()
+        for name, value in instances.items():
+            setattr(self, name, value)
+
+    def __getattr__(self, name: str) -> Any:
+        factories = self.__dict__.get("_factories", {})
+        if name not in factories:
+            raise AttributeError(name)
+        with self._lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = factories[name]()
+        return self.__dict__[name]
+
+    def initialised(self) -> List[str]:
+        return [name for name in self.FIELDS if name in self.__dict__]
+
+
+model_cascade = ModelCascade(
+    CASCADE_SMALL_MODEL,
+    max_prompt_tokens=CASCADE_MAX_PROMPT_TOKENS,
+    judge=ResponseJudge(min_chars=CASCADE_MIN_RESPONSE_CHARS),
+)
+
+
+BRANCH_ROUTES = ("summarise", "research", "plan", "docgen", "chat")
+ROUTE_LABELS = {"summarise": "摘要", "research": "调研", "plan": "规划", "docgen": "报告", "chat": "对话"}
 
 
 def build_router_node(components: GraphComponents):
-    def node(state: GraphState) -> GraphState:
-        decision = components.router.select(state["input"])
-        metadata = state.get("metadata", {})
-        metadata = {**metadata, "route_confidence": decision.confidence, "persona": decision.persona.id}
+    def route(state: GraphState) -> GraphState:
+        decisions = components.router.select_many(state["input"])
+        decision = decisions[0]
+        model = components.models.select(decision.route, decision.persona)
+        # Every run starts from fresh per-run fields; a checkpointed thread
+        # would otherwise carry the previous turn's metadata and artifacts.
+        metadata = {
+            "route_confidence": decision.confidence,
+            "persona": decision.persona.id,
+            "model": model,
+        }
         return {
-            **state,
             "route": decision.route,
+            "routes": [item.route for item in decisions],
+            "branches": None,
             "persona_id": decision.persona.id,
             "persona_style": decision.persona.style,
+            "model": model,
+            "response": "",
+            "artifacts": {},
             "metadata": metadata,
         }
 
-    return node
+    return traced_node("route", route, root=True)
+
+
+def build_prompt_builder(model: str = DEFAULT_MODEL) -> PromptBuilder:
+    return PromptBuilder(
+        PROMPT_INPUT_BUDGET,
+        model=model,
+        summariser=summarize_text_or_raise if PROMPT_SUMMARISE_OVERFLOW else None,
+        summary_input_budget=PROMPT_SUMMARY_INPUT_BUDGET,
+    )
+
+
+DEGRADED_RESPONSE = "模型暂时不可用，请稍后再试。"
+
+
+def _create_completion(route: str, request: Dict[str, Any]) -> Any:
+    return chat_completion(route=route, **request)
 
 
 def _call_chat_completion(state: GraphState) -> Dict[str, Any]:
-    history_messages = [
-        {"role": item["role"], "content": item["content"]} for item in get_recent_history()
-    ]
-    if not history_messages or history_messages[-1]["role"] != "user":
-        history_messages.append({"role": "user", "content": state["input"]})
-    messages = []
-    persona_style = state.get("persona_style")
-    if persona_style:
-        messages.append({"role": "system", "content": persona_style})
-    messages.extend(history_messages)
-    completion = client.chat.completions.create(
-        model=DEFAULT_MODEL,
-        messages=messages,
-        max_tokens=MAX_TOKENS,
-        temperature=TEMPERATURE,
+    route = state.get("route", "chat")
+    model = state.get("model") or DEFAULT_MODEL
+    # Checkpointed threads carry their own turns; plain runs use the global history store.
+    history = state.get("history", []) if state.get("thread_id") else get_recent_history(PROMPT_HISTORY_LIMIT)
+    plan = build_prompt_builder(model).build(
+        state["input"],
+        history,
+        system_prompt=state.get("persona_style"),
+        # A plan step's input is the step, not the user's turn at the end of the history.
+        input_in_history=state.get("plan_step") is None,
     )
+
+    def call(tier_model: str) -> Any:
+        request = {
+            "model": tier_model,
+            "messages": plan.messages,
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+        }
+        if COALESCE_REQUESTS:
+            key = fingerprint(route, request)
+            completion, shared = llm_flight.do_shared(key, _create_completion, route, request)
+            if shared:
+                annotate(cache="coalesced")
+            return completion
+        return _create_completion(route, request)
+
+    metadata = {**state.get("metadata", {}), "prompt": plan.as_metadata()}
+    try:
+        if CASCADE_ENABLED:
+            result = model_cascade.run(call, model, plan.tokens)
+            completion, model = result.completion, result.model
+            metadata["cascade"] = result.as_metadata()
+        else:
+            completion = call(model)
+    except ModelUnavailable as exc:
+        metadata["degraded"] = str(exc)
+        return {"response": DEGRADED_RESPONSE, "artifacts": {"model": None}, "metadata": metadata}
     content = completion.choices[0].message.content.strip()
-    return {"response": content, "artifacts": {"model": DEFAULT_MODEL}}
+    return {"response": content, "artifacts": {"model": model}, "metadata": metadata}
+
+
+def run_route(components: GraphComponents, route: str, state: GraphState) -> Dict[str, Any]:
+    """Execute one specialist (or the chat model) and return its partial update.
+
+    Model calls made inside are attributed to ``route`` and the active persona;
+    their token usage is returned under ``metadata["usage"]``. Deterministic
+    routes are memoised and report ``metadata["cache"] = {route: "hit" | "miss"}``.
+    """
+
+    cache_status: Optional[str] = None
+    with tracer.span(f"agent.{route}", kind="agent", route=route):
+        with attribute_usage(route=route, persona=state.get("persona_id")) as usage:
+            if _memoisable(route):
+                key = memo_key(route, state["input"], _memo_generation(components, route))
+                update, cache_status = node_memo.get_or_compute(
+                    key,
+                    lambda: _run_specialist(components, route, state),
+                    validate=_memo_validator(route),
+                )
+                annotate(cache=cache_status)
+            else:
+                update = _run_specialist(components, route, state)
+    extra: Dict[str, Any] = {}
+    if usage.records:
+        extra["usage"] = usage.as_metadata()
+    if cache_status is not None:
+        extra["cache"] = {route: cache_status}
+    if extra:
+        update["metadata"] = {**update.get("metadata", state.get("metadata", {})), **extra}
+    return update
+
+
+def _memoisable(route: str) -> bool:
+    # An executed plan includes model answers, which are not deterministic.
+    return MEMO_ENABLED and route in MEMO_ROUTES and not (route == "plan" and PLAN_EXECUTE)
+
+
+def _memo_generation(components: GraphComponents, route: str) -> Any:
+    """Version of the data a memoised route reads, so its cache entries expire with it."""
+
+    if route == "research":
+        knowledge_base = getattr(components.research, "knowledge_base", None)
+        return [getattr(knowledge_base, "version", None), get_default_search().version]
+    if route == "plan":
+        # Linear and staged plans differ for the same input.
+        return {"parallel": getattr(components.planner, "parallel", PLAN_PARALLEL)}
+    return None
+
+
+def _memo_validator(route: str) -> Optional[Validator]:
+    if route == "docgen":
+        # A cached report is only useful while the file it points to still exists.
+        return lambda update: Path(update["artifacts"]["report_path"]).exists()
+    return None
+
+
+def _run_specialist(components: GraphComponents, route: str, state: GraphState) -> Dict[str, Any]:
+    if route == "summarise":
+        summary = components.summarise.run(state["input"])
+        return {"response": summary, "artifacts": {"summary": summary}}
+    if route == "research":
+        results = components.research.run(state["input"])
+        formatted = "\n".join(
+            f"- ({item['score']:.2f}) {item['snippet']} [{item['source']}]" for item in results
+        )
+        return {"response": formatted or "未找到相关资料。", "artifacts": {"results": results}}
+    if route == "plan":
+        steps = components.planner.run(state["input"])
+        if PLAN_EXECUTE:
+            return _execute_plan(components, state, steps)
+        formatted = "\n".join(
+            f"步骤 {idx}. {step.description}" + (f" (依赖 {step.depends_on})" if step.depends_on else "")
+            for idx, step in enumerate(steps, start=1)
+        )
+        return {"response": formatted, "artifacts": {"plan": [step.__dict__ for step in steps]}}
+    if route == "docgen":
+        # Name reports after their input so a memoised path always holds the matching report;
+        # a pruned report fails the memo validator and is generated again.
+        report_path = components.docgen.create_report(f"auto_report_{fingerprint(state['input'])[:12]}", state["input"])
+        components.docgen.prune_reports("auto_report_", AUTO_REPORT_LIMIT)
+        return {"response": f"生成报告: {report_path}", "artifacts": {"report_path": str(report_path)}}
+    return _call_chat_completion({**state, "route": route})
+
+
+# Routes a plan step may be dispatched to; "plan" itself is excluded so plans never nest.
+PLAN_STEP_ROUTES = ("summarise", "research", "docgen", "chat")
+# Routes that receive the outputs of a step's dependencies along with its description.
+_PLAN_CONTEXT_ROUTES = ("summarise", "docgen", "chat")
+
+
+def build_plan_dispatch(components: GraphComponents, state: GraphState):
+    """Dispatch each plan step to the specialist its description routes to."""
+
+    def dispatch(step: PlanStep, upstream: List[StepResult]) -> Dict[str, Any]:
+        route = components.router.select(step.description).route
+        if route not in PLAN_STEP_ROUTES:
+            route = "chat"
+        text = step.description
+        if upstream and route in _PLAN_CONTEXT_ROUTES:
+            context = "\n".join(f"步骤 {item.index} 结果：{item.response}" for item in upstream)
+            text = f"{context}\n\n{step.description}"
+        update = run_route(components, route, {**state, "input": text, "route": route, "plan_step": step.description})
+        return {**update, "route": route}
+
+    return dispatch
+
+
+def _stream_writer() -> Optional[Callable[[Any], None]]:
+    """LangGraph's custom stream writer for the running node, or ``None`` outside a streamed run."""
+
+    if get_stream_writer is None:
+        return None
+    try:
+        return get_stream_writer()
+    except RuntimeError:  # not inside a graph run
+        return None
+
+
+def _execute_plan(components: GraphComponents, state: GraphState, steps: List[PlanStep]) -> Dict[str, Any]:
+    executor = PlanExecutor(build_plan_dispatch(components, state), max_workers=PLAN_MAX_WORKERS)
+    writer = _stream_writer()
+    results = []
+    # Each step is published (``stream_mode="custom"``) the moment it finishes, not when the plan does.
+    for result in executor.stream(steps):
+        results.append(result)
+        if writer is not None:
+            writer({"plan_step": dict(result.__dict__)})
+    results.sort(key=lambda result: result.index)
+    sections = []
+    for result in results:
+        header = f"步骤 {result.index}. {result.description}"
+        if result.status == OK:
+            sections.append(f"{header} [{ROUTE_LABELS.get(result.route, result.route)}]\n{result.response}")
+        else:
+            sections.append(f"{header} ({result.status}: {result.error})")
+    metadata = dict(state.get("metadata", {}))
+    usage = merge_usage(*(result.usage for result in results if result.usage))
+    if usage["calls"]:
+        metadata["usage"] = usage
+    return {
+        "response": "\n\n".join(sections),
+        "artifacts": {
+            "plan": [step.__dict__ for step in steps],
+            "plan_results": [result.__dict__ for result in results],
+        },
+        "metadata": metadata,
+    }
 
 
 def build_executor_node(components: GraphComponents):
-    def node(state: GraphState) -> GraphState:
-        route = state.get("route", "chat")
-        if route == "summarise":
-            summary = components.summarise.run(state["input"])
-            return {**state, "response": summary, "artifacts": {"summary": summary}}
-        if route == "research":
-            results = components.research.run(state["input"])
-            formatted = "\n".join(
-                f"- ({item['score']:.2f}) {item['snippet']} [{item['source']}]" for item in results
-            )
-            return {**state, "response": formatted or "未找到相关资料。", "artifacts": {"results": results}}
-        if route == "plan":
-            steps = components.planner.run(state["input"])
-            formatted = "\n".join(
-                f"步骤 {idx}. {step.description}" + (f" (依赖 {step.depends_on})" if step.depends_on else "")
-                for idx, step in enumerate(steps, start=1)
-            )
-            return {**state, "response": formatted, "artifacts": {"plan": [step.__dict__ for step in steps]}}
-        if route == "docgen":
-            report_path = components.docgen.create_report("auto_report", state["input"])
-            return {**state, "response": f"生成报告: {report_path}", "artifacts": {"report_path": str(report_path)}}
-        return {**state, **_call_chat_completion(state)}
-
-    return node
+    def execute(state: GraphState) -> GraphState:
+        return run_route(components, state.get("route", "chat"), state)
+
+    return traced_node("execute", execute)
+
+
+def select_branches(state: GraphState) -> str | List[str]:
+    """Conditional edge: one route runs in ``execute``, several fan out in parallel."""
+
+    routes = [route for route in state.get("routes", []) if route in BRANCH_ROUTES]
+    if len(routes) <= 1:
+        return "execute"
+    return [branch_node_name(route) for route in routes]
+
+
+def branch_node_name(route: str) -> str:
+    return f"branch_{route}"
+
+
+def build_branch_node(components: GraphComponents, route: str):
+    """Run ``route`` as one parallel branch, dropping it when it exceeds its timeout.
+
+    LangGraph already runs the branches of a step concurrently, so the branch
+    works on the graph's own thread. The timeout is a deadline on the model
+    calls made inside it (see :func:`agent.llm.use_deadline`), so a slow
+    branch stops instead of running on in the background; a branch that still
+    finishes late is dropped.
+    """
+
+    timeout = BRANCH_TIMEOUTS.get(route, BRANCH_TIMEOUT)
+
+    def branch(state: GraphState) -> GraphState:
+        started = time.perf_counter()
+        try:
+            with use_deadline(timeout):
+                update = run_route(components, route, state)
+        except Exception as exc:
+            outcome: Dict[str, Any] = {"status": "dropped", "reason": str(exc)}
+        else:
+            degraded = update.get("metadata", {}).get("degraded")
+            if degraded or time.perf_counter() - started > timeout:
+                outcome = {"status": "dropped", "reason": degraded or f"timeout after {timeout:.1f}s"}
+            else:
+                # Branches never write ``metadata``; keep only usage and cache status for the join.
+                metadata = update.pop("metadata", {})
+                outcome = {"status": "ok", **update}
+                for key in ("usage", "cache"):
+                    if key in metadata:
+                        outcome[key] = metadata[key]
+        outcome["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {"branches": {route: outcome}}
+
+    return traced_node(branch_node_name(route), branch)
+
+
+def build_join_node():
+    """Merge parallel branch outputs into one response, artifacts and metadata."""
+
+    def join(state: GraphState) -> GraphState:
+        branches = state.get("branches") or {}
+        routes = [route for route in state.get("routes", []) if route in branches]
+        sections: List[str] = []
+        artifacts: Dict[str, Any] = {}
+        summary: Dict[str, Any] = {}
+        trace: List[Dict[str, Any]] = list(state.get("metadata", {}).get("trace", []))
+        for route in routes:
+            outcome = branches[route]
+            trace.extend(outcome.get("trace", []))
+            summary[route] = {
+                key: outcome[key] for key in ("status", "latency_ms", "reason") if key in outcome
+            }
+            if outcome.get("status") != "ok":
+                continue
+            label = ROUTE_LABELS.get(route, route)
+            sections.append(f"【{label}】\n{outcome.get('response', '')}")
+            artifacts.update(outcome.get("artifacts", {}))
+        dropped = [route for route, item in summary.items() if item.get("status") != "ok"]
+        if dropped:
+            artifacts["dropped_routes"] = dropped
+        metadata = {**state.get("metadata", {}), "branches": summary}
+        usages = [branches[route].get("usage") for route in routes if branches[route].get("usage")]
+        if usages:
+            metadata["usage"] = merge_usage(*usages)
+        cache = {key: value for route in routes for key, value in branches[route].get("cache", {}).items()}
+        if cache:
+            metadata["cache"] = cache
+        if trace:
+            metadata["trace"] = trace
+        response = "\n\n".join(sections) or "所有子任务均未能按时完成，请稍后重试。"
+        return {"response": response, "artifacts": artifacts, "metadata": metadata}
+
+    return traced_node("join", join)
 
 
 def build_finalize_node():
-    def node(state: GraphState) -> GraphState:
+    def finalize(state: GraphState) -> GraphState:
         response = state.get("response", "")
-        metadata = state.get("metadata", {})
-        metadata.setdefault("tokens", len(response))
-        return {**state, "response": response, "metadata": metadata}
+        metadata = dict(state.get("metadata", {}))
+        usage = metadata.get("usage")
+        if usage:
+            metadata["tokens"] = usage["total_tokens"]
+        else:
+            # No model call reported usage (e.g. a knowledge-base lookup): estimate the reply.
+            metadata["tokens"] = count_tokens(response, state.get("model") or DEFAULT_MODEL)
+        update: Dict[str, Any] = {"response": response, "metadata": metadata}
+        if state.get("thread_id"):
+            turns = [{"role": "user", "content": state["input"]}, {"role": "assistant", "content": response}]
+            for turn in turns:
+                message_tokens(turn)
+            update["history"] = turns
+        return update
 
-    return node
+    return traced_node("finalize", finalize)
@@ -12,6 +12,7 @@ class Persona:
     name: str
     description: str
     style: str
+    model: Optional[str] = None
 
 
 class PersonaRegistry:
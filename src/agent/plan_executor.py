@@ -0,0 +1,155 @@
+"""Execute a plan's steps as a dependency graph on a bounded thread pool."""
+from __future__ import annotations
+
+import contextvars
+import heapq
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from agent.agents.planner import PlanStep
+
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class StepResult:
+    index: int
+    description: str
+    status: str
+    route: Optional[str] = None
+    response: str = ""
+    artifacts: Dict[str, Any] = field(default_factory=dict)
+    usage: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    latency_ms: float = 0.0
+
+
+# ``dispatch(step, upstream)`` runs one step given the results it depends on and
+# returns a node-style update (``response``, ``artifacts``, ``route``, ``metadata``).
+# An update whose ``metadata["degraded"]`` is set (the model fallback reply)
+# counts as a failed step.
+Dispatch = Callable[[PlanStep, List[StepResult]], Dict[str, Any]]
+
+
+def topological_order(steps: Sequence[PlanStep]) -> List[int]:
+    """1-based step indices with every step after its dependencies.
+
+    Raises ``ValueError`` for unknown dependencies or cycles. Among steps that
+    are ready at the same time the lower index comes first.
+    """
+
+    count = len(steps)
+    waiting: Dict[int, int] = {}
+    dependents: Dict[int, List[int]] = {index: [] for index in range(1, count + 1)}
+    for index, step in enumerate(steps, start=1):
+        depends = set(step.depends_on)
+        unknown = [dep for dep in depends if dep not in dependents or dep == index]
+        if unknown:
+            raise ValueError(f"step {index} has invalid dependencies: {sorted(unknown)}")
+        waiting[index] = len(depends)
+        for dep in depends:
+            dependents[dep].append(index)
+    ready = [index for index, pending in waiting.items() if not pending]
+    heapq.heapify(ready)
+    order: List[int] = []
+    while ready:
+        index = heapq.heappop(ready)
+        order.append(index)
+        for child in dependents[index]:
+            waiting[child] -= 1
+            if not waiting[child]:
+                heapq.heappush(ready, child)
+    if len(order) != count:
+        raise ValueError("plan dependencies contain a cycle")
+    return order
+
+
+class PlanExecutor:
+    """Runs independent steps concurrently, each as soon as its dependencies finish.
+
+    ``stream`` yields every :class:`StepResult` the moment it is known; steps
+    whose dependencies failed are reported as skipped without being run.
+    """
+
+    def __init__(self, dispatch: Dispatch, *, max_workers: int = 4) -> None:
+        self.dispatch = dispatch
+        self.max_workers = max(1, max_workers)
+
+    def run(self, steps: Sequence[PlanStep]) -> List[StepResult]:
+        return sorted(self.stream(steps), key=lambda result: result.index)
+
+    def stream(self, steps: Sequence[PlanStep]) -> Iterator[StepResult]:
+        order = topological_order(steps)
+        position = {index: rank for rank, index in enumerate(order)}
+        waiting = {index: len(set(steps[index - 1].depends_on)) for index in order}
+        dependents: Dict[int, List[int]] = {index: [] for index in order}
+        for index in order:
+            for dep in set(steps[index - 1].depends_on):
+                dependents[dep].append(index)
+
+        results: Dict[int, StepResult] = {}
+        ready = [(position[index], index) for index in order if not waiting[index]]
+        heapq.heapify(ready)
+        running: Dict[Future, int] = {}
+
+        def finish(result: StepResult) -> None:
+            results[result.index] = result
+            for child in dependents[result.index]:
+                waiting[child] -= 1
+                if not waiting[child]:
+                    heapq.heappush(ready, (position[child], child))
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plan-step")
+        try:
+            while ready or running:
+                while ready and len(running) < self.max_workers:
+                    _, index = heapq.heappop(ready)
+                    step = steps[index - 1]
+                    upstream = [results[dep] for dep in step.depends_on]
+                    blocked = [item.index for item in upstream if item.status != OK]
+                    if blocked:
+                        skipped = StepResult(index, step.description, SKIPPED, error=f"依赖的步骤 {blocked} 未成功")
+                        finish(skipped)
+                        yield skipped
+                        continue
+                    # Each step gets a copy of the caller's context (lane, usage attribution, trace).
+                    future = pool.submit(contextvars.copy_context().run, self._run_step, index, step, upstream)
+                    running[future] = index
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda item: position[running[item]]):
+                    running.pop(future)
+                    result = future.result()
+                    finish(result)
+                    yield result
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_step(self, index: int, step: PlanStep, upstream: List[StepResult]) -> StepResult:
+        started = time.perf_counter()
+        try:
+            update = self.dispatch(step, upstream)
+            metadata = update.get("metadata", {})
+            degraded = metadata.get("degraded")
+            result = StepResult(
+                index,
+                step.description,
+                FAILED if degraded else OK,
+                route=update.get("route"),
+                response=update.get("response", ""),
+                artifacts=update.get("artifacts", {}),
+                usage=metadata.get("usage"),
+                error=degraded,
+            )
+        except Exception as exc:
+            result = StepResult(index, step.description, FAILED, error=str(exc))
+        result.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+
+__all__ = ["Dispatch", "FAILED", "OK", "PlanExecutor", "SKIPPED", "StepResult", "topological_order"]
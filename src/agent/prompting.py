@@ -0,0 +1,213 @@
+"""Token counting and budgeted prompt assembly for chat completions."""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:  # pragma: no cover - optional dependency guard
+    import tiktoken
+except ImportError:  # pragma: no cover
+    tiktoken = None  # type: ignore
+
+
+Summariser = Callable[[str], str]
+
+# Chat formats wrap every message with a few control tokens (role, separators).
+MESSAGE_OVERHEAD = 4
+# Completions are primed with the assistant role header.
+REPLY_OVERHEAD = 3
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z\d_]+")
+_SYMBOL_RE = re.compile(r"[^\sA-Za-z\d_\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except Exception:  # pragma: no cover - unknown model or missing encoding files
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+
+def _estimate_tokens(text: str) -> int:
+    """Offline approximation used when ``tiktoken`` is unavailable.
+
+    CJK characters are roughly one token each, latin words about one token per
+    four characters, and punctuation one token per symbol.
+    """
+
+    cjk = len(_CJK_RE.findall(text))
+    words = sum(max(1, (len(word) + 3) // 4) for word in _WORD_RE.findall(text))
+    symbols = len(_SYMBOL_RE.findall(text))
+    return cjk + words + symbols
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return _estimate_tokens(text)
+
+
+def message_tokens(entry: Dict[str, object], model: Optional[str] = None) -> int:
+    """Return the token cost of a history entry, caching it on the entry itself."""
+
+    cached = entry.get("tokens")
+    if isinstance(cached, int):
+        return cached
+    tokens = count_tokens(str(entry.get("content", "")), model) + MESSAGE_OVERHEAD
+    entry["tokens"] = tokens
+    return tokens
+
+
+@dataclass
+class PromptPlan:
+    messages: List[Dict[str, str]]
+    tokens: int
+    budget: int
+    dropped: int = 0
+    summarised: bool = False
+
+    def as_metadata(self) -> Dict[str, object]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "dropped": self.dropped,
+            "summarised": self.summarised,
+            "messages": len(self.messages),
+        }
+
+
+@lru_cache(maxsize=128)
+def _cached_summary(summariser: Summariser, transcript: str) -> str:
+    # Exceptions are not cached, so a failed summary is retried on the next turn.
+    return (summariser(transcript) or "").strip()
+
+
+class PromptBuilder:
+    """Packs the persona prompt and the newest history into a token budget.
+
+    The current user turn and the persona prompt are always kept; older turns
+    are added newest-first until the budget is exhausted. Turns that do not fit
+    are dropped, or collapsed into a single summary message when a summariser
+    is configured and the summary itself fits.
+
+    The summariser sees at most ``summary_input_budget`` tokens of the newest
+    overflow, its results are cached per transcript, and it must raise on
+    failure: a failed summary falls back to dropping the overflow.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        *,
+        model: Optional[str] = None,
+        summariser: Summariser | None = None,
+        summary_input_budget: int = 2000,
+    ) -> None:
+        if budget <= 0:
+            raise ValueError("budget must be positive")
+        self.budget = budget
+        self.model = model
+        self.summariser = summariser
+        self.summary_input_budget = summary_input_budget
+
+    def build(
+        self,
+        user_input: str,
+        history: Sequence[Dict[str, object]],
+        *,
+        system_prompt: Optional[str] = None,
+        input_in_history: bool = True,
+    ) -> PromptPlan:
+        """Assemble the prompt for ``user_input``.
+
+        By default a trailing user entry in ``history`` is taken to be this turn
+        (callers save the message before building). With ``input_in_history``
+        false, ``user_input`` is always the current turn and the whole history
+        is context, as for a plan step run inside a larger request.
+        """
+
+        turns = [entry for entry in history if entry.get("content")]
+        if input_in_history and turns and turns[-1].get("role") == "user":
+            current = turns.pop()
+        else:
+            current = {"role": "user", "content": user_input}
+
+        used = REPLY_OVERHEAD + message_tokens(current, self.model)
+        system_messages: List[Dict[str, str]] = []
+        if system_prompt:
+            system_messages.append({"role": "system", "content": system_prompt})
+            used += count_tokens(system_prompt, self.model) + MESSAGE_OVERHEAD
+
+        kept: List[Dict[str, object]] = []
+        index = len(turns)
+        while index > 0:
+            cost = message_tokens(turns[index - 1], self.model)
+            if used + cost > self.budget:
+                break
+            used += cost
+            kept.append(turns[index - 1])
+            index -= 1
+        kept.reverse()
+        overflow = turns[:index]
+
+        summarised = False
+        if overflow and self.summariser is not None:
+            summary_message = self._summarise(overflow, self.budget - used)
+            if summary_message is not None:
+                system_messages.append(summary_message)
+                used += count_tokens(summary_message["content"], self.model) + MESSAGE_OVERHEAD
+                summarised = True
+
+        messages = system_messages + [_to_message(entry) for entry in kept] + [_to_message(current)]
+        return PromptPlan(
+            messages=messages,
+            tokens=used,
+            budget=self.budget,
+            dropped=len(overflow),
+            summarised=summarised,
+        )
+
+    def _summarise(self, overflow: Sequence[Dict[str, object]], remaining: int) -> Optional[Dict[str, str]]:
+        if remaining <= MESSAGE_OVERHEAD:
+            return None
+        lines: List[str] = []
+        spent = 0
+        for entry in reversed(overflow):
+            cost = message_tokens(entry, self.model)
+            if spent + cost > self.summary_input_budget:
+                break
+            spent += cost
+            lines.append(f"{entry.get('role')}: {entry.get('content')}")
+        if not lines:
+            return None
+        transcript = "\n".join(reversed(lines))
+        try:
+            summary = _cached_summary(self.summariser, transcript)  # type: ignore[arg-type]
+        except Exception:  # summarising is best effort
+            return None
+        content = f"Earlier conversation summary:\n{summary}"
+        if not summary or count_tokens(content, self.model) + MESSAGE_OVERHEAD > remaining:
+            return None
+        return {"role": "system", "content": content}
+
+
+def _to_message(entry: Dict[str, object]) -> Dict[str, str]:
+    role = str(entry.get("role", "user"))
+    if role not in {"system", "user", "assistant"}:
+        role = "assistant"
+    return {"role": role, "content": str(entry.get("content", ""))}
+
+
+__all__ = ["PromptBuilder", "PromptPlan", "count_tokens", "message_tokens"]
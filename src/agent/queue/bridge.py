@@ -0,0 +1,48 @@
+"""Blocking access to one shared :class:`AsyncTaskQueue` from synchronous code."""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from agent.queue.engine import AsyncTaskQueue
+
+T = TypeVar("T")
+
+
+class QueueBridge:
+    """Runs the async task queue on its own event loop thread for threaded or CLI callers.
+
+    The loop, database thread and notifiers are created on the first call and
+    reused by every later one.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = db_path
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[AsyncTaskQueue] = None
+        self._lock = threading.Lock()
+
+    def call(self, operation: Callable[[AsyncTaskQueue], Awaitable[T]]) -> T:
+        """Run ``operation(queue)`` on the queue loop and block the calling thread for the result."""
+
+        return self.spawn(operation).result()
+
+    def spawn(self, operation: Callable[[AsyncTaskQueue], Awaitable[T]]) -> "Future[T]":
+        """Start ``operation(queue)`` on the queue loop without waiting, e.g. a long-lived subscriber."""
+
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="task-queue", daemon=True).start()
+                self._queue = AsyncTaskQueue(self.db_path)
+
+        async def _run() -> T:
+            return await operation(self._queue)
+
+        return asyncio.run_coroutine_threadsafe(_run(), self._loop)
+
+
+__all__ = ["QueueBridge"]
@@ -0,0 +1,179 @@
+"""Run the queue's SQLite work on a dedicated thread behind awaitable calls.
+
+One thread owns the connection and executes every statement, so coroutines
+never wait on SQLite locks or on fsync. Writes are pipelined: jobs that
+arrive while a transaction is committing are gathered into the next one,
+each inside its own ``SAVEPOINT`` (a failing job only undoes itself), and
+the whole group shares a single ``BEGIN IMMEDIATE ... COMMIT``. Futures are
+resolved on their event loop with ``call_soon_threadsafe`` once the group
+has committed, so a write is durable before its caller resumes. Reads run
+outside the group transaction and only ever see committed data.
+"""
+from __future__ import annotations
+
+import asyncio
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Job:
+    __slots__ = ("op", "write", "loop", "future")
+
+    def __init__(self, op: Callable[[], Any], write: bool, loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> None:
+        self.op = op
+        self.write = write
+        self.loop = loop
+        self.future = future
+
+
+def _settle(future: asyncio.Future, result: Any, error: Optional[BaseException]) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class DatabaseThread:
+    """Serialises operations on ``connection`` (opened with ``isolation_level=None``) on one thread."""
+
+    def __init__(self, connection: sqlite3.Connection, *, max_batch: int = 64, name: str = "queue-db") -> None:
+        self._connection = connection
+        self.max_batch = max(1, max_batch)
+        self.commits = 0
+        self._jobs: "queue.SimpleQueue[Optional[_Job]]" = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._serve, name=name, daemon=True)
+        self._thread.start()
+
+    def read(self, op: Callable[[], T]) -> "asyncio.Future[T]":
+        """Run ``op`` on the database thread; it sees all writes submitted before it."""
+
+        return self._submit(op, write=False)
+
+    def write(self, op: Callable[[], T]) -> "asyncio.Future[T]":
+        """Run ``op`` inside the next group transaction; resolves after the commit."""
+
+        return self._submit(op, write=True)
+
+    def _submit(self, op: Callable[[], Any], *, write: bool) -> asyncio.Future:
+        if self._closed:
+            raise RuntimeError("队列数据库已关闭")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put(_Job(op, write, loop, future))
+        return future
+
+    async def close(self) -> None:
+        """Finish the submitted jobs, then close the connection."""
+
+        if self._closed:
+            return
+        self._closed = True
+        self._jobs.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+
+    def _serve(self) -> None:
+        stopping = False
+        while not stopping:
+            job = self._jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            # Whatever queued up during the previous commit joins this group.
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            try:
+                self._run_batch(batch)
+            except Exception as exc:  # the thread must outlive any one group, or every later call hangs
+                self._abandon(batch, exc)
+        self._connection.close()
+
+    def _abandon(self, batch: List[_Job], error: BaseException) -> None:
+        if self._connection.in_transaction:
+            try:
+                self._connection.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+        for job in batch:
+            try:
+                job.loop.call_soon_threadsafe(_settle, job.future, None, error)
+            except RuntimeError:  # the caller's loop has already closed
+                pass
+
+    def _run_batch(self, batch: List[_Job]) -> None:
+        outcomes: Dict[int, Tuple[Any, Optional[BaseException]]] = {}
+        writes = [position for position, job in enumerate(batch) if job.write]
+        first_write = writes[0] if writes else len(batch)
+        # Reads never run inside the group transaction, so they cannot return rows
+        # a failed COMMIT rolls back: those queued before the first write run now,
+        # the rest once the group has committed (they still see every earlier write).
+        for position in range(first_write):
+            outcomes[position] = self._call(batch[position])
+        if writes:
+            outcomes.update(self._commit_group([(position, batch[position]) for position in writes]))
+        for position in range(first_write, len(batch)):
+            if not batch[position].write:
+                outcomes[position] = self._call(batch[position])
+        for position, job in enumerate(batch):
+            result, error = outcomes[position]
+            try:
+                job.loop.call_soon_threadsafe(_settle, job.future, result, error)
+            except RuntimeError:  # the caller's loop has already closed
+                pass
+
+    def _commit_group(self, jobs: List[Tuple[int, _Job]]) -> Dict[int, Tuple[Any, Optional[BaseException]]]:
+        try:
+            self._connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as exc:  # e.g. still locked by another process after busy_timeout
+            # Every write in the group fails with it; the next group tries again.
+            return {position: (None, exc) for position, _ in jobs}
+        outcomes: Dict[int, Tuple[Any, Optional[BaseException]]] = {}
+        try:
+            for position, job in jobs:
+                try:
+                    self._connection.execute("SAVEPOINT job")
+                except sqlite3.Error as exc:
+                    # Nothing of this job ran; fail it alone and carry on with the group.
+                    outcomes[position] = (None, exc)
+                    continue
+                outcome = self._call(job)
+                if outcome[1] is not None:
+                    self._connection.execute("ROLLBACK TO job")
+                self._connection.execute("RELEASE job")
+                outcomes[position] = outcome
+        except sqlite3.Error as exc:
+            # A job can no longer be undone on its own, so the whole group is rolled back.
+            if self._connection.in_transaction:
+                self._connection.execute("ROLLBACK")
+            return {position: (None, exc) for position, _ in jobs}
+        try:
+            self._connection.execute("COMMIT")
+            self.commits += 1
+        except sqlite3.Error as exc:
+            if self._connection.in_transaction:
+                self._connection.execute("ROLLBACK")
+            return {position: (None, exc) for position, _ in jobs}
+        return outcomes
+
+    @staticmethod
+    def _call(job: _Job) -> Tuple[Any, Optional[BaseException]]:
+        try:
+            return job.op(), None
+        except Exception as exc:
+            return None, exc
+
+
+__all__ = ["DatabaseThread"]
@@ -1,27 +1,184 @@
-"""Asynchronous task queue implemented with SQLite."""
+"""Asynchronous task queue implemented with SQLite.
+
+The database runs in WAL mode so readers never block the writer, and a task
+is claimed with a single ``UPDATE ... RETURNING`` statement: SQLite executes
+it under its write lock, so any number of worker processes can drain the
+same file without two of them claiming one task.
+
+A claim is a lease: it expires ``lease_seconds`` after the last heartbeat
+(:meth:`AsyncTaskQueue.touch`). The claimed task's ``attempts`` value
+identifies the lease; ``complete``, ``fail`` and ``touch`` given that value
+only act while the same claim is still current, so a worker whose lease was
+reaped and re-claimed elsewhere cannot overwrite the new run. :meth:`AsyncTaskQueue.reap_expired` returns
+tasks whose worker died to the queue, with exponential backoff, and moves
+them to ``dead_letter`` once they have used up ``max_attempts``.
+
+Tasks carry a priority and an optional tenant. A claim takes the highest
+priority level that has due work and, within it, the tenant that has
+received the least service relative to its weight (start-time fair
+queueing over the ``tenant_usage`` table), so one bulk producer cannot
+starve others.
+
+Every task has a ``run_at`` (its creation time unless delayed); claims
+only consider due tasks through an index on it, and ``next_due_in`` tells a
+worker exactly how long it may sleep. Recurring work lives in the
+``schedules`` table and is turned into tasks by ``tick_schedules``.
+
+All SQLite work runs on a :class:`~.dbthread.DatabaseThread`: the event loop
+never blocks on a statement or a commit, and writes submitted together are
+group-committed in one transaction.
+
+A task may carry a ``dedup_key`` (unique while set): re-submitting the key
+returns the existing task instead of inserting a row, as long as that task
+is unfinished or was created within ``dedup_window`` seconds.
+
+Enqueueing wakes idle consumers through :class:`~.notify.QueueNotifier`, so
+``wait_for_work`` returns within milliseconds of new work arriving. Finishing
+a task (completed, failed or dead-lettered) stamps ``finished_at`` and is
+announced on a second channel; one watcher per queue then reads the newly
+finished rows and resolves :meth:`AsyncTaskQueue.wait` futures and
+:meth:`AsyncTaskQueue.completions` subscribers, so clients never poll.
+"""
 from __future__ import annotations
 
 import asyncio
 import json
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from config import (
+    QUEUE_BUSY_TIMEOUT,
+    QUEUE_DEDUP_WINDOW,
+    QUEUE_LEASE_SECONDS,
+    QUEUE_MAX_ATTEMPTS,
+    QUEUE_NOTIFY,
+    QUEUE_POLL_MAX,
+    QUEUE_POLL_MIN,
+    QUEUE_RETRY_BACKOFF,
+    QUEUE_RETRY_BACKOFF_MAX,
+    QUEUE_WRITE_BATCH,
+)
+
+from .dbthread import DatabaseThread
+from .models import Task, TaskPriority, TaskStatus
+from .notify import IdleBackoff, QueueNotifier
+
+# Columns added after the first release, created on open for older databases.
+_MIGRATIONS = {
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "lease_expires_at": "TEXT",
+    "run_at": "TEXT",
+    "priority": f"INTEGER NOT NULL DEFAULT {int(TaskPriority.NORMAL)}",
+    "tenant": "TEXT NOT NULL DEFAULT ''",
+    "started_at": "TEXT",
+    "finished_at": "TEXT",
+    "dedup_key": "TEXT",
+}
+
+
+# How far the completion watcher looks back for rows committed after later ones (seconds).
+_COMPLETION_GRACE_SECONDS = 5.0
+
+
+# Least-served tenant with a due task at one priority level, and that task.
+# The recursive CTE walks the distinct tenants with pending work at the level
+# by index seeks on idx_tasks_due_pick (a loose index scan), so the cost
+# follows the tenants waiting now, not every tenant tenant_usage has seen.
+_PICK_TENANT_SQL = """
+    WITH RECURSIVE waiting(tenant) AS (
+        SELECT MIN(tenant) FROM tasks WHERE status = :status AND priority = :priority
+        UNION ALL
+        SELECT (
+            SELECT MIN(tenant) FROM tasks WHERE status = :status AND priority = :priority AND tenant > waiting.tenant
+        ) FROM waiting WHERE waiting.tenant IS NOT NULL
+    )
+    SELECT u.tenant, u.served, (
+        SELECT t.id FROM tasks t
+        WHERE t.status = :status AND t.priority = :priority AND t.tenant = waiting.tenant AND t.run_at <= :now
+        ORDER BY t.run_at ASC, t.id ASC LIMIT 1
+    ) AS task_id
+    FROM waiting JOIN tenant_usage u ON u.tenant = waiting.tenant
+    WHERE task_id IS NOT NULL
+    ORDER BY u.served ASC, u.tenant ASC LIMIT 1
+"""
+
+
+def _timestamp(moment: Optional[datetime] = None) -> str:
+    # Fixed-width ISO timestamps compare correctly as text inside SQLite.
+    return (moment or datetime.utcnow()).isoformat(timespec="microseconds")
+
 
-from .models import Task, TaskStatus
+def _row_to_task(row: sqlite3.Row) -> Task:
+    return Task(
+        id=row["id"],
+        payload=json.loads(row["payload"]),
+        status=TaskStatus(row["status"]),
+        created_at=datetime.fromisoformat(row["created_at"]),
+        updated_at=datetime.fromisoformat(row["updated_at"]),
+        result=json.loads(row["result"]) if row["result"] else None,
+        error=row["error"],
+        attempts=row["attempts"],
+        priority=row["priority"],
+        tenant=row["tenant"],
+        finished_at=datetime.fromisoformat(row["finished_at"]) if row["finished_at"] else None,
+        dedup_key=row["dedup_key"],
+    )
+
+
+def _as_utc(moment: datetime) -> datetime:
+    """Naive UTC, the queue's time base; aware datetimes are converted, naive ones are taken as UTC."""
+
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
 
 
 class AsyncTaskQueue:
-    def __init__(self, db_path: Path) -> None:
+    def __init__(
+        self,
+        db_path: Path,
+        *,
+        busy_timeout: float = QUEUE_BUSY_TIMEOUT,
+        notify: bool = QUEUE_NOTIFY,
+        lease_seconds: float = QUEUE_LEASE_SECONDS,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        retry_backoff: float = QUEUE_RETRY_BACKOFF,
+        retry_backoff_max: float = QUEUE_RETRY_BACKOFF_MAX,
+        write_batch: int = QUEUE_WRITE_BATCH,
+        dedup_window: float = QUEUE_DEDUP_WINDOW,
+    ) -> None:
         self.db_path = db_path
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        self._connection = sqlite3.connect(self.db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.dedup_window = dedup_window
+        # Transactions are managed explicitly by the database thread.
+        self._connection = sqlite3.connect(
+            self.db_path, timeout=busy_timeout, isolation_level=None, check_same_thread=False
+        )
         self._connection.row_factory = sqlite3.Row
+        self._configure()
         self._ensure_schema()
-        self._lock = asyncio.Lock()
+        self._db = DatabaseThread(self._connection, max_batch=write_batch)
+        self._notifier = QueueNotifier(db_path) if notify else None
+        self._done_notifier = QueueNotifier(db_path, channel="done") if notify else None
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _configure(self) -> None:
+        # WAL lets workers read while another process writes; NORMAL sync is
+        # durable across application crashes in WAL mode and avoids an fsync per commit.
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
 
     def _ensure_schema(self) -> None:
         cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS tasks (
@@ -35,82 +192,714 @@ class AsyncTaskQueue:
             )
             """
         )
-        self._connection.commit()
-
-    async def enqueue(self, payload: dict) -> int:
-        async with self._lock:
-            cursor = self._connection.cursor()
-            now = datetime.utcnow().isoformat()
-            cursor.execute(
-                "INSERT INTO tasks (payload, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
-                (json.dumps(payload), TaskStatus.PENDING.value, now, now),
+        columns = {row["name"] for row in cursor.execute("PRAGMA table_info(tasks)")}
+        for name, definition in _MIGRATIONS.items():
+            if name not in columns:
+                cursor.execute(f"ALTER TABLE tasks ADD COLUMN {name} {definition}")
+        # Serves the claim query (oldest pending task) and the status counts.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at)")
+        # Lets the reaper find expired leases without scanning finished tasks.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_lease ON tasks (status, lease_expires_at)")
+        # Tasks claimed before leases existed have none; expire them now so the reaper recovers them.
+        cursor.execute(
+            "UPDATE tasks SET lease_expires_at = ? WHERE status = ? AND lease_expires_at IS NULL",
+            (_timestamp(), TaskStatus.IN_PROGRESS.value),
+        )
+        # Tasks written before run_at existed are due from their creation time.
+        cursor.execute("UPDATE tasks SET run_at = created_at WHERE run_at IS NULL AND status = ?", (TaskStatus.PENDING.value,))
+        # Claim path: top pending priority level, then each tenant's earliest due task within it.
+        cursor.execute("DROP INDEX IF EXISTS idx_tasks_pick")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_due_pick ON tasks (status, priority, tenant, run_at)")
+        # One live task per deduplication key; expired keys are cleared, not kept in the index.
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_dedup ON tasks (dedup_key) WHERE dedup_key IS NOT NULL")
+        # Completion watcher: rows finished since its cursor.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks (finished_at)")
+        # Earliest due time, for next_due_in.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_run_at ON tasks (status, run_at)")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schedules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                interval_seconds REAL NOT NULL,
+                next_run_at TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 5,
+                tenant TEXT NOT NULL DEFAULT '',
+                last_task_id INTEGER
+            )
+            """
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedules_next_run ON schedules (next_run_at)")
+        # Virtual service received per tenant (advanced by 1/weight per claim) and the queue's virtual clock.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tenant_usage (
+                tenant TEXT PRIMARY KEY,
+                weight REAL NOT NULL DEFAULT 1.0,
+                served REAL NOT NULL DEFAULT 0.0
             )
-            self._connection.commit()
-            return int(cursor.lastrowid)
+            """
+        )
+        cursor.execute("CREATE TABLE IF NOT EXISTS queue_clock (id INTEGER PRIMARY KEY CHECK (id = 0), virtual_time REAL NOT NULL)")
+        cursor.execute("INSERT OR IGNORE INTO queue_clock (id, virtual_time) VALUES (0, 0.0)")
+        cursor.execute("INSERT OR IGNORE INTO tenant_usage (tenant) SELECT DISTINCT tenant FROM tasks WHERE status = ?", (TaskStatus.PENDING.value,))
+        cursor.execute("COMMIT")
+
+    def _lease_expiry(self, now: datetime) -> str:
+        return _timestamp(now + timedelta(seconds=self.lease_seconds))
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(self.retry_backoff * 2 ** max(0, attempts - 1), self.retry_backoff_max)
+
+    async def enqueue(
+        self,
+        payload: dict,
+        *,
+        priority: int = TaskPriority.NORMAL,
+        tenant: Optional[str] = None,
+        run_at: Optional[datetime] = None,
+        dedup_key: Optional[str] = None,
+    ) -> int:
+        """Add a task; with ``run_at`` it is not handed to workers before that moment.
+
+        With ``dedup_key`` a duplicate submission returns the existing task's id
+        (see :meth:`enqueue_or_get`).
+        """
+
+        if dedup_key is not None:
+            task, _ = await self.enqueue_or_get(
+                payload, dedup_key=dedup_key, priority=priority, tenant=tenant, run_at=run_at
+            )
+            return int(task.id)
+        (task_id,) = await self.enqueue_many([payload], priority=priority, tenant=tenant, run_at=run_at)
+        return task_id
+
+    async def enqueue_or_get(
+        self,
+        payload: dict,
+        *,
+        dedup_key: str,
+        priority: int = TaskPriority.NORMAL,
+        tenant: Optional[str] = None,
+        run_at: Optional[datetime] = None,
+    ) -> Tuple[Task, bool]:
+        """Enqueue once per ``dedup_key``; returns the task and whether it was created.
+
+        A task already holding the key is returned as is (with its current or
+        final result) while it is unfinished or younger than ``dedup_window``;
+        after that the key is released and a new task is created.
+        """
+
+        tenant = tenant or ""
+
+        def _op() -> Tuple[sqlite3.Row, bool]:
+            now = datetime.utcnow()
+            stamp = _timestamp(now)
+            # The lookup and insert share one write transaction, so concurrent submitters cannot both insert.
+            existing = self._connection.execute("SELECT * FROM tasks WHERE dedup_key = ?", (dedup_key,)).fetchone()
+            if existing is not None:
+                fresh = existing["created_at"] >= _timestamp(now - timedelta(seconds=self.dedup_window))
+                if fresh or not TaskStatus(existing["status"]).is_final:
+                    return existing, False
+                self._connection.execute("UPDATE tasks SET dedup_key = NULL WHERE id = ?", (existing["id"],))
+            due = _timestamp(_as_utc(run_at)) if run_at is not None else stamp
+            task_id = self._insert_task(payload, priority, tenant, due, stamp, dedup_key=dedup_key)
+            self._activate_tenant(tenant)
+            return self._connection.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone(), True
+
+        row, created = await self._db.write(_op)
+        if created:
+            self._notify()
+        return _row_to_task(row), created
+
+    async def enqueue_many(
+        self,
+        payloads: Iterable[dict],
+        *,
+        priority: int = TaskPriority.NORMAL,
+        tenant: Optional[str] = None,
+        run_at: Optional[datetime] = None,
+    ) -> List[int]:
+        """Insert several tasks in one transaction (one commit for the whole batch)."""
+
+        tenant = tenant or ""
+        payloads = list(payloads)
+
+        def _op() -> List[int]:
+            now = _timestamp()
+            due = _timestamp(_as_utc(run_at)) if run_at is not None else now
+            ids = [self._insert_task(payload, priority, tenant, due, now) for payload in payloads]
+            if ids:
+                self._activate_tenant(tenant)
+            return ids
+
+        ids = await self._db.write(_op)
+        if ids:
+            self._notify()
+        return ids
+
+    def _insert_task(
+        self, payload: dict, priority: int, tenant: str, run_at: str, now: str, *, dedup_key: Optional[str] = None
+    ) -> int:
+        cursor = self._connection.execute(
+            """
+            INSERT INTO tasks (payload, status, created_at, updated_at, priority, tenant, run_at, dedup_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (json.dumps(payload), TaskStatus.PENDING.value, now, now, int(priority), tenant, run_at, dedup_key),
+        )
+        return int(cursor.lastrowid)
+
+    def _activate_tenant(self, tenant: str) -> None:
+        # A tenant returning from idle starts at the current virtual time instead of
+        # cashing in service it never used.
+        self._connection.execute(
+            """
+            INSERT INTO tenant_usage (tenant, served) VALUES (?, (SELECT virtual_time FROM queue_clock))
+            ON CONFLICT (tenant) DO UPDATE SET served = MAX(served, excluded.served)
+            """,
+            (tenant,),
+        )
+
+    async def set_tenant_weight(self, tenant: str, weight: float) -> None:
+        """Give ``tenant`` a larger (or smaller) share of the workers; the default weight is 1."""
+
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        await self._db.write(
+            lambda: self._connection.execute(
+                """
+                INSERT INTO tenant_usage (tenant, weight, served) VALUES (?, ?, (SELECT virtual_time FROM queue_clock))
+                ON CONFLICT (tenant) DO UPDATE SET weight = excluded.weight
+                """,
+                (tenant, weight),
+            )
+        )
+
+    def _notify(self) -> None:
+        if self._notifier is not None:
+            self._notifier.notify()
+
+    async def wait_for_work(self, timeout: float) -> bool:
+        """Sleep until a task is enqueued (here or in another process) or ``timeout`` passes.
+
+        Returns ``True`` when woken by a notification; callers re-poll either way.
+        """
+
+        if self._notifier is None:
+            await asyncio.sleep(timeout)
+            return False
+        return await self._notifier.wait(timeout)
 
     async def acquire(self) -> Optional[Task]:
-        async with self._lock:
-            cursor = self._connection.cursor()
-            cursor.execute(
-                "SELECT * FROM tasks WHERE status = ? ORDER BY created_at ASC LIMIT 1",
-                (TaskStatus.PENDING.value,),
+        tasks = await self.acquire_batch(1)
+        return tasks[0] if tasks else None
+
+    async def acquire_batch(self, limit: int) -> List[Task]:
+        """Atomically lease up to ``limit`` due tasks in priority and fair-share order."""
+
+        if limit < 1:
+            return []
+
+        def _op() -> List[sqlite3.Row]:
+            now = datetime.utcnow()
+            stamp, expiry = _timestamp(now), self._lease_expiry(now)
+            rows = []
+            for _ in range(limit):
+                picked = self._pick(stamp)
+                if picked is None:
+                    break
+                rows.append(
+                    self._connection.execute(
+                        """
+                        UPDATE tasks SET status = ?, updated_at = ?, started_at = ?, lease_expires_at = ?,
+                            attempts = attempts + 1
+                        WHERE id = ?
+                        RETURNING *
+                        """,
+                        (TaskStatus.IN_PROGRESS.value, stamp, stamp, expiry, picked["task_id"]),
+                    ).fetchone()
+                )
+                self._connection.execute(
+                    "UPDATE tenant_usage SET served = served + 1.0 / weight WHERE tenant = ?", (picked["tenant"],)
+                )
+                self._connection.execute("UPDATE queue_clock SET virtual_time = ? WHERE id = 0", (picked["served"],))
+            return rows
+
+        # Write jobs run under BEGIN IMMEDIATE, so picking and claiming are one atomic step across processes.
+        rows = await self._db.write(_op)
+        return [_row_to_task(row) for row in rows]
+
+    def _pick(self, now: str) -> Optional[sqlite3.Row]:
+        """Next task to claim: highest due priority level, then the least-served tenant in it."""
+
+        priority: Optional[int] = None
+        while True:
+            # Each step is an index seek to the next lower pending priority level.
+            level = self._connection.execute(
+                "SELECT priority FROM tasks WHERE status = ?"
+                + (" AND priority < ?" if priority is not None else "")
+                + " ORDER BY priority DESC LIMIT 1",
+                (TaskStatus.PENDING.value,) + ((priority,) if priority is not None else ()),
+            ).fetchone()
+            if level is None:
+                return None
+            priority = level["priority"]
+            picked = self._connection.execute(
+                _PICK_TENANT_SQL, {"status": TaskStatus.PENDING.value, "priority": priority, "now": now}
+            ).fetchone()
+            if picked is not None:
+                return picked
+
+    async def complete(self, task_id: int, result: dict, *, attempt: Optional[int] = None) -> bool:
+        """Complete a running task; ``False`` when its lease (``attempt``) is no longer held."""
+
+        leases = {task_id: attempt} if attempt is not None else None
+        return bool(await self.complete_many([(task_id, result)], attempts=leases))
+
+    async def complete_many(
+        self, results: Iterable[Tuple[int, dict]], *, attempts: Optional[Dict[int, int]] = None
+    ) -> List[int]:
+        """Mark several running tasks completed with one commit; returns the ids that were updated.
+
+        ``attempts`` maps task ids to the claim's ``attempts`` value; a task
+        re-claimed (or finished) since then is left alone.
+        """
+
+        attempts = attempts or {}
+        results = [(task_id, json.dumps(result), attempts.get(task_id)) for task_id, result in results]
+
+        def _op() -> List[int]:
+            # Stamped inside the write transaction so finished_at follows commit order across processes.
+            now = _timestamp()
+            completed = []
+            for task_id, result, attempt in results:
+                cursor = self._connection.execute(
+                    """
+                    UPDATE tasks SET status = ?, result = ?, updated_at = ?, finished_at = ?, lease_expires_at = NULL
+                    WHERE id = ? AND status = ? AND (? IS NULL OR attempts = ?)
+                    """,
+                    (TaskStatus.COMPLETED.value, result, now, now, task_id, TaskStatus.IN_PROGRESS.value, attempt, attempt),
+                )
+                if cursor.rowcount:
+                    completed.append(task_id)
+            return completed
+
+        completed = await self._db.write(_op)
+        if completed:
+            self._notify_done()
+        return completed
+
+    async def fail(
+        self, task_id: int, error: str, *, retry: bool = False, attempt: Optional[int] = None
+    ) -> Optional[TaskStatus]:
+        """Record a failure of a running task.
+
+        With ``retry`` the task goes back to pending after a backoff delay,
+        unless it has used up ``max_attempts``, in which case it is dead-lettered.
+        Returns the task's new status, or ``None`` when the task is not running
+        under the lease ``attempt`` any more.
+        """
+
+        def _op() -> Optional[TaskStatus]:
+            now = datetime.utcnow()
+            row = self._connection.execute("SELECT status, attempts FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None or row["status"] != TaskStatus.IN_PROGRESS.value:
+                return None
+            attempts = row["attempts"]
+            if attempt is not None and attempts != attempt:
+                return None
+            if not retry:
+                status, run_at = TaskStatus.FAILED, None
+            elif attempts >= self.max_attempts:
+                status, run_at = TaskStatus.DEAD_LETTER, None
+            else:
+                status = TaskStatus.PENDING
+                run_at = _timestamp(now + timedelta(seconds=self._retry_delay(attempts)))
+            finished_at = _timestamp(now) if status.is_final else None
+            self._connection.execute(
+                """
+                UPDATE tasks SET status = ?, error = ?, updated_at = ?, run_at = ?, finished_at = ?,
+                    lease_expires_at = NULL
+                WHERE id = ?
+                """,
+                (status.value, error, _timestamp(now), run_at, finished_at, task_id),
             )
-            row = cursor.fetchone()
+            return status
+
+        status = await self._db.write(_op)
+        if status is not None and status.is_final:
+            self._notify_done()
+        return status
+
+    async def cancel(self, dedup_key: str) -> Optional[int]:
+        """Cancel the pending task holding ``dedup_key``; returns its id, or ``None`` if none is waiting.
+
+        A task that is already running is left to finish. The key is released,
+        so it can be used for a new task straight away.
+        """
+
+        def _op() -> Optional[int]:
+            row = self._connection.execute(
+                "SELECT id FROM tasks WHERE dedup_key = ? AND status = ?", (dedup_key, TaskStatus.PENDING.value)
+            ).fetchone()
             if row is None:
                 return None
-            cursor.execute(
-                "UPDATE tasks SET status = ?, updated_at = ? WHERE id = ?",
-                (TaskStatus.IN_PROGRESS.value, datetime.utcnow().isoformat(), row["id"]),
-            )
-            self._connection.commit()
-            return Task(
-                id=row["id"],
-                payload=json.loads(row["payload"]),
-                status=TaskStatus.IN_PROGRESS,
-                result=json.loads(row["result"]) if row["result"] else None,
-                error=row["error"],
+            now = _timestamp()
+            self._connection.execute(
+                """
+                UPDATE tasks SET status = ?, error = 'cancelled', dedup_key = NULL, updated_at = ?, finished_at = ?
+                WHERE id = ?
+                """,
+                (TaskStatus.CANCELLED.value, now, now, row["id"]),
             )
+            return int(row["id"])
 
-    async def complete(self, task_id: int, result: dict) -> None:
-        async with self._lock:
-            cursor = self._connection.cursor()
-            cursor.execute(
-                "UPDATE tasks SET status = ?, result = ?, updated_at = ? WHERE id = ?",
-                (
-                    TaskStatus.COMPLETED.value,
-                    json.dumps(result),
-                    datetime.utcnow().isoformat(),
-                    task_id,
-                ),
-            )
-            self._connection.commit()
-
-    async def fail(self, task_id: int, error: str) -> None:
-        async with self._lock:
-            cursor = self._connection.cursor()
-            cursor.execute(
-                "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE id = ?",
-                (
-                    TaskStatus.FAILED.value,
-                    error,
-                    datetime.utcnow().isoformat(),
-                    task_id,
-                ),
+        task_id = await self._db.write(_op)
+        if task_id is not None:
+            self._notify_done()
+        return task_id
+
+    async def touch(self, task_ids: Iterable[int], *, attempts: Optional[Dict[int, int]] = None) -> List[int]:
+        """Heartbeat for running tasks: extend their leases by ``lease_seconds``.
+
+        Returns the ids whose lease is no longer held (per ``attempts``, as in
+        :meth:`complete_many`), so the caller can stop relying on them.
+        """
+
+        attempts = attempts or {}
+        now = datetime.utcnow()
+        expiry = self._lease_expiry(now)
+        leases = [(task_id, attempts.get(task_id)) for task_id in task_ids]
+
+        def _op() -> List[int]:
+            lost = []
+            for task_id, attempt in leases:
+                cursor = self._connection.execute(
+                    """
+                    UPDATE tasks SET updated_at = ?, lease_expires_at = ?
+                    WHERE id = ? AND status = ? AND (? IS NULL OR attempts = ?)
+                    """,
+                    (_timestamp(now), expiry, task_id, TaskStatus.IN_PROGRESS.value, attempt, attempt),
+                )
+                if not cursor.rowcount:
+                    lost.append(task_id)
+            return lost
+
+        return await self._db.write(_op)
+
+    async def reap_expired(self) -> Dict[str, int]:
+        """Return tasks with expired leases to the queue; dead-letter exhausted ones."""
+
+        counts = {"requeued": 0, "dead_letter": 0}
+        now = datetime.utcnow()
+        # Found with a read first so heartbeats with nothing to reap never take the write lock.
+        rows = await self._db.read(
+            lambda: self._connection.execute(
+                "SELECT id, attempts FROM tasks WHERE status = ? AND lease_expires_at < ?",
+                (TaskStatus.IN_PROGRESS.value, _timestamp(now)),
+            ).fetchall()
+        )
+        if not rows:
+            return counts
+
+        def _op() -> None:
+            now = datetime.utcnow()
+            for row in rows:
+                if row["attempts"] >= self.max_attempts:
+                    status, run_at, key = TaskStatus.DEAD_LETTER, None, "dead_letter"
+                else:
+                    delay = self._retry_delay(row["attempts"])
+                    status, run_at, key = TaskStatus.PENDING, _timestamp(now + timedelta(seconds=delay)), "requeued"
+                # The status/lease guard skips tasks whose worker heartbeated or finished meanwhile.
+                cursor = self._connection.execute(
+                    """
+                    UPDATE tasks SET status = ?, run_at = ?, lease_expires_at = NULL, updated_at = ?,
+                        finished_at = ?, error = COALESCE(error, 'lease expired')
+                    WHERE id = ? AND status = ? AND lease_expires_at < ?
+                    """,
+                    (
+                        status.value,
+                        run_at,
+                        _timestamp(now),
+                        _timestamp(now) if status.is_final else None,
+                        row["id"],
+                        TaskStatus.IN_PROGRESS.value,
+                        _timestamp(now),
+                    ),
+                )
+                counts[key] += cursor.rowcount
+
+        await self._db.write(_op)
+        if counts["requeued"]:
+            self._notify()
+        if counts["dead_letter"]:
+            self._notify_done()
+        return counts
+
+    def _notify_done(self) -> None:
+        if self._done_notifier is not None:
+            self._done_notifier.notify()
+
+    async def get(self, task_id: int) -> Optional[Task]:
+        """Current state of a task, or ``None`` if it does not exist."""
+
+        row = await self._db.read(lambda: self._connection.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone())
+        return _row_to_task(row) if row is not None else None
+
+    async def wait(self, task_id: int, timeout: Optional[float] = None) -> Optional[Task]:
+        """Wait until the task has finished and return it.
+
+        When ``timeout`` expires first, the task's current (unfinished) state is
+        returned instead; ``None`` means there is no such task.
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        # Registered before the status check, so a completion in between is not missed.
+        self._waiters.setdefault(task_id, []).append(future)
+        self._ensure_watcher()
+        try:
+            task = await self.get(task_id)
+            if task is None or task.status.is_final:
+                return task
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                return await self.get(task_id)
+        finally:
+            waiters = self._waiters.get(task_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(task_id, None)
+
+    async def completions(self) -> AsyncIterator[Task]:
+        """Yield every task that finishes from now on, in this or any other process."""
+
+        inbox: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(inbox)
+        self._ensure_watcher()
+        try:
+            while True:
+                yield await inbox.get()
+        finally:
+            self._subscribers.discard(inbox)
+
+    def _ensure_watcher(self) -> None:
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.get_running_loop().create_task(self._watch(datetime.utcnow()))
+
+    async def _watch(self, since: datetime) -> None:
+        # finished_at is stamped before its transaction commits, so a row can
+        # appear with a stamp older than rows already seen. Each pass re-reads
+        # a trailing grace window (deduplicated by id) and also looks up the
+        # awaited ids directly, so late commits are never skipped.
+        grace = timedelta(seconds=_COMPLETION_GRACE_SECONDS)
+        newest = since
+        delivered: Dict[int, str] = {}
+        backoff = IdleBackoff(QUEUE_POLL_MIN, QUEUE_POLL_MAX)
+        primed = False
+        while self._waiters or self._subscribers:
+            low = _timestamp(newest - grace)
+            awaited = list(self._waiters)
+
+            def _op() -> List[sqlite3.Row]:
+                rows = self._connection.execute(
+                    "SELECT * FROM tasks WHERE finished_at >= ? ORDER BY finished_at, id", (low,)
+                ).fetchall()
+                if awaited:
+                    marks = ", ".join("?" * len(awaited))
+                    rows += self._connection.execute(
+                        f"SELECT * FROM tasks WHERE id IN ({marks}) AND finished_at < ?", (*awaited, low)
+                    ).fetchall()
+                return rows
+
+            rows = [row for row in await self._db.read(_op) if row["id"] not in delivered]
+            for row in rows:
+                task = _row_to_task(row)
+                if row["finished_at"] >= low:
+                    delivered[task.id] = row["finished_at"]
+                    newest = max(newest, task.finished_at)
+                for future in self._waiters.get(task.id, []):
+                    if not future.done():
+                        future.set_result(task)
+                # The first pass only catches up on the grace window; subscribers get what finishes later.
+                if primed or task.finished_at >= since:
+                    for inbox in self._subscribers:
+                        inbox.put_nowait(task)
+            primed = True
+            low = _timestamp(newest - grace)
+            for task_id in [task_id for task_id, stamp in delivered.items() if stamp < low]:
+                del delivered[task_id]
+            if rows:
+                backoff.reset()
+            if self._done_notifier is None:
+                await asyncio.sleep(backoff.next())
+            elif await self._done_notifier.wait(backoff.next()):
+                backoff.reset()
+
+    async def next_due_in(self) -> Optional[float]:
+        """Seconds until the next pending task or schedule is due (0 if one is due now, ``None`` if none)."""
+
+        def _op() -> List[Optional[str]]:
+            return [
+                self._connection.execute(
+                    "SELECT MIN(run_at) FROM tasks WHERE status = ?", (TaskStatus.PENDING.value,)
+                ).fetchone()[0],
+                self._connection.execute("SELECT MIN(next_run_at) FROM schedules").fetchone()[0],
+            ]
+
+        moments = [value for value in await self._db.read(_op) if value]
+        if not moments:
+            return None
+        delay = (datetime.fromisoformat(min(moments)) - datetime.utcnow()).total_seconds()
+        return max(0.0, delay)
+
+    async def add_schedule(
+        self,
+        name: str,
+        payload: dict,
+        *,
+        every: Union[float, timedelta],
+        start_at: Optional[datetime] = None,
+        priority: int = TaskPriority.NORMAL,
+        tenant: Optional[str] = None,
+    ) -> int:
+        """Create or replace the recurring schedule ``name``: enqueue ``payload`` every ``every``."""
+
+        interval = every.total_seconds() if isinstance(every, timedelta) else float(every)
+        if interval <= 0:
+            raise ValueError("schedule interval must be positive")
+        first = _as_utc(start_at) if start_at is not None else datetime.utcnow()
+        schedule_id = await self._db.write(
+            lambda: int(
+                self._connection.execute(
+                    """
+                    INSERT INTO schedules (name, payload, interval_seconds, next_run_at, priority, tenant)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET payload = excluded.payload,
+                        interval_seconds = excluded.interval_seconds, next_run_at = excluded.next_run_at,
+                        priority = excluded.priority, tenant = excluded.tenant
+                    RETURNING id
+                    """,
+                    (name, json.dumps(payload), interval, _timestamp(first), int(priority), tenant or ""),
+                ).fetchone()[0]
             )
-            self._connection.commit()
+        )
+        self._notify()
+        return schedule_id
+
+    async def remove_schedule(self, name: str) -> bool:
+        deleted = await self._db.write(
+            lambda: self._connection.execute("DELETE FROM schedules WHERE name = ?", (name,)).rowcount
+        )
+        return deleted > 0
+
+    async def tick_schedules(self) -> List[int]:
+        """Enqueue one task for every schedule that is due and advance it; returns the new task ids.
+
+        Runs missed while no worker was ticking collapse into one task, and
+        the write lock makes concurrent ticks from several workers enqueue
+        each run only once.
+        """
+
+        now = datetime.utcnow()
+        stamp = _timestamp(now)
+        # Cheap indexed check first so idle ticks never take the write lock.
+        due_now = await self._db.read(
+            lambda: self._connection.execute("SELECT 1 FROM schedules WHERE next_run_at <= ? LIMIT 1", (stamp,)).fetchone()
+        )
+        if due_now is None:
+            return []
+
+        def _op() -> List[int]:
+            ids = []
+            # Re-read under the write lock: another worker may have ticked in between.
+            rows = self._connection.execute("SELECT * FROM schedules WHERE next_run_at <= ?", (stamp,)).fetchall()
+            for row in rows:
+                task_id = self._insert_task(
+                    json.loads(row["payload"]), row["priority"], row["tenant"], row["next_run_at"], stamp
+                )
+                self._activate_tenant(row["tenant"])
+                interval = timedelta(seconds=row["interval_seconds"])
+                due = datetime.fromisoformat(row["next_run_at"])
+                missed = int((now - due) / interval) + 1
+                self._connection.execute(
+                    "UPDATE schedules SET next_run_at = ?, last_task_id = ? WHERE id = ?",
+                    (_timestamp(due + missed * interval), task_id, row["id"]),
+                )
+                ids.append(task_id)
+            return ids
+
+        ids = await self._db.write(_op)
+        if ids:
+            self._notify()
+        return ids
+
+    async def stats(self, *, window_seconds: float = 3600.0) -> Dict[int, Dict[str, Any]]:
+        """Per-priority depth and wait times (seconds).
+
+        ``oldest_wait`` is the age of the oldest pending task; ``avg_wait`` and
+        ``max_wait`` cover tasks started within the last ``window_seconds``.
+        """
+
+        def _op() -> Dict[int, Dict[str, Any]]:
+            now = datetime.utcnow()
+            stats: Dict[int, Dict[str, Any]] = {}
+
+            def entry(priority: int) -> Dict[str, Any]:
+                return stats.setdefault(
+                    priority,
+                    {"pending": 0, "in_progress": 0, "oldest_wait": 0.0, "started": 0, "avg_wait": 0.0, "max_wait": 0.0},
+                )
+
+            for row in self._connection.execute(
+                """
+                SELECT priority, status, COUNT(*) AS count, MIN(created_at) AS oldest
+                FROM tasks WHERE status IN (?, ?) GROUP BY priority, status
+                """,
+                (TaskStatus.PENDING.value, TaskStatus.IN_PROGRESS.value),
+            ):
+                item = entry(row["priority"])
+                item[row["status"]] = row["count"]
+                if row["status"] == TaskStatus.PENDING.value:
+                    item["oldest_wait"] = round((now - datetime.fromisoformat(row["oldest"])).total_seconds(), 3)
+            for row in self._connection.execute(
+                """
+                SELECT priority, COUNT(*) AS count,
+                    AVG((julianday(started_at) - julianday(created_at)) * 86400.0) AS avg_wait,
+                    MAX((julianday(started_at) - julianday(created_at)) * 86400.0) AS max_wait
+                FROM tasks WHERE started_at >= ? GROUP BY priority
+                """,
+                (_timestamp(now - timedelta(seconds=window_seconds)),),
+            ):
+                item = entry(row["priority"])
+                item.update(started=row["count"], avg_wait=round(row["avg_wait"], 3), max_wait=round(row["max_wait"], 3))
+            return dict(sorted(stats.items(), reverse=True))
+
+        return await self._db.read(_op)
 
     async def pending_count(self) -> int:
-        async with self._lock:
-            cursor = self._connection.cursor()
-            cursor.execute(
+        (count,) = await self._db.read(
+            lambda: self._connection.execute(
                 "SELECT COUNT(*) FROM tasks WHERE status IN (?, ?)",
                 (TaskStatus.PENDING.value, TaskStatus.IN_PROGRESS.value),
-            )
-            (count,) = cursor.fetchone()
-            return int(count)
+            ).fetchone()
+        )
+        return int(count)
 
     async def close(self) -> None:
-        self._connection.close()
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+        for notifier in (self._notifier, self._done_notifier):
+            if notifier is not None:
+                notifier.close()
+        await self._db.close()
 
     async def __aenter__(self) -> "AsyncTaskQueue":  # pragma: no cover - convenience
         return self
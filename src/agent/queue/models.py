@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from datetime import datetime
-from enum import Enum
+from enum import Enum, IntEnum
 from typing import Any, Dict, Optional
 
 
@@ -12,6 +12,22 @@ class TaskStatus(str, Enum):
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     FAILED = "failed"
+    DEAD_LETTER = "dead_letter"
+    CANCELLED = "cancelled"
+
+    @property
+    def is_final(self) -> bool:
+        """Completed, failed, dead-lettered or cancelled: the task will not run again."""
+
+        return self in (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.DEAD_LETTER, TaskStatus.CANCELLED)
+
+
+class TaskPriority(IntEnum):
+    """Higher values are served first; any integer is accepted."""
+
+    LOW = 0
+    NORMAL = 5
+    HIGH = 10
 
 
 @dataclass
@@ -23,3 +39,22 @@ class Task:
     updated_at: datetime = field(default_factory=datetime.utcnow)
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    attempts: int = 0
+    priority: int = TaskPriority.NORMAL
+    tenant: str = ""
+    finished_at: Optional[datetime] = None
+    dedup_key: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "result": self.result,
+            "error": self.error,
+            "attempts": self.attempts,
+            "priority": int(self.priority),
+            "tenant": self.tenant,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "dedup_key": self.dedup_key,
+        }
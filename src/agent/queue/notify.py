@@ -0,0 +1,168 @@
+"""Wake idle queue consumers as soon as work is enqueued.
+
+Consumers in the same process wait on an :class:`asyncio.Event`. Consumers in
+other processes each bind a UNIX datagram socket in ``<db>.notify/``; a
+producer sends one byte to every socket it finds there, removing sockets
+whose owner has gone away. Notifications are hints only: consumers still
+poll with backoff, so a lost datagram costs latency, never a task.
+
+Each ``channel`` is independent: the queue announces new work on ``notify``
+(directory ``<db>.notify/``) and finished tasks on ``done`` (``<db>.done/``).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SOCKET_SUFFIX = ".sock"
+# In-process waiters per database: (loop, event) pairs, set thread-safely.
+_local_waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+_local_lock = Lock()
+
+
+class QueueNotifier:
+    def __init__(self, db_path: Path, *, channel: str = "notify") -> None:
+        self.db_path = db_path
+        self._key = f"{db_path.resolve()}.{channel}"
+        self.directory = db_path.with_name(f"{db_path.name}.{channel}")
+        self._event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._socket: Optional[socket.socket] = None
+        self._socket_path: Optional[Path] = None
+
+    @property
+    def listening(self) -> bool:
+        return self._event is not None
+
+    def notify(self) -> None:
+        """Signal every waiter in this process and in other processes."""
+
+        with _local_lock:
+            waiters = list(_local_waiters.get(self._key, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop already closed
+                pass
+        self._notify_processes()
+
+    def _notify_processes(self) -> None:
+        if not hasattr(socket, "AF_UNIX") or not self.directory.is_dir():
+            return
+        own = f"{os.getpid()}-"
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for path in self.directory.glob(f"*{_SOCKET_SUFFIX}"):
+                if path.name.startswith(own):
+                    continue  # covered by the in-process event
+                try:
+                    sender.sendto(b"\x01", str(path))
+                except BlockingIOError:
+                    pass  # the receiver already has wakeups queued
+                except (ConnectionRefusedError, FileNotFoundError):
+                    path.unlink(missing_ok=True)  # owner exited without cleaning up
+                except OSError as exc:
+                    logger.debug("队列通知发送失败 %s: %s", path, exc)
+        finally:
+            sender.close()
+
+    def listen(self) -> None:
+        """Start receiving notifications on the running event loop."""
+
+        if self._event is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        with _local_lock:
+            _local_waiters.setdefault(self._key, []).append((self._loop, self._event))
+        if hasattr(socket, "AF_UNIX"):
+            self._bind_socket()
+
+    def _bind_socket(self) -> None:
+        path = self.directory / f"{os.getpid()}-{uuid.uuid4().hex[:8]}{_SOCKET_SUFFIX}"
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            receiver.bind(str(path))
+        except OSError as exc:
+            receiver.close()
+            logger.warning("无法创建队列通知套接字，仅使用轮询: %s", exc)
+            return
+        receiver.setblocking(False)
+        try:
+            self._loop.add_reader(receiver.fileno(), self._drain)
+        except NotImplementedError:  # e.g. the Windows proactor loop
+            receiver.close()
+            path.unlink(missing_ok=True)
+            return
+        self._socket, self._socket_path = receiver, path
+
+    def _drain(self) -> None:
+        try:
+            while self._socket.recv(64):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        self._event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for a notification; ``True`` when woken.
+
+        The first call only starts listening and returns at once, so work
+        enqueued before the consumer was listening is picked up by a re-poll.
+        """
+
+        if self._event is None:
+            self.listen()
+            return True
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self._event.clear()
+        return True
+
+    def close(self) -> None:
+        if self._event is not None:
+            with _local_lock:
+                waiters = _local_waiters.get(self._key, [])
+                waiters[:] = [item for item in waiters if item[1] is not self._event]
+                if not waiters:
+                    _local_waiters.pop(self._key, None)
+        if self._socket is not None:
+            try:
+                self._loop.remove_reader(self._socket.fileno())
+            except Exception:  # pragma: no cover - loop already closed
+                pass
+            self._socket.close()
+            self._socket_path.unlink(missing_ok=True)
+        self._event = self._socket = self._socket_path = None
+
+
+class IdleBackoff:
+    """Poll interval that doubles while the queue stays empty."""
+
+    def __init__(self, minimum: float, maximum: float) -> None:
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.current = minimum
+
+    def reset(self) -> None:
+        self.current = self.minimum
+
+    def next(self) -> float:
+        interval = self.current
+        self.current = min(self.current * 2, self.maximum)
+        return interval
+
+
+__all__ = ["IdleBackoff", "QueueNotifier"]
@@ -0,0 +1,115 @@
+"""Calendar and to-do reminders delivered through the task queue.
+
+Task due dates and event start times are local naive datetimes; they are
+converted to UTC (the queue's time base) when the reminder is enqueued.
+Each reminder carries the dedup key ``<source>:<ref>`` (e.g. ``task:3``), so
+scheduling twice keeps one reminder and finishing the to-do item or deleting
+the event cancels it.
+
+The worker only renders the reminder text into the task result; the CLI
+follows :meth:`AsyncTaskQueue.completions` and posts it into the conversation
+it is running, so delivery does not depend on a shared history backend.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from agent.queue.engine import AsyncTaskQueue
+from agent.queue.models import TaskPriority
+from agent.tools.calendar import CalendarEvent
+from agent.tools.tasks import Task
+
+logger = logging.getLogger(__name__)
+
+REMINDER_KIND = "reminder"
+REMINDER_TENANT = "reminders"
+
+
+def reminder_payload(message: str, *, source: str, ref: Optional[int] = None) -> Dict[str, Any]:
+    return {"kind": REMINDER_KIND, "message": message, "source": source, "ref": ref}
+
+
+def reminder_key(source: str, ref: Optional[int]) -> Optional[str]:
+    return f"{source}:{ref}" if ref is not None else None
+
+
+def _local_to_utc(moment: datetime) -> datetime:
+    # astimezone() treats naive datetimes as local time.
+    return moment.astimezone(timezone.utc)
+
+
+async def _enqueue_reminder(
+    queue: AsyncTaskQueue, payload: Dict[str, Any], *, run_at: datetime, dedup_key: Optional[str]
+) -> Tuple[int, bool]:
+    options = dict(run_at=_local_to_utc(run_at), priority=TaskPriority.HIGH, tenant=REMINDER_TENANT)
+    if dedup_key is None:
+        return await queue.enqueue(payload, **options), True
+    task, created = await queue.enqueue_or_get(payload, dedup_key=dedup_key, **options)
+    return task.id, created
+
+
+async def schedule_task_reminder(
+    queue: AsyncTaskQueue, task: Task, *, lead: timedelta
+) -> Optional[Tuple[int, bool]]:
+    """Remind ``lead`` before a to-do item is due.
+
+    Returns the reminder's queue id and whether it was newly created (``False``
+    when one already holds the item's key), or ``None`` when it has no due date.
+    """
+
+    due = task.due_datetime()
+    if due is None:
+        return None
+    message = f"任务 #{task.id} {task.title} 将于 {due.strftime('%Y-%m-%d %H:%M')} 截止"
+    return await _enqueue_reminder(
+        queue,
+        reminder_payload(message, source="task", ref=task.id),
+        run_at=due - lead,
+        dedup_key=reminder_key("task", task.id),
+    )
+
+
+async def schedule_event_reminder(
+    queue: AsyncTaskQueue, event: CalendarEvent, *, event_id: Optional[int] = None, lead: timedelta
+) -> Tuple[int, bool]:
+    """Remind ``lead`` before a calendar event starts; returns ``(queue id, created)``."""
+
+    location = f"（{event.location}）" if event.location else ""
+    message = f"日程「{event.title}」将于 {event.start.strftime('%Y-%m-%d %H:%M')} 开始{location}"
+    return await _enqueue_reminder(
+        queue,
+        reminder_payload(message, source="calendar", ref=event_id),
+        run_at=event.start - lead,
+        dedup_key=reminder_key("calendar", event_id),
+    )
+
+
+async def cancel_reminder(queue: AsyncTaskQueue, source: str, ref: int) -> bool:
+    """Drop the pending reminder for a to-do item (``"task"``) or event (``"calendar"``)."""
+
+    return await queue.cancel(reminder_key(source, ref)) is not None
+
+
+def deliver_reminder(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Render a due reminder as the task result (blocking; runs on the worker pool).
+
+    The worker's own history is private to its process, so the text is handed
+    back through the queue for the CLI to show and record.
+    """
+
+    response = f"⏰ 提醒：{payload['message']}"
+    logger.info("已发送提醒: %s", payload["message"])
+    return {"response": response, "delivered_at": datetime.utcnow().isoformat(timespec="seconds")}
+
+
+__all__ = [
+    "REMINDER_KIND",
+    "cancel_reminder",
+    "deliver_reminder",
+    "reminder_key",
+    "reminder_payload",
+    "schedule_event_reminder",
+    "schedule_task_reminder",
+]
@@ -1,9 +1,28 @@
 """Routing logic for delegating tasks to specialised agents."""
 from __future__ import annotations
 
-from dataclasses import dataclass
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence
 
-from agent.personas.loader import Persona, PersonaRegistry
+from agent.matcher import KeywordMatcher
+from agent.personas.loader import Persona, PersonaRegistry, _parse_registry
+from config import (
+    INTENT_MODEL_PATH,
+    INTENT_THRESHOLD,
+    ROUTES_CONFIG_PATH,
+    ROUTES_RELOAD_INTERVAL,
+    ROUTING_LOG_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUTES_PATH = Path(__file__).resolve().parent / "personas" / "routes.yaml"
+_KEYWORD_SPLIT = re.compile(r"[,，]")
 
 
 @dataclass
@@ -13,20 +32,191 @@ class RoutingDecision:
     confidence: float
 
 
+@dataclass
+class RouteRule:
+    route: str
+    persona: str
+    confidence: float
+    priority: int = 0
+    keywords: List[str] = field(default_factory=list)
+    fallback: bool = False
+
+
+class RouteTable:
+    """Route rules compiled into one keyword matcher."""
+
+    def __init__(self, rules: Sequence[RouteRule]) -> None:
+        # Stable sort: equal priorities keep their order in the file.
+        self.rules = sorted(rules, key=lambda rule: -rule.priority)
+        self.fallback = next((rule for rule in self.rules if rule.fallback), None)
+        self.by_route: Dict[str, RouteRule] = {}
+        for rule in self.rules:
+            self.by_route.setdefault(rule.route, rule)
+        self.matcher = KeywordMatcher(
+            (keyword, rule.route) for rule in self.rules if not rule.fallback for keyword in rule.keywords
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "RouteTable":
+        rules = []
+        for item in _parse_registry(path.read_text(encoding="utf-8")):
+            rules.append(
+                RouteRule(
+                    route=item["route"],
+                    persona=item["persona"],
+                    confidence=float(item.get("confidence", 0.5)),
+                    priority=int(item.get("priority", 0)),
+                    keywords=[word.strip() for word in _KEYWORD_SPLIT.split(item.get("keywords", "")) if word.strip()],
+                    fallback=item.get("fallback", "").lower() in ("true", "1", "yes"),
+                )
+            )
+        return cls(rules)
+
+    def problems(self, registry: PersonaRegistry) -> List[str]:
+        """Reasons this table cannot serve ``registry``; empty when it is usable."""
+
+        found = [
+            f"路由 {rule.route} 引用了不存在的角色 {rule.persona}"
+            for rule in self.rules
+            if registry.find(rule.persona) is None
+        ]
+        if self.fallback is None:
+            found.append("缺少 fallback 路由")
+        return found
+
+    def match(self, text: str) -> List[RouteRule]:
+        """Rules whose keywords occur in ``text``, highest priority first."""
+
+        hits = self.matcher.labels(text)
+        return [rule for rule in self.rules if rule.route in hits and not rule.fallback]
+
+
 class KnowledgeRouter:
-    def __init__(self, registry: PersonaRegistry) -> None:
+    """Keyword router driven by ``routes.yaml`` with an optional classifier tier.
+
+    Keyword hits win. When nothing matches, a trained intent classifier (if
+    one exists at ``classifier_path``) picks the route, provided its confidence
+    reaches ``intent_threshold``; otherwise the fallback route is used.
+
+    The route file and model are re-read when their modification time changes
+    (checked at most every ``reload_interval`` seconds); a broken edit — one
+    that fails to parse, names an unknown persona or has no fallback route —
+    keeps the previous version in service and is not retried until the file
+    changes again.
+    """
+
+    def __init__(
+        self,
+        registry: PersonaRegistry,
+        *,
+        max_routes: int = 3,
+        routes_path: Optional[Path] = None,
+        reload_interval: float = ROUTES_RELOAD_INTERVAL,
+        classifier_path: Optional[Path] = None,
+        intent_threshold: float = INTENT_THRESHOLD,
+        routing_log: Optional[Path] = None,
+    ) -> None:
         self.registry = registry
+        self.max_routes = max_routes
+        self.routes_path = routes_path or (Path(ROUTES_CONFIG_PATH) if ROUTES_CONFIG_PATH else DEFAULT_ROUTES_PATH)
+        self.reload_interval = reload_interval
+        self.classifier_path = classifier_path or (Path(INTENT_MODEL_PATH) if INTENT_MODEL_PATH else None)
+        self.intent_threshold = intent_threshold
+        self._mtime = self.routes_path.stat().st_mtime_ns
+        self._rejected_mtime: Optional[int] = None
+        self.table = RouteTable.load(self.routes_path)
+        for problem in self.table.problems(registry):
+            logger.warning("路由配置有误: %s", problem)
+        self._classifier_mtime: Optional[int] = None
+        self.classifier: Any = None
+        self._load_classifier()
+        routing_log = routing_log or (Path(ROUTING_LOG_PATH) if ROUTING_LOG_PATH else None)
+        self.routing_log: Any = None
+        if routing_log is not None:
+            from agent.intent import RoutingLog
+
+            self.routing_log = RoutingLog(routing_log)
+        self._checked = time.monotonic()
+        self._reload_lock = Lock()
 
     def select(self, user_input: str) -> RoutingDecision:
-        lowered = user_input.lower()
-        if any(keyword in lowered for keyword in ["总结", "summary", "总结一下"]):
-            persona = self.registry.get("generalist")
-            return RoutingDecision(persona=persona, route="summarise", confidence=0.8)
-        if any(keyword in lowered for keyword in ["调研", "research", "资料"]):
-            persona = self.registry.get("researcher")
-            return RoutingDecision(persona=persona, route="research", confidence=0.7)
-        if any(keyword in lowered for keyword in ["计划", "规划", "plan"]):
-            persona = self.registry.get("planner")
-            return RoutingDecision(persona=persona, route="plan", confidence=0.75)
-        persona = self.registry.get("generalist")
-        return RoutingDecision(persona=persona, route="chat", confidence=0.6)
+        return self.select_many(user_input)[0]
+
+    def select_many(self, user_input: str) -> List[RoutingDecision]:
+        """Return every matching route in priority order, falling back to chat."""
+
+        self.reload_if_changed()
+        table = self.table
+        decisions = [
+            RoutingDecision(persona=self.registry.get(rule.persona), route=rule.route, confidence=rule.confidence)
+            for rule in table.match(user_input)
+        ][: max(1, self.max_routes)]
+        source = "keyword"
+        if not decisions:
+            classified = self._classify(user_input, table)
+            source = "classifier" if classified else "fallback"
+            if classified is None:
+                fallback = table.fallback or RouteRule(route="chat", persona="generalist", confidence=0.6)
+                classified = RoutingDecision(
+                    persona=self.registry.get(fallback.persona), route=fallback.route, confidence=fallback.confidence
+                )
+            decisions = [classified]
+        if self.routing_log is not None:
+            self.routing_log.record(user_input, decisions[0].route, decisions[0].confidence, source)
+        return decisions
+
+    def _classify(self, user_input: str, table: RouteTable) -> Optional[RoutingDecision]:
+        classifier = self.classifier
+        if classifier is None:
+            return None
+        label, confidence = classifier.predict(user_input)
+        rule = table.by_route.get(label)
+        if rule is None or confidence < self.intent_threshold:
+            return None
+        return RoutingDecision(persona=self.registry.get(rule.persona), route=rule.route, confidence=confidence)
+
+    def _load_classifier(self) -> bool:
+        path = self.classifier_path
+        mtime = path.stat().st_mtime_ns if path is not None and path.exists() else None
+        if mtime == self._classifier_mtime:
+            return False
+        self._classifier_mtime = mtime
+        if mtime is None:
+            self.classifier = None
+            return True
+        # Imported here so numpy is only loaded when a model has been trained.
+        from agent.intent import load_intent_classifier
+
+        classifier = load_intent_classifier(path)
+        if classifier is not None:
+            self.classifier = classifier
+            logger.info("已加载意图分类模型: %s", path)
+        return True
+
+    def reload_if_changed(self, *, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_interval:
+            return False
+        with self._reload_lock:
+            self._checked = now
+            self._load_classifier()
+            try:
+                mtime = self.routes_path.stat().st_mtime_ns
+            except OSError as exc:
+                logger.warning("重新加载路由配置失败，继续使用旧配置: %s", exc)
+                return False
+            if not force and mtime in (self._mtime, self._rejected_mtime):
+                return False
+            try:
+                table = RouteTable.load(self.routes_path)
+                problems = table.problems(self.registry)
+                if problems:
+                    raise ValueError("；".join(problems))
+            except Exception as exc:
+                self._rejected_mtime = mtime
+                logger.warning("重新加载路由配置失败，继续使用旧配置: %s", exc)
+                return False
+            self._rejected_mtime = None
+            self.table, self._mtime = table, mtime
+            logger.info("已重新加载路由配置: %s", self.routes_path)
+            return True
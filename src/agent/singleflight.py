@@ -0,0 +1,148 @@
+"""Single-flight coalescing of identical in-flight calls."""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+KeyFunction = Callable[[Dict[str, Any]], Optional[Hashable]]
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable digest of JSON-compatible values, used as a coalescing key."""
+
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def default_graph_key(state: Dict[str, Any]) -> Optional[Hashable]:
+    """Coalesce graph runs that share the same input and thread."""
+
+    user_input = state.get("input")
+    if not user_input:
+        return None
+    return fingerprint(user_input, state.get("thread_id"))
+
+
+@dataclass
+class FlightStats:
+    calls: int = 0
+    executed: int = 0
+    coalesced: int = 0
+    in_flight: int = 0
+    wait_timeouts: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight,
+            "wait_timeouts": self.wait_timeouts,
+        }
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running block on the same future and receive a deep copy of its
+    result (or the same exception). Nothing is cached once the call finishes.
+
+    With ``wait_timeout`` a caller waits at most that many seconds for the
+    running call and then runs ``fn`` itself, so a hung leader cannot hold
+    every follower hostage.
+    """
+
+    def __init__(self, *, wait_timeout: Optional[float] = None) -> None:
+        self.wait_timeout = wait_timeout
+        self._lock = Lock()
+        self._futures: Dict[Hashable, Future] = {}
+        self._stats = FlightStats()
+
+    def do(self, key: Hashable, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return self.do_shared(key, fn, *args, **kwargs)[0]
+
+    def do_shared(self, key: Hashable, fn: Callable[..., T], *args: Any, **kwargs: Any) -> Tuple[T, bool]:
+        """Like :meth:`do`, also reporting whether the result came from another caller."""
+
+        with self._lock:
+            self._stats.calls += 1
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._futures[key] = future
+                self._stats.executed += 1
+                self._stats.in_flight += 1
+            else:
+                self._stats.coalesced += 1
+        if not leader:
+            try:
+                return copy.deepcopy(future.result(timeout=self.wait_timeout)), True
+            except FutureTimeout:
+                with self._lock:
+                    self._stats.wait_timeouts += 1
+                return fn(*args, **kwargs), False
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+                self._stats.in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return self._stats.as_dict()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = FlightStats(in_flight=self._stats.in_flight)
+
+
+class CoalescingGraph:
+    """Wraps a compiled graph so identical concurrent ``invoke`` calls run once."""
+
+    def __init__(
+        self,
+        graph: Any,
+        *,
+        flight: SingleFlight | None = None,
+        key_fn: KeyFunction = default_graph_key,
+    ) -> None:
+        self._graph = graph
+        self.flight = flight or SingleFlight()
+        self.key_fn = key_fn
+
+    def invoke(self, state: Dict[str, Any], *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        key = self.key_fn(state) if not args and not kwargs else None
+        if key is None:
+            return self._graph.invoke(state, *args, **kwargs)
+        return self.flight.do(key, self._graph.invoke, state)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._graph, name)
+
+
+llm_flight = SingleFlight()
+
+__all__ = [
+    "CoalescingGraph",
+    "FlightStats",
+    "SingleFlight",
+    "default_graph_key",
+    "fingerprint",
+    "llm_flight",
+]
@@ -57,6 +57,12 @@ class CalendarClient:
         self._connection.commit()
         return int(cursor.lastrowid)
 
+    def delete_event(self, event_id: int) -> bool:
+        cursor = self._connection.cursor()
+        cursor.execute("DELETE FROM events WHERE id = ?", (event_id,))
+        self._connection.commit()
+        return cursor.rowcount > 0
+
     def list_events(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[CalendarEvent]:
         query = "SELECT title, start, end, location, description FROM events"
         params: List[str] = []
@@ -1,6 +1,7 @@
 """Utilities for loading documents and running vector similarity search."""
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import re
@@ -81,6 +82,7 @@ class DocumentVectorStore:
         self._documents: List[Document] = []
         self._vocabulary: Dict[str, int] = {}
         self._matrix: List[Dict[int, float]] = []
+        self._version = hashlib.sha256().hexdigest()[:16]
         self._lock = RLock()
 
         self._file_path = file_path
@@ -116,6 +118,13 @@ class DocumentVectorStore:
         with self._lock:
             return tuple(self._documents)
 
+    @property
+    def version(self) -> str:
+        """Digest of the indexed documents; changes whenever the corpus does."""
+
+        with self._lock:
+            return self._version
+
     def add_documents(self, docs: Iterable[Document]) -> None:
         new_docs = [doc for doc in docs]
         if not new_docs:
@@ -149,6 +158,10 @@ class DocumentVectorStore:
             return sorted_pairs[:k]
 
     def _rebuild_vectors(self) -> None:
+        digest = hashlib.sha256()
+        for doc in self._documents:
+            digest.update(json.dumps([doc.content, doc.metadata], sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        self._version = digest.hexdigest()[:16]
         self._vocabulary = {}
         for doc in self._documents:
             for token in _tokenize(doc.content):
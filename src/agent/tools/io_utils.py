@@ -7,11 +7,6 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Sequence
 
-try:  # pragma: no cover - optional dependency
-    import pandas as pd
-except Exception:  # pragma: no cover - fallback when pandas is unavailable
-    pd = None  # type: ignore
-
 
 @dataclass
 class Table:
@@ -44,7 +39,10 @@ def export_table_to_csv(table: Table, destination: Path) -> Path:
 
 
 def export_table_to_excel(table: Table, destination: Path) -> Path:
-    if pd is None:  # pragma: no cover - optional path
+    # pandas is imported on demand: it is slow to load and only needed here.
+    try:
+        import pandas as pd
+    except Exception:  # pragma: no cover - optional path
         raise RuntimeError("pandas is required for Excel export")
     destination.parent.mkdir(parents=True, exist_ok=True)
     frame = pd.DataFrame(list(table.rows), columns=list(table.headers))
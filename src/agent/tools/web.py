@@ -1,7 +1,10 @@
 """Simple offline-friendly web search shim."""
 from __future__ import annotations
 
-from typing import List
+from threading import Lock
+from typing import List, Optional
+
+from agent.tracing import traced
 
 from .docs import Document, DocumentVectorStore
 
@@ -27,6 +30,10 @@ class OfflineWebSearch:
         self._store = DocumentVectorStore()
         self._store.replace_documents(_DEFAULT_CORPUS)
 
+    @property
+    def version(self) -> str:
+        return self._store.version
+
     def search(self, query: str, k: int = 3) -> List[dict]:
         results = []
         for doc, score in self._store.similarity_search(query, k=k):
@@ -34,12 +41,25 @@ class OfflineWebSearch:
         return results
 
 
-_default_search = OfflineWebSearch()
+_default_search: Optional[OfflineWebSearch] = None
+_default_search_lock = Lock()
+
+
+def get_default_search() -> OfflineWebSearch:
+    """Return the shared offline search index, building it on first use."""
+
+    global _default_search
+    if _default_search is None:
+        with _default_search_lock:
+            if _default_search is None:
+                _default_search = OfflineWebSearch()
+    return _default_search
 
 
+@traced("tool.search_web")
 def search_web(query: str, k: int = 3) -> List[dict]:
     """Perform a lightweight similarity search against the bundled corpus."""
 
     if not query:
         return []
-    return _default_search.search(query, k=k)
+    return get_default_search().search(query, k=k)
@@ -0,0 +1,258 @@
+"""Lightweight span tracing for graph nodes, agents, tools and model calls."""
+from __future__ import annotations
+
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from config import TRACE_ENABLED, TRACE_EXPORTERS, TRACE_FILE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed unit of work; child spans nest under the active span."""
+
+    def __init__(self, name: str, kind: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.children: List["Span"] = []
+        self.status = "ok"
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add_usage(self, usage: Dict[str, int]) -> None:
+        totals = self.attributes.setdefault("usage", {})
+        for key, value in usage.items():
+            totals[key] = totals.get(key, 0) + int(value or 0)
+
+    def finish(self) -> None:
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "name": self.name,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        if self.children:
+            payload["children"] = [child.to_dict() for child in self.children]
+        return payload
+
+
+class SpanExporter:
+    """Receives finished root spans; subclasses decide where they go."""
+
+    def export(self, trace_id: str, span: Dict[str, Any]) -> None:  # pragma: no cover - interface
+        raise NotImplementedError
+
+
+class LogExporter(SpanExporter):
+    def __init__(self, level: int = logging.DEBUG) -> None:
+        self.level = level
+
+    def export(self, trace_id: str, span: Dict[str, Any]) -> None:
+        logger.log(
+            self.level,
+            "trace=%s span=%s kind=%s duration_ms=%s status=%s",
+            trace_id,
+            span["name"],
+            span["kind"],
+            span["duration_ms"],
+            span["status"],
+        )
+
+
+class JsonlExporter(SpanExporter):
+    """Appends one JSON object per root span to a file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = Lock()
+
+    def export(self, trace_id: str, span: Dict[str, Any]) -> None:
+        line = json.dumps({"trace_id": trace_id, **span}, ensure_ascii=False, default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps exported spans in a list; intended for tests."""
+
+    def __init__(self) -> None:
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = Lock()
+
+    def export(self, trace_id: str, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append({"trace_id": trace_id, **span})
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+_active_span: ContextVar[Optional[Span]] = ContextVar("active_span", default=None)
+
+
+class Tracer:
+    def __init__(self, exporters: Sequence[SpanExporter] = (), *, enabled: bool = True) -> None:
+        self.exporters = list(exporters)
+        self.enabled = enabled
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Span]:
+        record = Span(name, kind, attributes)
+        parent = _active_span.get()
+        token = _active_span.set(record)
+        try:
+            yield record
+        except BaseException as exc:
+            record.status = "error"
+            record.set(error=str(exc))
+            raise
+        finally:
+            record.finish()
+            _active_span.reset(token)
+            if parent is not None:
+                parent.children.append(record)
+
+    def export(self, trace_id: str, span: Dict[str, Any]) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace_id, span)
+            except Exception as exc:  # pragma: no cover - exporters must never break requests
+                logger.warning("导出 trace 失败: %s", exc)
+
+
+def current_span() -> Optional[Span]:
+    return _active_span.get()
+
+
+def annotate(**attributes: Any) -> None:
+    """Attach attributes (cache hits, model, ...) to the active span, if any."""
+
+    span = _active_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def record_usage(usage: Any) -> None:
+    """Add a completion's token usage to the active span."""
+
+    span = _active_span.get()
+    if span is None or usage is None:
+        return
+    span.add_usage(
+        {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+            "completion_tokens": getattr(usage, "completion_tokens", 0),
+            "total_tokens": getattr(usage, "total_tokens", 0),
+        }
+    )
+
+
+def build_exporters(names: Sequence[str], *, file_path: Path) -> List[SpanExporter]:
+    exporters: List[SpanExporter] = []
+    for name in names:
+        key = name.strip().lower()
+        if key == "log":
+            exporters.append(LogExporter())
+        elif key == "jsonl":
+            exporters.append(JsonlExporter(file_path))
+        elif key == "memory":
+            exporters.append(InMemoryExporter())
+        elif key:
+            logger.warning("未知的 trace 导出器: %s", name)
+    return exporters
+
+
+tracer = Tracer(
+    build_exporters(TRACE_EXPORTERS.split(","), file_path=Path(TRACE_FILE_PATH)),
+    enabled=TRACE_ENABLED,
+)
+
+
+def traced(name: str, kind: str = "tool") -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator recording a child span for each call of a tool or agent method."""
+
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not tracer.enabled or _active_span.get() is None:
+                return fn(*args, **kwargs)
+            with tracer.span(name, kind=kind):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_node(name: str, node: Callable[[Dict[str, Any]], Dict[str, Any]], *, root: bool = False):
+    """Wrap a graph node so its span lands in ``metadata["trace"]``.
+
+    The ``root`` (entry) node always starts a new trace, so a checkpointed
+    thread does not keep appending to the previous run's trace.
+
+    Parallel branch nodes only return ``{"branches": {route: outcome}}``; their
+    span is stored on the outcome and folded into the trace by the join node,
+    so concurrent branches never write ``metadata`` at the same time.
+    """
+
+    def wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
+        if not tracer.enabled:
+            return node(state)
+        metadata = {} if root else state.get("metadata") or {}
+        trace_id = metadata.get("trace_id") or uuid.uuid4().hex
+        with tracer.span(name, kind="node") as span:
+            update = node(state)
+            span.set(route=update.get("route", state.get("route")))
+        payload = span.to_dict()
+        tracer.export(trace_id, payload)
+        branches = update.get("branches")
+        if "metadata" not in update and isinstance(branches, dict) and len(branches) == 1:
+            (outcome,) = branches.values()
+            outcome["trace"] = [payload]
+            return update
+        merged = dict(update.get("metadata", metadata))
+        merged["trace_id"] = trace_id
+        merged["trace"] = [*merged.get("trace", []), payload]
+        return {**update, "metadata": merged}
+
+    wrapper.__name__ = getattr(node, "__name__", name)
+    return wrapper
+
+
+__all__ = [
+    "InMemoryExporter",
+    "JsonlExporter",
+    "LogExporter",
+    "Span",
+    "SpanExporter",
+    "Tracer",
+    "annotate",
+    "build_exporters",
+    "current_span",
+    "record_usage",
+    "traced",
+    "traced_node",
+    "tracer",
+]
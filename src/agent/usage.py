@@ -0,0 +1,229 @@
+"""Token usage and cost accounting per route, persona and model."""
+from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from config import MODEL_PRICES, USAGE_WINDOW_SECONDS
+
+UNKNOWN = "-"
+GROUP_FIELDS = ("route", "persona", "model")
+
+
+@dataclass
+class UsageRecord:
+    route: str
+    persona: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cost: float
+    timestamp: float
+
+
+def usage_tokens(usage: Any) -> Tuple[int, int, int]:
+    """Extract ``(prompt, completion, total)`` from an SDK usage object or dict."""
+
+    def read(name: str) -> int:
+        value = usage.get(name) if isinstance(usage, Mapping) else getattr(usage, name, 0)
+        return int(value or 0)
+
+    prompt, completion = read("prompt_tokens"), read("completion_tokens")
+    return prompt, completion, read("total_tokens") or prompt + completion
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, prices: Mapping[str, Tuple[float, float]]) -> float:
+    """Cost in USD; prices are ``(input, output)`` per million tokens."""
+
+    price = prices.get(model)
+    if price is None:
+        # Dated snapshots ("gpt-4o-mini-2024-07-18") share the base model's price.
+        matches = [name for name in prices if model.startswith(name)]
+        price = prices[max(matches, key=len)] if matches else None
+    if price is None:
+        return 0.0
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+
+class UsageCollector:
+    """Per-request accumulator used to attach usage to graph metadata."""
+
+    def __init__(self) -> None:
+        self.records: List[UsageRecord] = []
+        self._lock = Lock()
+
+    def add(self, record: UsageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def as_metadata(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self.records)
+        return summarise_records(records)
+
+
+def summarise_records(records: Sequence[UsageRecord]) -> Dict[str, Any]:
+    return {
+        "calls": len(records),
+        "prompt_tokens": sum(item.prompt_tokens for item in records),
+        "completion_tokens": sum(item.completion_tokens for item in records),
+        "total_tokens": sum(item.total_tokens for item in records),
+        "cost": round(sum(item.cost for item in records), 6),
+        "models": sorted({item.model for item in records}),
+    }
+
+
+def merge_usage(*items: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Add up several ``as_metadata`` dictionaries (e.g. from parallel branches)."""
+
+    merged: Dict[str, Any] = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+    models = set()
+    for item in items:
+        if not item:
+            continue
+        for key in ("calls", "prompt_tokens", "completion_tokens", "total_tokens", "cost"):
+            merged[key] += item.get(key, 0)
+        models.update(item.get("models", []))
+    merged["cost"] = round(merged["cost"], 6)
+    merged["models"] = sorted(models)
+    return merged
+
+
+_attribution: ContextVar[Dict[str, str]] = ContextVar("usage_attribution", default={})
+_collector: ContextVar[Optional[UsageCollector]] = ContextVar("usage_collector", default=None)
+
+
+@contextmanager
+def attribute_usage(*, route: Optional[str] = None, persona: Optional[str] = None) -> Iterator[UsageCollector]:
+    """Attribute model calls in the block to ``route``/``persona`` and collect them."""
+
+    collector = UsageCollector()
+    labels = {key: value for key, value in (("route", route), ("persona", persona)) if value}
+    label_token = _attribution.set({**_attribution.get(), **labels})
+    collector_token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(collector_token)
+        _attribution.reset(label_token)
+
+
+class UsageLedger:
+    """Process-wide cumulative and rolling-window usage counters."""
+
+    def __init__(self, prices: Mapping[str, Tuple[float, float]], *, window_seconds: float = 3600.0) -> None:
+        self.prices = dict(prices)
+        self.window_seconds = window_seconds
+        self._totals: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        self._recent: Deque[UsageRecord] = deque()
+        self._lock = Lock()
+
+    def record(self, model: str, usage: Any, *, route: Optional[str] = None, persona: Optional[str] = None) -> Optional[UsageRecord]:
+        if usage is None:
+            return None
+        labels = _attribution.get()
+        prompt, completion, total = usage_tokens(usage)
+        record = UsageRecord(
+            route=labels.get("route") or route or UNKNOWN,
+            persona=labels.get("persona") or persona or UNKNOWN,
+            model=model or UNKNOWN,
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            total_tokens=total,
+            cost=estimate_cost(model or "", prompt, completion, self.prices),
+            timestamp=time.time(),
+        )
+        key = (record.route, record.persona, record.model)
+        with self._lock:
+            totals = self._totals.setdefault(
+                key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+            )
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt
+            totals["completion_tokens"] += completion
+            totals["total_tokens"] += total
+            totals["cost"] += record.cost
+            self._recent.append(record)
+            self._expire(record.timestamp)
+        collector = _collector.get()
+        if collector is not None:
+            collector.add(record)
+        return record
+
+    def summary(self, *, group_by: Sequence[str] = GROUP_FIELDS, window: bool = False) -> List[Dict[str, Any]]:
+        """Aggregate counters grouped by any of ``route``/``persona``/``model``.
+
+        With ``window=True`` only calls from the last ``window_seconds`` count.
+        """
+
+        fields = [name for name in group_by if name in GROUP_FIELDS]
+        groups: Dict[Tuple[str, ...], Dict[str, float]] = {}
+        with self._lock:
+            if window:
+                self._expire(time.time())
+                rows = [
+                    ((item.route, item.persona, item.model), {
+                        "calls": 1,
+                        "prompt_tokens": item.prompt_tokens,
+                        "completion_tokens": item.completion_tokens,
+                        "total_tokens": item.total_tokens,
+                        "cost": item.cost,
+                    })
+                    for item in self._recent
+                ]
+            else:
+                rows = [(key, dict(value)) for key, value in self._totals.items()]
+        for key, counters in rows:
+            labels = dict(zip(GROUP_FIELDS, key))
+            group = tuple(labels[name] for name in fields)
+            bucket = groups.setdefault(group, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0})
+            for name, value in counters.items():
+                bucket[name] += value
+        result = []
+        for group, counters in sorted(groups.items(), key=lambda item: item[1]["cost"], reverse=True):
+            result.append({**dict(zip(fields, group)), **counters, "cost": round(counters["cost"], 6)})
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+    def _expire(self, now: float) -> None:
+        while self._recent and now - self._recent[0].timestamp > self.window_seconds:
+            self._recent.popleft()
+
+
+def format_summary(rows: Sequence[Mapping[str, Any]]) -> str:
+    if not rows:
+        return "暂无模型用量记录。"
+    lines = []
+    for row in rows:
+        labels = " / ".join(str(row[name]) for name in GROUP_FIELDS if name in row)
+        lines.append(
+            f"- {labels}: {int(row['calls'])} 次调用, {int(row['total_tokens'])} tokens "
+            f"(输入 {int(row['prompt_tokens'])}, 输出 {int(row['completion_tokens'])}), 估算 ${row['cost']:.4f}"
+        )
+    return "\n".join(lines)
+
+
+usage_ledger = UsageLedger(MODEL_PRICES, window_seconds=USAGE_WINDOW_SECONDS)
+
+__all__ = [
+    "UsageCollector",
+    "UsageLedger",
+    "UsageRecord",
+    "attribute_usage",
+    "estimate_cost",
+    "format_summary",
+    "merge_usage",
+    "summarise_records",
+    "usage_ledger",
+    "usage_tokens",
+]
@@ -1,12 +1,50 @@
-"""Minimal HTTP API exposing the LangGraph agent."""
+"""Minimal HTTP API exposing the LangGraph agent.
+
+``POST /chat`` runs the graph inline. ``POST /tasks`` queues the request for
+the background worker instead, and ``GET /tasks/<id>?wait=<seconds>``
+long-polls its status: the reply is sent as soon as the task finishes.
+Sending an ``Idempotency-Key`` header (or ``dedup_key`` field) makes a
+retried or double-submitted ``POST /tasks`` return the original task.
+"""
 from __future__ import annotations
 
 import json
 from http import HTTPStatus
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from typing import Dict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from agent.checkpoint import CheckpointUnavailable
+from agent.graph import coalesced_graph, resume_thread, run_thread
+from agent.llm import hedged_caller
+from agent.memo import node_memo
+from agent.queue.bridge import QueueBridge
+from agent.queue.models import TaskPriority
+from agent.singleflight import llm_flight
+from agent.usage import GROUP_FIELDS, usage_ledger
+from config import API_TASK_WAIT_MAX, QUEUE_DB_PATH
+
+task_queue = QueueBridge(Path(QUEUE_DB_PATH))
+
+
+def _task_id(path: str) -> Optional[int]:
+    prefix, _, raw = path.rpartition("/")
+    return int(raw) if prefix == "/tasks" and raw.isdigit() else None
+
 
-from agent.graph import graph
+def _priority(value: Any) -> Optional[int]:
+    """Parse a ``POST /tasks`` priority: a :class:`TaskPriority` name or an integer in its range."""
+
+    if isinstance(value, str) and value.upper() in TaskPriority.__members__:
+        return TaskPriority[value.upper()]
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if min(TaskPriority) <= number <= max(TaskPriority) else None
 
 
 class AgentRequestHandler(BaseHTTPRequestHandler):
@@ -19,27 +57,108 @@ class AgentRequestHandler(BaseHTTPRequestHandler):
         self.wfile.write(body)
 
     def do_GET(self) -> None:  # pragma: no cover - exercised manually
-        if self.path == "/health":
+        url = urlparse(self.path)
+        if url.path == "/usage":
+            query = parse_qs(url.query)
+            group_by = [name for name in ",".join(query.get("group_by", [])).split(",") if name in GROUP_FIELDS]
+            recent = query.get("window", ["total"])[0] == "recent"
+            self._send_json(
+                HTTPStatus.OK,
+                {
+                    "window": f"last {usage_ledger.window_seconds:.0f}s" if recent else "total",
+                    "usage": usage_ledger.summary(group_by=group_by or GROUP_FIELDS, window=recent),
+                },
+            )
+        elif _task_id(url.path) is not None:
+            self._send_task(_task_id(url.path), parse_qs(url.query))
+        elif self.path == "/health":
             self._send_json(HTTPStatus.OK, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(
+                HTTPStatus.OK,
+                {
+                    "coalescing": {"graph": coalesced_graph.flight.stats(), "llm": llm_flight.stats()},
+                    "llm_slo": hedged_caller.stats(),
+                    "memo": node_memo.stats(),
+                },
+            )
         else:
             self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
 
+    def _send_task(self, task_id: int, query: Dict[str, Any]) -> None:
+        try:
+            wait = min(max(0.0, float(query.get("wait", ["0"])[0])), API_TASK_WAIT_MAX)
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "wait must be a number of seconds"})
+            return
+        if wait:
+            task = task_queue.call(lambda queue: queue.wait(task_id, wait))
+        else:
+            task = task_queue.call(lambda queue: queue.get(task_id))
+        if task is None:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": "no such task"})
+            return
+        self._send_json(HTTPStatus.OK, task.to_dict())
+
+    def _enqueue(self, payload: Dict[str, Any]) -> None:
+        user_input = str(payload.get("input", ""))
+        if not user_input:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "missing input"})
+            return
+        job = {"input": user_input}
+        if payload.get("thread_id"):
+            job["thread_id"] = str(payload["thread_id"])
+        priority = _priority(payload.get("priority", TaskPriority.NORMAL))
+        if priority is None:
+            names = ", ".join(member.name.lower() for member in TaskPriority)
+            self._send_json(
+                HTTPStatus.BAD_REQUEST,
+                {"error": f"priority must be one of {names} or an integer from {min(TaskPriority)} to {max(TaskPriority)}"},
+            )
+            return
+        tenant = payload.get("tenant") or job.get("thread_id")
+        dedup_key = self.headers.get("Idempotency-Key") or payload.get("dedup_key")
+        if not dedup_key:
+            task_id = task_queue.call(lambda queue: queue.enqueue(job, priority=priority, tenant=tenant))
+            self._send_json(HTTPStatus.ACCEPTED, {"id": task_id, "status": "pending", "location": f"/tasks/{task_id}"})
+            return
+        task, created = task_queue.call(
+            lambda queue: queue.enqueue_or_get(job, dedup_key=str(dedup_key), priority=priority, tenant=tenant)
+        )
+        body = dict(task.to_dict(), location=f"/tasks/{task.id}", duplicate=not created)
+        self._send_json(HTTPStatus.ACCEPTED if created else HTTPStatus.OK, body)
+
     def do_POST(self) -> None:  # pragma: no cover - exercised manually
-        if self.path != "/chat":
+        if self.path not in ("/chat", "/tasks"):
             self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
             return
         length = int(self.headers.get("Content-Length", "0"))
         payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/tasks":
+            self._enqueue(payload)
+            return
+        thread_id = payload.get("thread_id")
         user_input = str(payload.get("input", ""))
-        if not user_input:
+        if not user_input and not (thread_id and payload.get("resume")):
             self._send_json(HTTPStatus.BAD_REQUEST, {"error": "missing input"})
             return
-        result = graph.invoke({"input": user_input})
+        if not thread_id:
+            self._send_json(HTTPStatus.OK, coalesced_graph.invoke({"input": user_input}))
+            return
+        # Threads keep their own checkpointed state and history.
+        try:
+            if payload.get("resume"):
+                result = resume_thread(str(thread_id))
+            else:
+                result = run_thread(str(thread_id), user_input)
+        except CheckpointUnavailable as exc:
+            self._send_json(HTTPStatus.NOT_IMPLEMENTED, {"error": str(exc)})
+            return
         self._send_json(HTTPStatus.OK, result)
 
 
 def run(host: str = "0.0.0.0", port: int = 8080) -> None:  # pragma: no cover
-    server = HTTPServer((host, port), AgentRequestHandler)
+    server = ThreadingHTTPServer((host, port), AgentRequestHandler)
     print(f"Serving agent API on http://{host}:{port}")
     try:
         server.serve_forever()
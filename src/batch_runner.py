@@ -0,0 +1,336 @@
+"""Stream a JSONL file of inputs through the graph with bounded concurrency.
+
+Results are appended to an output JSONL as they finish, and a small checkpoint
+file records how far the run got so an interrupted run resumes where it
+stopped. Only a bounded window of lines is ever held in memory, so input size
+does not matter: at most ``max_in_flight`` lines run at once, and reading
+pauses while the oldest unfinished line is ``reorder_window`` lines behind,
+so one stuck line cannot make the checkpoint's ``done`` set grow without end.
+"""
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import os
+import random
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Set
+
+from config import BATCH_CHECKPOINT_EVERY, BATCH_CONCURRENCY, BATCH_REORDER_WINDOW, BATCH_WINDOW_FACTOR
+from agent.llm import BACKGROUND, use_lane
+
+Invoke = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+@dataclass
+class Checkpoint:
+    """Every line before ``watermark`` is finished; ``done`` holds finished lines after it.
+
+    ``input_offset`` is the byte offset of the watermark line and
+    ``output_offset`` the output size when the checkpoint was written.
+    """
+
+    input_path: str
+    watermark: int = 0
+    input_offset: int = 0
+    output_offset: int = 0
+    done: Set[int] = field(default_factory=set)
+
+    @classmethod
+    def load(cls, path: Path, input_path: Path) -> "Checkpoint":
+        source = str(input_path.resolve())
+        if not path.exists():
+            return cls(input_path=source)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("input_path") != source:
+            raise ValueError(f"checkpoint {path} belongs to {data.get('input_path')}, not {source}")
+        return cls(
+            input_path=source,
+            watermark=int(data["watermark"]),
+            input_offset=int(data["input_offset"]),
+            output_offset=int(data["output_offset"]),
+            done=set(data.get("done", [])),
+        )
+
+    def save(self, path: Path) -> None:
+        payload = {
+            "input_path": self.input_path,
+            "watermark": self.watermark,
+            "input_offset": self.input_offset,
+            "output_offset": self.output_offset,
+            "done": sorted(self.done),
+        }
+        temporary = path.with_name(path.name + ".tmp")
+        temporary.write_text(json.dumps(payload), encoding="utf-8")
+        os.replace(temporary, path)
+
+
+class LatencySample:
+    """Fixed-size reservoir sample so percentiles cost constant memory."""
+
+    def __init__(self, size: int = 10_000, *, seed: int = 0) -> None:
+        self.size = size
+        self.samples: List[float] = []
+        self.seen = 0
+        self._random = random.Random(seed)
+
+    def add(self, value: float) -> None:
+        self.seen += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+            return
+        slot = self._random.randrange(self.seen)
+        if slot < self.size:
+            self.samples[slot] = value
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class _Progress:
+    """Single-threaded bookkeeping of finished lines, output and checkpoints."""
+
+    def __init__(self, state: Checkpoint, sink: BinaryIO, path: Path, every: int) -> None:
+        self.state = state
+        self.sink = sink
+        self.path = path
+        self.every = max(1, every)
+        self.offsets: Dict[int, int] = {}
+        self.read_offset = state.input_offset
+        self._unsaved = 0
+
+    def finish(self, index: int, record: Optional[Dict[str, Any]]) -> None:
+        if record is not None:
+            self.sink.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        state = self.state
+        state.done.add(index)
+        while state.watermark in state.done:
+            state.done.discard(state.watermark)
+            self.offsets.pop(state.watermark, None)
+            state.watermark += 1
+        self._unsaved += 1
+        if self._unsaved >= self.every:
+            self.save()
+
+    def save(self) -> None:
+        self.sink.flush()
+        os.fsync(self.sink.fileno())
+        self.state.output_offset = self.sink.tell()
+        self.state.input_offset = self.offsets.get(self.state.watermark, self.read_offset)
+        self.state.save(self.path)
+        self._unsaved = 0
+
+
+class BatchRunner:
+    """Runs every line of a JSONL file through ``invoke`` on the background lane.
+
+    Each line is either a JSON object carrying ``input_field`` or a bare JSON
+    string. Failures are captured per line as ``{"status": "error"}`` records
+    instead of stopping the run.
+    """
+
+    def __init__(
+        self,
+        invoke: Invoke,
+        *,
+        concurrency: int = BATCH_CONCURRENCY,
+        max_in_flight: Optional[int] = None,
+        reorder_window: int = BATCH_REORDER_WINDOW,
+        checkpoint_every: int = BATCH_CHECKPOINT_EVERY,
+        input_field: str = "input",
+        id_field: str = "id",
+    ) -> None:
+        self.invoke = invoke
+        self.concurrency = max(1, concurrency)
+        self.max_in_flight = max(self.concurrency, max_in_flight or self.concurrency * BATCH_WINDOW_FACTOR)
+        self.reorder_window = max(self.max_in_flight, reorder_window)
+        self.checkpoint_every = checkpoint_every
+        self.input_field = input_field
+        self.id_field = id_field
+
+    def run(
+        self,
+        input_path: Path,
+        output_path: Path,
+        *,
+        checkpoint_path: Optional[Path] = None,
+        restart: bool = False,
+    ) -> Dict[str, Any]:
+        checkpoint_path = checkpoint_path or output_path.with_name(output_path.name + ".ckpt")
+        if restart:
+            checkpoint_path.unlink(missing_ok=True)
+            output_path.unlink(missing_ok=True)
+        state = Checkpoint.load(checkpoint_path, input_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        _recover_output(output_path, state)
+        resumed_at = state.watermark
+
+        counters = {"ok": 0, "error": 0, "skipped": 0, "tokens": 0}
+        latencies = LatencySample()
+        started = time.perf_counter()
+        pending: Dict[Future, int] = {}
+        with input_path.open("rb") as source, output_path.open("ab") as sink, ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="batch"
+        ) as pool:
+            progress = _Progress(state, sink, checkpoint_path, self.checkpoint_every)
+            source.seek(state.input_offset)
+            index = state.watermark
+            try:
+                while True:
+                    # Lines before the watermark are either running or pending, so draining moves it on.
+                    while pending and index - state.watermark >= self.reorder_window:
+                        self._drain(pending, progress, counters, latencies, FIRST_COMPLETED)
+                    offset = source.tell()
+                    raw = source.readline()
+                    if not raw:
+                        break
+                    progress.offsets[index] = offset
+                    progress.read_offset = source.tell()
+                    if index in state.done:
+                        counters["skipped"] += 1
+                        progress.finish(index, None)
+                    elif not raw.strip():
+                        progress.finish(index, None)
+                    else:
+                        while len(pending) >= self.max_in_flight:
+                            self._drain(pending, progress, counters, latencies, FIRST_COMPLETED)
+                        future = pool.submit(contextvars.copy_context().run, self._process, index, raw)
+                        pending[future] = index
+                    index += 1
+                self._drain(pending, progress, counters, latencies, ALL_COMPLETED)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+            finally:
+                progress.save()
+
+        elapsed = time.perf_counter() - started
+        processed = counters["ok"] + counters["error"]
+        return {
+            "processed": processed,
+            "ok": counters["ok"],
+            "errors": counters["error"],
+            "resumed_at": resumed_at,
+            "skipped": counters["skipped"],
+            "tokens": counters["tokens"],
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(processed / elapsed, 3) if elapsed > 0 else None,
+            "latency_ms": {
+                "p50": latencies.percentile(50),
+                "p95": latencies.percentile(95),
+                "max": max(latencies.samples, default=None),
+            },
+        }
+
+    def _drain(
+        self,
+        pending: Dict[Future, int],
+        progress: _Progress,
+        counters: Dict[str, int],
+        latencies: LatencySample,
+        return_when: str,
+    ) -> None:
+        if not pending:
+            return
+        finished, _ = wait(list(pending), return_when=return_when)
+        for future in finished:
+            index = pending.pop(future)
+            record = future.result()
+            counters[record["status"]] += 1
+            counters["tokens"] += record.get("tokens") or 0
+            latencies.add(record["latency_ms"])
+            progress.finish(index, record)
+
+    def _process(self, index: int, raw: bytes) -> Dict[str, Any]:
+        started = time.perf_counter()
+        record: Dict[str, Any] = {"index": index}
+        try:
+            item = json.loads(raw)
+            if isinstance(item, dict):
+                if self.id_field in item:
+                    record["id"] = item[self.id_field]
+                text = item.get(self.input_field)
+            else:
+                text = item
+            if not isinstance(text, str) or not text.strip():
+                raise ValueError(f"line has no {self.input_field!r} text")
+            with use_lane(BACKGROUND):
+                result = self.invoke({"input": text})
+            metadata = result.get("metadata", {})
+            record.update(
+                status="ok",
+                route=result.get("route"),
+                response=result.get("response", ""),
+                tokens=metadata.get("tokens"),
+            )
+        except Exception as exc:
+            record.update(status="error", error=f"{type(exc).__name__}: {exc}")
+        record["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return record
+
+
+def _recover_output(output_path: Path, state: Checkpoint) -> None:
+    """Fold results written after the last checkpoint back into ``state``.
+
+    A partially written trailing line (from a crash mid-write) is truncated.
+    """
+
+    if not output_path.exists():
+        return
+    with output_path.open("r+b") as handle:
+        handle.seek(0, os.SEEK_END)
+        if handle.tell() < state.output_offset:
+            raise ValueError(f"{output_path} is shorter than its checkpoint; rerun with --restart")
+        handle.seek(state.output_offset)
+        while True:
+            offset = handle.tell()
+            line = handle.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                handle.truncate(offset)
+                break
+            index = json.loads(line)["index"]
+            if index >= state.watermark:
+                state.done.add(index)
+
+
+def main(argv: Optional[List[str]] = None) -> None:  # pragma: no cover - CLI wrapper
+    parser = argparse.ArgumentParser(description="Run a JSONL file of inputs through the agent graph.")
+    parser.add_argument("input", type=Path, help="JSONL file, one request per line")
+    parser.add_argument("output", type=Path, help="JSONL file receiving one result per line")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--reorder-window", type=int, default=BATCH_REORDER_WINDOW)
+    parser.add_argument("--checkpoint", type=Path, default=None, help="defaults to <output>.ckpt")
+    parser.add_argument("--checkpoint-every", type=int, default=BATCH_CHECKPOINT_EVERY)
+    parser.add_argument("--input-field", default="input")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    from agent.graph import coalesced_graph
+
+    runner = BatchRunner(
+        coalesced_graph.invoke,
+        concurrency=args.concurrency,
+        max_in_flight=args.max_in_flight,
+        reorder_window=args.reorder_window,
+        checkpoint_every=args.checkpoint_every,
+        input_field=args.input_field,
+        id_field=args.id_field,
+    )
+    summary = runner.run(args.input, args.output, checkpoint_path=args.checkpoint, restart=args.restart)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
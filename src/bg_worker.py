@@ -1,34 +1,214 @@
-"""Background worker that pulls tasks from the queue and executes the graph."""
+"""Background worker that pulls tasks from the queue and executes the graph.
+
+Up to ``WORKER_CONCURRENCY`` tasks run at once on a bounded thread pool, so
+the blocking graph call never stalls the event loop: claiming new work,
+heartbeats and shutdown handling keep running while tasks are in progress.
+When idle the worker sleeps until new work is announced or the next delayed
+task or schedule falls due, whichever comes first.
+"""
 from __future__ import annotations
 
 import asyncio
+import contextvars
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, Optional
 
-from agent.graph import graph
+from agent.graph import coalesced_graph, run_thread
+from agent.llm import BACKGROUND, use_lane
 from agent.queue.engine import AsyncTaskQueue
+from agent.queue.notify import IdleBackoff
+from agent.queue.reminders import REMINDER_KIND, deliver_reminder
+from config import (
+    QUEUE_DB_PATH,
+    QUEUE_POLL_MAX,
+    QUEUE_POLL_MIN,
+    WORKER_CONCURRENCY,
+    WORKER_HEARTBEAT_INTERVAL,
+    WORKER_SHUTDOWN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+Invoke = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def run_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one queued request through the graph (blocking)."""
+
+    if payload.get("kind") == REMINDER_KIND:
+        return deliver_reminder(payload)
+    with use_lane(BACKGROUND):
+        if payload.get("thread_id"):
+            return run_thread(payload["thread_id"], payload["input"])
+        return coalesced_graph.invoke({"input": payload["input"]})
 
 
-async def process_task(queue: AsyncTaskQueue, task_id: int, payload: Dict[str, str]) -> None:
+async def process_task(
+    queue: AsyncTaskQueue,
+    task_id: int,
+    payload: Dict[str, Any],
+    *,
+    attempt: Optional[int] = None,
+    executor: Optional[ThreadPoolExecutor] = None,
+    invoke: Invoke = run_payload,
+) -> None:
+    """Run one claimed task; ``attempt`` is the claim's lease, checked when the outcome is recorded."""
+
+    loop = asyncio.get_running_loop()
     try:
-        result = graph.invoke({"input": payload["input"]})
-        await queue.complete(task_id, result)
-    except Exception as exc:  # pragma: no cover - defensive
-        await queue.fail(task_id, str(exc))
+        # run_in_executor does not carry context variables into the thread; copy them explicitly.
+        result = await loop.run_in_executor(executor, contextvars.copy_context().run, invoke, payload)
+        if not await queue.complete(task_id, result, attempt=attempt):
+            logger.warning("任务 %s 的租约已失效（已被回收或重新认领），丢弃本次结果", task_id)
+    except Exception as exc:
+        # Retried with backoff until the queue's attempt limit, then dead-lettered.
+        try:
+            status = await queue.fail(task_id, str(exc), retry=True, attempt=attempt)
+        except Exception:
+            # Neither outcome was stored; the lease runs out and the reaper requeues the task.
+            logger.exception("任务 %s 的失败无法写入队列（原始错误: %r），租约过期后将被回收", task_id, exc)
+            return
+        if status is None:
+            logger.warning("任务 %s 的租约已失效，忽略本次失败: %s", task_id, exc)
+
+
+class Worker:
+    """Claims tasks while fewer than ``concurrency`` are running and executes them concurrently."""
+
+    def __init__(
+        self,
+        queue: AsyncTaskQueue,
+        *,
+        concurrency: int = WORKER_CONCURRENCY,
+        heartbeat_interval: float = WORKER_HEARTBEAT_INTERVAL,
+        shutdown_timeout: float = WORKER_SHUTDOWN_TIMEOUT,
+        invoke: Invoke = run_payload,
+    ) -> None:
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.heartbeat_interval = heartbeat_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.invoke = invoke
+        self.processed = 0
+        self._running: Dict[int, asyncio.Task] = {}
+        # Lease (claim attempts value) of each running task.
+        self._leases: Dict[int, int] = {}
+        self._stopping = asyncio.Event()
+        self._backoff = IdleBackoff(QUEUE_POLL_MIN, QUEUE_POLL_MAX)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    def stop(self) -> None:
+        """Stop claiming new tasks; running tasks are allowed to finish."""
 
+        self._stopping.set()
 
-async def worker_loop(db_path: Path) -> None:
+    async def run(self, *, drain: bool = False) -> None:
+        """Process tasks until :meth:`stop` is called (or, with ``drain``, until the queue is empty)."""
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bg-worker")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while not self._stopping.is_set():
+                free = self.concurrency - len(self._running)
+                if free <= 0:
+                    await self._wait(set(self._running.values()))
+                    continue
+                await self.queue.tick_schedules()
+                tasks = await self.queue.acquire_batch(free)
+                if not tasks:
+                    if drain and not self._running:
+                        break
+                    # Wake on new work, the next due time, a finished task (a free slot) or shutdown;
+                    # polling is the safety net.
+                    timeout = self._backoff.next()
+                    due_in = await self.queue.next_due_in()
+                    if due_in is not None:
+                        timeout = min(timeout, due_in)
+                    woken = asyncio.ensure_future(self.queue.wait_for_work(timeout))
+                    await self._wait({woken, *self._running.values()})
+                    if woken.done() and not woken.cancelled() and woken.result():
+                        self._backoff.reset()
+                    continue
+                self._backoff.reset()
+                for task in tasks:
+                    self._start(int(task.id), task.payload, task.attempts, executor)
+        finally:
+            await self._shutdown(executor, heartbeat)
+
+    def _start(self, task_id: int, payload: Dict[str, Any], attempt: int, executor: ThreadPoolExecutor) -> None:
+        job = asyncio.create_task(
+            process_task(self.queue, task_id, payload, attempt=attempt, executor=executor, invoke=self.invoke)
+        )
+        self._running[task_id] = job
+        self._leases[task_id] = attempt
+
+        def _done(_: asyncio.Task) -> None:
+            self._running.pop(task_id, None)
+            self._leases.pop(task_id, None)
+            self.processed += 1
+
+        job.add_done_callback(_done)
+
+    async def _wait(self, futures: set) -> None:
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait({stopping, *futures}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for future in (stopping, *futures):
+                # Only helper futures are cancelled; running tasks are never interrupted.
+                if future not in self._running.values() and not future.done():
+                    future.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            try:
+                await self._beat()
+            except Exception:
+                # A failed beat (e.g. the database is busy) must not end the heartbeat for good.
+                logger.exception("worker 心跳失败，%.1f 秒后重试", self.heartbeat_interval)
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _beat(self) -> None:
+        if self._running:
+            lost = await self.queue.touch(list(self._running), attempts=self._leases)
+            if lost:
+                logger.warning("任务 %s 的租约已失效，其结果将被丢弃", lost)
+        # Every worker also reaps: tasks of a crashed worker return once their lease expires.
+        reaped = await self.queue.reap_expired()
+        if any(reaped.values()):
+            logger.info("回收租约过期的任务: %s", reaped)
+        logger.debug("worker heartbeat: %d running, %d processed", len(self._running), self.processed)
+
+    async def _shutdown(self, executor: ThreadPoolExecutor, heartbeat: asyncio.Task) -> None:
+        if self._running:
+            logger.info("等待 %d 个运行中的任务完成后退出", len(self._running))
+            _, pending = await asyncio.wait(set(self._running.values()), timeout=self.shutdown_timeout)
+            if pending:
+                logger.warning("%d 个任务未能在 %.0f 秒内完成，将保持运行中状态", len(pending), self.shutdown_timeout)
+        heartbeat.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def worker_loop(db_path: Path, *, concurrency: int = WORKER_CONCURRENCY) -> None:
     queue = AsyncTaskQueue(db_path)
+    worker = Worker(queue, concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, worker.stop)
+        except (NotImplementedError, RuntimeError):  # pragma: no cover - e.g. Windows
+            pass
     try:
-        while True:
-            task = await queue.acquire()
-            if task is None:
-                await asyncio.sleep(0.2)
-                continue
-            await process_task(queue, int(task.id), task.payload)
+        await worker.run()
     finally:
         await queue.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
-    asyncio.run(worker_loop(Path("queue.db")))
+    asyncio.run(worker_loop(Path(QUEUE_DB_PATH)))
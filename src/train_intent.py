@@ -0,0 +1,79 @@
+"""Train the routing intent classifier from labelled examples and logged traffic.
+
+Usage::
+
+    python -m src.train_intent --log outputs/routing_log.jsonl
+
+Seed examples (``data/intent/examples.jsonl``) are always included. Routing
+log lines contribute their logged route only when the decision came from one
+of ``--sources`` (keyword hits by default); a ``label`` field added to a log
+line by hand always wins, which is how misroutes get corrected.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config import INTENT_MODEL_PATH, ROUTING_LOG_PATH
+from agent.intent import DEFAULT_DIMENSIONS, IntentClassifier, read_examples
+
+DEFAULT_EXAMPLES_PATH = Path(__file__).resolve().parent.parent / "data" / "intent" / "examples.jsonl"
+
+
+def collect_examples(
+    examples_path: Optional[Path],
+    log_paths: List[Path],
+    sources: Optional[List[str]],
+) -> List[Tuple[str, str]]:
+    examples: List[Tuple[str, str]] = []
+    if examples_path is not None and examples_path.exists():
+        examples.extend(read_examples(examples_path))
+    for path in log_paths:
+        if path.exists():
+            examples.extend(read_examples(path, sources=sources))
+    # Later lines (newer log entries, hand corrections) win for duplicate inputs.
+    return list(dict(examples).items())
+
+
+def holdout_accuracy(examples: List[Tuple[str, str]], *, every: int = 5, dimensions: int = DEFAULT_DIMENSIONS) -> Optional[float]:
+    """Accuracy on every ``every``-th example when trained on the rest."""
+
+    held = examples[::every]
+    rest = [example for index, example in enumerate(examples) if index % every]
+    if not held or len({label for _, label in rest}) < 2:
+        return None
+    model = IntentClassifier.train(rest, dimensions=dimensions)
+    return sum(model.predict(text)[0] == label for text, label in held) / len(held)
+
+
+def main(argv: Optional[List[str]] = None) -> None:  # pragma: no cover - CLI wrapper
+    parser = argparse.ArgumentParser(description="Train the routing intent classifier.")
+    parser.add_argument("--examples", type=Path, default=DEFAULT_EXAMPLES_PATH, help="labelled seed examples (JSONL)")
+    parser.add_argument("--log", type=Path, action="append", default=None, help="routing log(s) to learn from")
+    parser.add_argument("--sources", default="keyword", help="comma-separated decision sources trusted as labels")
+    parser.add_argument("--output", type=Path, default=Path(INTENT_MODEL_PATH or "outputs/intent_model.npz"))
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS)
+    parser.add_argument("--alpha", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    logs = args.log if args.log is not None else ([Path(ROUTING_LOG_PATH)] if ROUTING_LOG_PATH else [])
+    sources = [item.strip() for item in args.sources.split(",") if item.strip()] or None
+    examples = collect_examples(args.examples, logs, sources)
+    if not examples:
+        parser.error("没有可用的训练样本")
+    model = IntentClassifier.train(examples, dimensions=args.dimensions, alpha=args.alpha)
+    model.save(args.output)
+    report = {
+        "output": str(args.output),
+        "examples": len(examples),
+        "labels": dict(Counter(label for _, label in examples)),
+        "holdout_accuracy": holdout_accuracy(examples, dimensions=args.dimensions),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
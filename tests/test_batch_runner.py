@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import threading
+
+import pytest
+
+from batch_runner import BatchRunner, Checkpoint
+from agent.llm import BACKGROUND, current_lane
+
+
+class Crash(BaseException):
+    pass
+
+
+def _write_inputs(path, count):
+    lines = [json.dumps({"id": f"r{i}", "input": f"问题 {i}"}, ensure_ascii=False) for i in range(count)]
+    lines.insert(3, "")
+    lines.append("not json")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def _results(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_batch_runner_writes_results_and_summary(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_inputs(source, 10)
+    lanes = set()
+
+    def invoke(state):
+        lanes.add(current_lane())
+        if state["input"] == "问题 4":
+            raise RuntimeError("boom")
+        return {"route": "chat", "response": state["input"].upper(), "metadata": {"tokens": 3}}
+
+    summary = BatchRunner(invoke, concurrency=3, max_in_flight=4).run(source, output)
+
+    records = _results(output)
+    assert summary["processed"] == 11 and summary["ok"] == 9 and summary["errors"] == 2
+    assert summary["tokens"] == 27 and summary["latency_ms"]["p95"] is not None
+    assert sorted(record["index"] for record in records) == [i for i in range(12) if i != 3]
+    errors = {record.get("id"): record["error"] for record in records if record["status"] == "error"}
+    assert "boom" in errors["r4"] and "JSONDecodeError" in errors[None]
+    assert lanes == {BACKGROUND}
+    state = Checkpoint.load(tmp_path / "out.jsonl.ckpt", source)
+    assert state.watermark == 12 and not state.done
+
+
+def test_batch_runner_resumes_after_crash(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_inputs(source, 20)
+    calls = []
+    lock = threading.Lock()
+
+    def crashing(state):
+        with lock:
+            calls.append(state["input"])
+        if state["input"] == "问题 12":
+            raise Crash()
+        return {"response": "ok", "metadata": {}}
+
+    with pytest.raises(Crash):
+        BatchRunner(crashing, concurrency=2, checkpoint_every=2).run(source, output)
+    first_run = len(_results(output))
+
+    summary = BatchRunner(lambda state: {"response": "ok", "metadata": {}}, concurrency=2).run(source, output)
+
+    indices = [record["index"] for record in _results(output)]
+    assert len(indices) == len(set(indices)) == 21
+    assert summary["resumed_at"] > 0
+    assert summary["processed"] == 21 - first_run
+
+
+def test_batch_runner_pauses_reading_behind_a_stuck_line(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    source.write_text("".join(json.dumps(f"q{i}") + "\n" for i in range(30)), encoding="utf-8")
+    release = threading.Event()
+    started, seen_while_stuck = [], []
+
+    def invoke(state):
+        started.append(int(state["input"][1:]))
+        if state["input"] == "q0":
+            release.wait(5)
+            seen_while_stuck.extend(started)
+        return {"response": state["input"]}
+
+    threading.Timer(0.2, release.set).start()
+    summary = BatchRunner(invoke, concurrency=2, max_in_flight=2, reorder_window=6).run(source, output)
+    assert summary["ok"] == 30
+    # While line 0 was stuck, nothing at or past the window was read.
+    assert max(seen_while_stuck) == 5
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bg_worker
+from agent.llm import BACKGROUND, current_lane, use_lane
+from agent.queue.engine import AsyncTaskQueue
+from agent.queue.reminders import schedule_task_reminder
+from agent.tools.tasks import TaskManager
+from bg_worker import Worker
+
+
+def test_worker_runs_tasks_concurrently_off_the_loop(tmp_path):
+    barrier = threading.Barrier(3, timeout=5)
+    lanes = []
+
+    def invoke(payload):
+        lanes.append(current_lane())
+        barrier.wait()  # only passes if three tasks are in flight at once
+        return {"response": payload["input"].upper()}
+
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        ids = await queue.enqueue_many({"input": name} for name in ("a", "b", "c"))
+        worker = Worker(queue, concurrency=3, invoke=invoke)
+        with use_lane(BACKGROUND):
+            await worker.run(drain=True)
+        assert worker.processed == 3
+        assert await queue.pending_count() == 0
+        rows = queue._connection.execute("SELECT id, result FROM tasks ORDER BY id").fetchall()
+        await queue.close()
+        return ids, rows
+
+    ids, rows = asyncio.run(_run())
+    assert [row["id"] for row in rows] == ids
+    assert [row["result"] for row in rows] == ['{"response": "A"}', '{"response": "B"}', '{"response": "C"}']
+    # Context variables set around the worker reach the executor threads.
+    assert lanes == [BACKGROUND] * 3
+
+
+def test_worker_stop_waits_for_running_tasks(tmp_path):
+    started = threading.Event()
+    release = threading.Event()
+
+    def invoke(payload):
+        started.set()
+        release.wait(5)
+        return {"ok": True}
+
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        await queue.enqueue({"input": "slow"})
+        worker = Worker(queue, concurrency=2, invoke=invoke)
+        runner = asyncio.create_task(worker.run())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        assert worker.in_flight == 1
+        worker.stop()
+        await asyncio.sleep(0.05)
+        assert not runner.done()  # still draining the running task
+        release.set()
+        await asyncio.wait_for(runner, 5)
+        assert await queue.pending_count() == 0
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_worker_wakes_for_due_reminders(tmp_path, monkeypatch):
+    # Idle polling is slow here, so only the due-time wakeup can deliver the reminder in time.
+    monkeypatch.setattr(bg_worker, "QUEUE_POLL_MIN", 30)
+    monkeypatch.setattr(bg_worker, "QUEUE_POLL_MAX", 30)
+    task = TaskManager(tmp_path / "tasks.json").add_task("交周报", due=datetime.now() + timedelta(minutes=15, seconds=0.3))
+
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        reminder_id, created = await schedule_task_reminder(queue, task, lead=timedelta(minutes=15))
+        assert created
+        worker = Worker(queue)
+        runner = asyncio.create_task(worker.run())
+        started = time.monotonic()
+        while not worker.processed and time.monotonic() - started < 5:
+            await asyncio.sleep(0.02)
+        elapsed = time.monotonic() - started
+        worker.stop()
+        await asyncio.wait_for(runner, 5)
+        reminder = await queue.get(reminder_id)
+        await queue.close()
+        return elapsed, reminder
+
+    elapsed, reminder = asyncio.run(_run())
+    assert 0.2 < elapsed < 2
+    assert reminder.result["response"].startswith("⏰ 提醒：任务 #1 交周报")
+
+
+class _BrokenQueue:
+    """Queue whose writes fail, as when the database stays locked."""
+
+    def __init__(self) -> None:
+        self.reaps = 0
+
+    async def complete(self, task_id, result, *, attempt=None):
+        raise RuntimeError("complete failed")
+
+    async def fail(self, task_id, error, *, retry=False, attempt=None):
+        raise RuntimeError("fail failed")
+
+    async def reap_expired(self):
+        self.reaps += 1
+        raise RuntimeError("database is locked")
+
+
+def test_unrecordable_outcomes_and_heartbeat_errors_are_logged(caplog):
+    queue = _BrokenQueue()
+
+    async def _run():
+        await bg_worker.process_task(queue, 7, {"input": "x"}, invoke=lambda payload: {"ok": True})
+        heartbeat = asyncio.create_task(Worker(queue, heartbeat_interval=0.01)._heartbeat())
+        await asyncio.sleep(0.1)
+        assert not heartbeat.done()
+        heartbeat.cancel()
+
+    with caplog.at_level("ERROR", logger="bg_worker"):
+        asyncio.run(_run())
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("任务 7" in message and "complete failed" in message for message in messages)
+    assert queue.reaps > 1 and any("心跳失败" in message for message in messages)
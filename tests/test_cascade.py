@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import types
+
+import config
+import memory
+from agent import graph as agent_graph
+from agent import nodes
+from agent.cascade import ModelCascade, ModelSelector
+from agent.personas.loader import Persona
+
+
+def _completion(text: str, finish_reason: str = "stop"):
+    choice = types.SimpleNamespace(message=types.SimpleNamespace(content=text), finish_reason=finish_reason)
+    return types.SimpleNamespace(choices=[choice])
+
+
+def test_selector_prefers_persona_then_route():
+    selector = ModelSelector({"chat": "route-model"}, "default-model")
+    persona = Persona(id="p", name="P", description="d", style="s")
+    assert selector.select("chat", persona) == "route-model"
+    assert selector.select("plan", persona) == "default-model"
+    persona.model = "persona-model"
+    assert selector.select("chat", persona) == "persona-model"
+
+
+def test_cascade_accepts_confident_small_answer():
+    calls = []
+    cascade = ModelCascade("small")
+    result = cascade.run(lambda model: calls.append(model) or _completion("清晰的回答"), "large", 10)
+    assert calls == ["small"]
+    assert result.model == "small"
+    assert result.tiers[0]["accepted"]
+
+
+def test_cascade_escalates_on_uncertain_or_truncated_answer():
+    answers = {"small": _completion("I'm not sure about that"), "large": _completion("Definite answer")}
+    result = ModelCascade("small").run(lambda model: answers[model], "large", 10)
+    assert [tier["model"] for tier in result.tiers] == ["small", "large"]
+    assert result.tiers[0]["reason"] == "uncertain"
+    assert result.model == "large"
+
+    answers["small"] = _completion("partial", finish_reason="length")
+    assert ModelCascade("small").run(lambda model: answers[model], "large", 10).tiers[0]["reason"] == "truncated"
+
+
+def test_cascade_skips_small_model_for_long_prompts():
+    result = ModelCascade("small", max_prompt_tokens=5).run(lambda model: _completion("ok"), "large", 50)
+    assert [tier["model"] for tier in result.tiers] == ["large"]
+
+
+def test_chat_records_cascade_metadata(monkeypatch):
+    memory.clear_history()
+    monkeypatch.setattr(nodes, "CASCADE_ENABLED", True)
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda **kwargs: _completion("好的"))
+    result = agent_graph.graph.invoke({"input": "普通对话"})
+    cascade = result["metadata"]["cascade"]
+    assert cascade["model"] == config.CASCADE_SMALL_MODEL
+    assert "latency_ms" in cascade["tiers"][0]
+    assert result["artifacts"]["model"] == config.CASCADE_SMALL_MODEL
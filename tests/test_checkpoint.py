@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+
+import config
+import memory
+from agent import graph as agent_graph
+from agent import nodes
+
+
+def _completion(text: str):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))])
+
+
+def test_thread_history_comes_from_checkpoint(monkeypatch):
+    memory.clear_history()
+    compiled = agent_graph.build_graph(checkpointer=MemorySaver())
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs["messages"])
+        return _completion(f"回答{len(requests)}")
+
+    monkeypatch.setattr(config.client.chat.completions, "create", create)
+    first = agent_graph.run_thread("t1", "你好", compiled=compiled)
+    second = agent_graph.run_thread("t1", "再说一次", compiled=compiled)
+
+    assert first["response"] == "回答1" and second["response"] == "回答2"
+    assert {"role": "assistant", "content": "回答1"} in [
+        {"role": item["role"], "content": item["content"]} for item in requests[1]
+    ]
+    assert [turn["content"] for turn in second["history"]] == ["你好", "回答1", "再说一次", "回答2"]
+    assert len(second["metadata"]["trace"]) == 3 and second["metadata"]["trace_id"] != first["metadata"]["trace_id"]
+    assert memory.get_history() == []
+    other = agent_graph.run_thread("t2", "你好", compiled=compiled)
+    assert len(other["history"]) == 2
+
+
+def test_resume_does_not_repeat_completed_model_calls(monkeypatch):
+    memory.clear_history()
+    compiled = agent_graph.build_graph(checkpointer=MemorySaver())
+    calls = []
+    monkeypatch.setattr(
+        config.client.chat.completions, "create", lambda **kwargs: calls.append(kwargs) or _completion("答复")
+    )
+    failures = iter([RuntimeError("crash")])
+
+    def flaky_count(text, model=None):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return len(text)
+
+    monkeypatch.setattr(nodes, "count_tokens", flaky_count)
+    with pytest.raises(RuntimeError):
+        agent_graph.run_thread("t1", "普通对话", compiled=compiled)
+    assert compiled.get_state({"configurable": {"thread_id": "t1"}}).next == ("finalize",)
+
+    result = agent_graph.resume_thread("t1", compiled=compiled)
+    assert result["response"] == "答复" and len(calls) == 1
+    assert agent_graph.resume_thread("t1", compiled=compiled)["response"] == "答复"
+
+
+def test_concurrent_turns_on_one_thread_keep_both(monkeypatch):
+    memory.clear_history()
+    compiled = agent_graph.build_graph(checkpointer=MemorySaver())
+    replies = iter(["回答1", "回答2"])
+
+    def create(**kwargs):
+        time.sleep(0.1)  # keep the first turn running while the second arrives
+        return _completion(next(replies))
+
+    monkeypatch.setattr(config.client.chat.completions, "create", create)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        turns = [pool.submit(agent_graph.run_thread, "t1", text, compiled=compiled) for text in ("你好", "再说一次")]
+        results = [turn.result() for turn in turns]
+
+    final = compiled.get_state({"configurable": {"thread_id": "t1"}}).values
+    assert len(final["history"]) == 4
+    assert sorted(len(result["history"]) for result in results) == [2, 4]
+    assert agent_graph._thread_locks == {}
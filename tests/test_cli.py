@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import asyncio
+import time
 import types
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import main
 import memory
+from agent.queue.bridge import QueueBridge
+from agent.queue.reminders import deliver_reminder, reminder_payload, schedule_task_reminder
 from agent.tools.calendar import CalendarClient
 from agent.tools.tasks import TaskManager
 
@@ -64,6 +68,57 @@ def test_task_commands(tmp_path):
     assert "任务 1" in done_response
 
 
+def test_reminders_are_cancelled_with_their_task_or_event(monkeypatch, tmp_path):
+    if hasattr(main.calendar_client, "close"):
+        main.calendar_client.close()
+    main.calendar_client = CalendarClient(tmp_path / "calendar.db")
+    main.task_manager = TaskManager(tmp_path / "tasks.json")
+    monkeypatch.setattr(main, "REMINDER_QUEUE_ENABLED", True)
+    monkeypatch.setattr(main, "reminder_queue", QueueBridge(tmp_path / "queue.db"))
+
+    def pending():
+        return main.reminder_queue.call(lambda queue: queue.pending_count())
+
+    start = datetime.now() + timedelta(days=1)
+    end = start + timedelta(hours=1)
+    window = f"{start.strftime('%Y-%m-%d %H:%M')}; {end.strftime('%Y-%m-%d %H:%M')}"
+
+    assert "已设置提醒" in main.handle_user_input(f"/schedule 评审; {window}")[0]
+    assert "已设置提醒" in main.handle_user_input(f"/task add 准备材料; {start.strftime('%Y-%m-%d %H:%M')}")[0]
+    assert pending() == 2
+    task = main.task_manager.get_task(1)
+    again = main._queue_reminder(lambda queue: schedule_task_reminder(queue, task, lead=timedelta(minutes=15)))
+    assert again == "，提醒已存在"
+    assert pending() == 2
+    main.handle_user_input("/task done 1")
+    assert pending() == 1
+    assert main.handle_user_input("/unschedule 1")[0] == "已删除日程 1。"
+    assert pending() == 0
+    assert main.handle_user_input("/unschedule 1")[0] == "未找到对应的日程 ID。"
+
+
+def test_cli_shows_reminders_delivered_by_the_worker(monkeypatch, tmp_path, capsys):
+    memory.clear_history()
+    bridge = QueueBridge(tmp_path / "queue.db")
+    follower = bridge.spawn(main._follow_reminders)
+
+    async def _deliver(queue):
+        # Give the follower time to subscribe, then act as the worker would.
+        await asyncio.sleep(0.1)
+        await queue.enqueue(reminder_payload("任务 #1 交周报 将于 10:00 截止", source="task", ref=1))
+        task = await queue.acquire()
+        await queue.complete(task.id, deliver_reminder(task.payload))
+
+    bridge.call(_deliver)
+    started = time.monotonic()
+    while not memory.get_history() and time.monotonic() - started < 5:
+        time.sleep(0.02)
+    follower.cancel()
+    assert memory.get_history()[-1]["content"] == "⏰ 提醒：任务 #1 交周报 将于 10:00 截止"
+    assert "⏰ 提醒：任务 #1 交周报" in capsys.readouterr().out
+    memory.clear_history()
+
+
 def test_remind_combines_tasks_and_events(tmp_path):
     if hasattr(main.calendar_client, "close"):
         main.calendar_client.close()
@@ -44,3 +44,48 @@ def test_graph_research(monkeypatch):
     monkeypatch.setattr(agent_graph.components.research.knowledge_base.store, "similarity_search", lambda query, k=3: [])
     findings = agent_graph.components.research.run("LangGraph 是什么？")
     assert isinstance(findings, list)
+
+
+def test_graph_fans_out_to_parallel_branches(monkeypatch):
+    memory.clear_history()
+    monkeypatch.setattr(agent_graph.components.summarise, "summariser", lambda text: "摘要内容")
+    result = agent_graph.graph.invoke({"input": "请总结并plan一下发布"})
+    assert result["routes"] == ["summarise", "plan"]
+    assert "【摘要】" in result["response"] and "【规划】" in result["response"]
+    assert "summary" in result["artifacts"] and "plan" in result["artifacts"]
+    assert result["metadata"]["branches"]["plan"]["status"] == "ok"
+
+
+def test_slow_branch_is_dropped(monkeypatch):
+    import time
+
+    from agent import nodes
+
+    monkeypatch.setattr(nodes, "BRANCH_TIMEOUT", 0.05)
+    components = types.SimpleNamespace(summarise=types.SimpleNamespace(run=lambda text: time.sleep(0.3) or "late"))
+    update = nodes.build_branch_node(components, "summarise")({"input": "x"})
+    assert update["branches"]["summarise"]["status"] == "dropped"
+
+    join = nodes.build_join_node()
+    state = {
+        "routes": ["summarise", "plan"],
+        "branches": {**update["branches"], "plan": {"status": "ok", "response": "步骤", "artifacts": {"plan": []}}},
+    }
+    merged = join(state)
+    assert merged["response"] == "【规划】\n步骤"
+    assert merged["artifacts"]["dropped_routes"] == ["summarise"]
+
+
+def test_slow_model_call_in_branch_stops_at_the_branch_timeout(monkeypatch):
+    import time
+
+    from agent import nodes
+
+    monkeypatch.setattr(nodes, "BRANCH_TIMEOUTS", {"chat": 0.05})
+    monkeypatch.setattr(nodes, "CASCADE_ENABLED", False)
+    monkeypatch.setattr(nodes, "COALESCE_REQUESTS", False)
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda **_: time.sleep(0.5) or DummyCompletion("late"))
+    started = time.perf_counter()
+    update = nodes.build_branch_node(types.SimpleNamespace(), "chat")({"input": "x", "thread_id": "t"})
+    assert update["branches"]["chat"]["status"] == "dropped"
+    assert time.perf_counter() - started < 0.4
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from agent.intent import IntentClassifier, RoutingLog, read_examples
+from agent.personas.loader import PersonaRegistry
+from agent.routing import KnowledgeRouter
+from train_intent import DEFAULT_EXAMPLES_PATH, collect_examples
+
+np = pytest.importorskip("numpy")
+
+EXAMPLES = [
+    ("帮我概括这篇文章的要点", "summarise"),
+    ("give me the key takeaways", "summarise"),
+    ("查一下向量数据库有哪些方案", "research"),
+    ("find sources about caching", "research"),
+    ("你好", "chat"),
+    ("今天心情不太好", "chat"),
+]
+
+
+def _registry(tmp_path):
+    path = tmp_path / "registry.yaml"
+    path.write_text(
+        """
+- id: generalist
+  name: Gen
+  description: d
+  style: s
+- id: researcher
+  name: Res
+  description: d
+  style: s
+        """,
+        encoding="utf-8",
+    )
+    registry = PersonaRegistry(path)
+    registry.load()
+    return registry
+
+
+def test_classifier_predicts_and_round_trips(tmp_path):
+    model = IntentClassifier.train(EXAMPLES, dimensions=1 << 10)
+    assert model.feature_log_prob.dtype == np.float32
+    label, confidence = model.predict("查一下有哪些方案")
+    assert label == "research"
+    assert 0.0 < confidence <= 1.0
+
+    path = tmp_path / "intent.npz"
+    model.save(path)
+    loaded = IntentClassifier.load(path)
+    assert loaded.labels == model.labels
+    assert loaded.predict_proba("你好") == pytest.approx(model.predict_proba("你好"))
+
+
+def test_router_uses_classifier_above_threshold(tmp_path):
+    path = tmp_path / "intent.npz"
+    IntentClassifier.train(EXAMPLES, dimensions=1 << 10).save(path)
+    log_path = tmp_path / "routing.jsonl"
+    router = KnowledgeRouter(_registry(tmp_path), classifier_path=path, intent_threshold=0.5, routing_log=log_path)
+
+    decision = router.select("查一下有哪些方案")
+    assert decision.route == "research"
+    assert decision.persona.id == "researcher"
+    assert decision.confidence >= 0.5
+
+    # Keyword hits still win and are logged as such.
+    assert router.select("总结一下").route == "summarise"
+    sources = [json.loads(line)["source"] for line in log_path.read_text(encoding="utf-8").splitlines()]
+    assert sources == ["classifier", "keyword"]
+
+
+def test_router_falls_back_below_threshold(tmp_path):
+    path = tmp_path / "intent.npz"
+    IntentClassifier.train(EXAMPLES, dimensions=1 << 10).save(path)
+    router = KnowledgeRouter(_registry(tmp_path), classifier_path=path, intent_threshold=1.01)
+
+    decision = router.select("查一下有哪些方案")
+    assert decision.route == "chat"
+    assert decision.confidence == pytest.approx(0.6)
+
+
+def test_training_examples_prefer_labels_and_trusted_sources(tmp_path):
+    log = RoutingLog(tmp_path / "routing.jsonl")
+    log.record("查一下资料", "research", 0.7, "keyword")
+    log.record("随便聊聊", "chat", 0.6, "fallback")
+    with log.path.open("a", encoding="utf-8") as handle:
+        handle.write(json.dumps({"input": "排一下上线步骤", "route": "chat", "source": "fallback", "label": "plan"}) + "\n")
+
+    assert list(read_examples(log.path, sources=["keyword"])) == [("查一下资料", "research"), ("排一下上线步骤", "plan")]
+    examples = collect_examples(DEFAULT_EXAMPLES_PATH, [log.path], ["keyword"])
+    assert ("排一下上线步骤", "plan") in examples
+    assert {label for _, label in examples} >= {"summarise", "research", "plan", "chat"}
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+import config
+from agent import llm
+
+
+def test_client_is_created_lazily_and_shared(monkeypatch):
+    monkeypatch.setattr(config, "_client", None)
+    first = config.get_client()
+    assert config.get_client() is first
+    assert config.client is first
+
+
+def test_chat_completion_uses_current_lane(monkeypatch):
+    seen = []
+
+    class RecordingLimiter:
+        def slot(self, lane, timeout=None):
+            seen.append(lane)
+            return threading.Lock()
+
+    monkeypatch.setattr(llm, "limiter", RecordingLimiter())
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda **kwargs: kwargs["model"])
+    assert llm.chat_completion(model="m") == "m"
+    with llm.use_lane(llm.BACKGROUND):
+        llm.chat_completion(model="m")
+    assert seen == [llm.INTERACTIVE, llm.BACKGROUND]
+
+
+def test_lane_concurrency_is_capped():
+    limiter = llm.LaneLimiter({llm.INTERACTIVE: 1, llm.BACKGROUND: 1}, llm.TokenBucket(0, 1))
+    with limiter.slot(llm.BACKGROUND):
+        with pytest.raises(llm.LimiterTimeout):
+            with limiter.slot(llm.BACKGROUND, timeout=0.01):
+                pass
+        with limiter.slot(llm.INTERACTIVE, timeout=0.01):
+            pass
+
+
+def test_token_bucket_serves_interactive_before_background():
+    bucket = llm.TokenBucket(rate=20, burst=1)
+    assert bucket.acquire(llm.INTERACTIVE)
+    order = []
+
+    def take(lane):
+        bucket.acquire(lane)
+        order.append(lane)
+
+    background = threading.Thread(target=take, args=(llm.BACKGROUND,))
+    background.start()
+    time.sleep(0.005)
+    interactive = threading.Thread(target=take, args=(llm.INTERACTIVE,))
+    interactive.start()
+    background.join(2)
+    interactive.join(2)
+    assert order == [llm.INTERACTIVE, llm.BACKGROUND]
+
+
+def _caller(**overrides):
+    options = dict(timeouts={}, default_timeout=1.0, hedge_after=0.05, min_samples=100)
+    options.update(overrides)
+    return llm.HedgedCaller(**options)
+
+
+def test_hedged_request_wins_when_first_attempt_stalls():
+    attempts = []
+    lock = threading.Lock()
+
+    def fn(timeout):
+        with lock:
+            attempts.append(1)
+            first = len(attempts) == 1
+        if first:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    caller = _caller()
+    assert caller.call("chat", fn) == "fast"
+    assert caller.stats()["hedged"] == 1 and caller.stats()["hedge_wins"] == 1
+
+
+def test_hard_timeout_raises_model_timeout():
+    caller = _caller(timeouts={"chat": 0.1}, hedging=False)
+    with pytest.raises(llm.ModelTimeout):
+        caller.call("chat", lambda timeout: time.sleep(0.3))
+
+
+def test_caller_deadline_caps_the_hard_timeout():
+    caller = _caller(timeouts={"chat": 5.0}, hedging=False)
+    budgets = []
+
+    def fn(timeout):
+        budgets.append(timeout)
+        time.sleep(0.3)
+
+    started = time.monotonic()
+    with llm.use_deadline(0.05), pytest.raises(llm.ModelTimeout):
+        caller.call("chat", fn)
+    assert time.monotonic() - started < 0.25
+    assert budgets and budgets[0] <= 0.05
+
+
+def test_limiter_wait_is_outside_the_latency_budget():
+    limiter = llm.LaneLimiter({llm.INTERACTIVE: 1, llm.BACKGROUND: 1}, llm.TokenBucket(0, 1))
+    breaker = llm.CircuitBreaker(error_rate=0.5, min_calls=1, window=60, cooldown=60)
+    caller = _caller(timeouts={"chat": 0.15}, hedge_after=0.02, breaker=breaker)
+    budgets = []
+    limiter.acquire(llm.INTERACTIVE)
+    threading.Timer(0.3, limiter.release, args=(llm.INTERACTIVE,)).start()
+
+    def fn(timeout):
+        budgets.append(timeout)
+        time.sleep(0.05)
+        return "ok"
+
+    # Queued behind the held slot for longer than the hard timeout, then served in time.
+    assert caller.call("chat", fn, limiter=limiter) == "ok"
+    # No free slot when the hedge was due, so none was sent; the slot is released afterwards.
+    assert budgets == [0.15] and caller.stats()["hedged"] == 0
+    assert breaker.state == "closed"
+    assert limiter.try_acquire(llm.INTERACTIVE)
+
+
+def test_circuit_breaker_opens_on_error_spike():
+    breaker = llm.CircuitBreaker(error_rate=0.5, min_calls=2, window=60, cooldown=60)
+    caller = _caller(breaker=breaker)
+
+    def boom(timeout):
+        raise RuntimeError("down")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            caller.call("chat", boom)
+    assert breaker.state == "open"
+    with pytest.raises(llm.CircuitOpen):
+        caller.call("chat", lambda timeout: "never")
+
+
+def test_breaker_probe_closes_circuit():
+    breaker = llm.CircuitBreaker(error_rate=0.5, min_calls=1, window=60, cooldown=0)
+    breaker.record(False)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def test_probe_is_released_when_the_limiter_times_out():
+    breaker = llm.CircuitBreaker(error_rate=0.5, min_calls=1, window=60, cooldown=0.05)
+    caller = _caller(breaker=breaker)
+    limiter = llm.LaneLimiter({llm.INTERACTIVE: 1, llm.BACKGROUND: 1}, llm.TokenBucket(0, 1))
+    with pytest.raises(RuntimeError):
+        caller.call("chat", lambda timeout: (_ for _ in ()).throw(RuntimeError("down")))
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    limiter.acquire(llm.INTERACTIVE)  # no capacity: the probe never reaches the model
+    with llm.use_deadline(0.01), pytest.raises(llm.LimiterTimeout):
+        caller.call("chat", lambda timeout: "never", limiter=limiter)
+    limiter.release(llm.INTERACTIVE)
+    assert caller.call("chat", lambda timeout: "ok", limiter=limiter) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_chat_node_degrades_when_model_unavailable(monkeypatch):
+    import memory
+    from agent import graph as agent_graph
+
+    def unavailable(**_):
+        raise llm.CircuitOpen("open")
+
+    memory.clear_history()
+    monkeypatch.setattr("agent.nodes.chat_completion", unavailable)
+    result = agent_graph.graph.invoke({"input": "普通对话"})
+    assert result["response"] == "模型暂时不可用，请稍后再试。"
+    assert result["metadata"]["degraded"] == "open"
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import types
+from pathlib import Path
+
+import memory
+from agent import graph as agent_graph
+from agent.memo import HIT, MISS, Memo, memo_key
+from agent.tools.docs import Document, DocumentVectorStore
+
+
+def test_lru_evicts_oldest_and_copies_values():
+    memo = Memo(2)
+    memo.put("a", {"v": [1]})
+    memo.put("b", {"v": [2]})
+    memo.get("a")["v"].append(99)
+    memo.put("c", {"v": [3]})
+    assert memo.get("b") is None
+    assert memo.get("a") == {"v": [1]}
+    assert memo.stats()["evictions"] == 1
+
+
+def test_disk_persistence_and_validation(tmp_path):
+    path = tmp_path / "memo.db"
+    first = Memo(4, path=path)
+    calls = []
+    value, status = first.get_or_compute("k", lambda: calls.append(1) or {"answer": 42})
+    assert (value, status) == ({"answer": 42}, MISS)
+
+    second = Memo(4, path=path)
+    assert second.get_or_compute("k", lambda: calls.append(1) or {"answer": 0}) == ({"answer": 42}, HIT)
+    assert second.get("k", validate=lambda value: False) is None
+    assert Memo(4, path=path).get("k") is None
+    assert len(calls) == 1
+
+
+def test_store_version_tracks_corpus():
+    store = DocumentVectorStore()
+    empty = store.version
+    store.replace_documents([Document(content="alpha")])
+    alpha = store.version
+    store.replace_documents([Document(content="alpha")])
+    assert store.version == alpha != empty
+    store.add_documents([Document(content="beta")])
+    assert store.version != alpha
+    assert memo_key("research", "q", [alpha]) != memo_key("research", "q", [store.version])
+
+
+def test_graph_memoises_plan_route():
+    memory.clear_history()
+    first = agent_graph.graph.invoke({"input": "制定计划: 先写代码.然后测试"})
+    second = agent_graph.graph.invoke({"input": "制定计划: 先写代码.然后测试"})
+    assert first["metadata"]["cache"] == {"plan": MISS}
+    assert second["metadata"]["cache"] == {"plan": HIT}
+    assert second["response"] == first["response"] and second["artifacts"] == first["artifacts"]
+
+
+def test_auto_reports_are_rotated(monkeypatch, tmp_path):
+    from agent import nodes
+    from agent.agents.docgen import DocumentGenerationAgent
+
+    monkeypatch.setattr(nodes, "AUTO_REPORT_LIMIT", 2)
+    monkeypatch.setattr(nodes, "MEMO_ENABLED", False)
+    components = types.SimpleNamespace(docgen=DocumentGenerationAgent(tmp_path))
+    paths = [
+        Path(nodes.run_route(components, "docgen", {"input": f"report {index}"})["artifacts"]["report_path"])
+        for index in range(3)
+    ]
+    nodes.run_route(components, "docgen", {"input": "report 2"})  # same input overwrites its file
+    assert sorted(tmp_path.glob("auto_report_*.pdf")) == sorted(paths[1:])
+    assert not paths[0].exists()
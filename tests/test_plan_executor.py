@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import threading
+import types
+
+import pytest
+
+import config
+import memory
+from agent import graph as agent_graph
+from agent import nodes
+from agent.agents.planner import PlannerAgent, PlanStep
+from agent.plan_executor import FAILED, OK, SKIPPED, PlanExecutor, topological_order
+
+
+def test_parallel_planner_infers_stages():
+    steps = PlannerAgent(parallel=True).run("调研竞品；整理用户反馈。然后撰写方案，最后评审")
+    assert [step.description for step in steps] == ["调研竞品", "整理用户反馈", "撰写方案", "评审"]
+    assert [step.depends_on for step in steps] == [[], [], [1, 2], [3]]
+    # The default mode keeps the linear chain.
+    assert [step.depends_on for step in PlannerAgent().run("a.b.c")] == [[], [1], [2]]
+
+
+def test_topological_order_rejects_cycles_and_unknown_steps():
+    assert topological_order([PlanStep("a", [2]), PlanStep("b", []), PlanStep("c", [1, 2])]) == [2, 1, 3]
+    with pytest.raises(ValueError):
+        topological_order([PlanStep("a", [2]), PlanStep("b", [1])])
+    with pytest.raises(ValueError):
+        topological_order([PlanStep("a", [5])])
+
+
+def test_independent_steps_run_concurrently_and_stream():
+    barrier = threading.Barrier(2, timeout=5)
+    seen = {}
+
+    def dispatch(step, upstream):
+        if step.description in ("a", "b"):
+            barrier.wait()  # both independent steps must be in flight at once
+        seen[step.description] = [item.response for item in upstream]
+        return {"response": step.description.upper(), "route": "chat"}
+
+    steps = [PlanStep("a", []), PlanStep("b", []), PlanStep("c", [1, 2])]
+    streamed = list(PlanExecutor(dispatch, max_workers=2).stream(steps))
+    assert [result.index for result in streamed][-1] == 3
+    assert all(result.status == OK for result in streamed)
+    assert sorted(seen["c"]) == ["A", "B"]
+
+
+def test_failed_step_skips_dependents():
+    def dispatch(step, upstream):
+        if step.description == "boom":
+            raise RuntimeError("bad step")
+        return {"response": "ok"}
+
+    steps = [PlanStep("boom", []), PlanStep("after", [1]), PlanStep("other", [])]
+    results = PlanExecutor(dispatch).run(steps)
+    assert [result.status for result in results] == [FAILED, SKIPPED, OK]
+    assert results[0].error == "bad step"
+
+
+def test_degraded_steps_count_as_failed():
+    def dispatch(step, upstream):
+        if step.description == "chat":
+            return {"response": nodes.DEGRADED_RESPONSE, "metadata": {"degraded": "model unavailable"}}
+        return {"response": "ok"}
+
+    results = PlanExecutor(dispatch).run([PlanStep("chat", []), PlanStep("after", [1]), PlanStep("other", [])])
+    assert [result.status for result in results] == [FAILED, SKIPPED, OK]
+    assert results[0].error == "model unavailable"
+
+
+def test_graph_executes_plan_steps(monkeypatch):
+    memory.clear_history()
+    monkeypatch.setattr(nodes, "PLAN_EXECUTE", True)
+    monkeypatch.setattr(agent_graph.components, "planner", PlannerAgent(parallel=True))
+    monkeypatch.setattr(agent_graph.components.summarise, "summariser", lambda text: "摘要:" + text)
+    reply = types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="完成"))])
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda *_, **__: reply)
+    result = agent_graph.graph.invoke({"input": "制定计划: 阅读文档；浏览代码。然后总结一下"})
+    outcomes = result["artifacts"]["plan_results"]
+    assert [(item["route"], item["status"]) for item in outcomes] == [("chat", OK), ("chat", OK), ("summarise", OK)]
+    # The final step sees both upstream answers.
+    assert outcomes[-1]["response"].count("完成") == 2
+    assert "cache" not in result["metadata"]
+
+
+def test_plan_steps_are_streamed_as_they_finish(monkeypatch):
+    events = []
+    monkeypatch.setattr(nodes, "PLAN_EXECUTE", True)
+    monkeypatch.setattr(nodes, "get_stream_writer", lambda: events.append)
+    monkeypatch.setattr(agent_graph.components, "planner", PlannerAgent(parallel=True))
+    monkeypatch.setattr(agent_graph.components.summarise, "summariser", lambda text: "摘要:" + text)
+    reply = types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="完成"))])
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda *_, **__: reply)
+    update = nodes.run_route(agent_graph.components, "plan", {"input": "制定计划: 阅读文档；浏览代码。然后总结一下"})
+    assert sorted(event["plan_step"]["index"] for event in events) == [1, 2, 3]
+    # The summary depends on both other steps, so it is always published last.
+    assert events[-1]["plan_step"]["route"] == "summarise"
+    assert [item["index"] for item in update["artifacts"]["plan_results"]] == [1, 2, 3]
+
+
+def test_plan_memo_key_follows_planner_mode():
+    linear = types.SimpleNamespace(planner=PlannerAgent(parallel=False))
+    staged = types.SimpleNamespace(planner=PlannerAgent(parallel=True))
+    assert nodes._memo_generation(linear, "plan") != nodes._memo_generation(staged, "plan")
+
+
+def test_chat_plan_steps_send_the_step_as_the_current_turn(monkeypatch):
+    memory.clear_history()
+    request = "制定计划: 阅读文档；浏览代码。然后总结一下"
+    memory.save_message("user", request)  # the CLI saves the turn before running the graph
+    monkeypatch.setattr(nodes, "PLAN_EXECUTE", True)
+    monkeypatch.setattr(nodes, "COALESCE_REQUESTS", False)
+    monkeypatch.setattr(agent_graph.components, "planner", PlannerAgent(parallel=True))
+    monkeypatch.setattr(agent_graph.components.summarise, "summariser", lambda text: "摘要:" + text)
+    sent = []
+    reply = types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="完成"))])
+
+    def create(**request_kwargs):
+        sent.append(request_kwargs["messages"])
+        return reply
+
+    monkeypatch.setattr(config.client.chat.completions, "create", create)
+    nodes.run_route(agent_graph.components, "plan", {"input": request})
+    first_stage = [step.description for step in PlannerAgent(parallel=True).run(request)[:2]]
+    assert sorted(messages[-1]["content"] for messages in sent) == sorted(first_stage)
+    # The original request is still there as context.
+    assert all(any(message["content"] == request for message in messages[:-1]) for messages in sent)
+    memory.clear_history()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import types
+
+import config
+import memory
+from agent import graph as agent_graph
+from agent.prompting import PromptBuilder, count_tokens, message_tokens
+
+
+def _history(*contents):
+    roles = ["user", "assistant"]
+    return [{"role": roles[idx % 2], "content": text} for idx, text in enumerate(contents)]
+
+
+def test_count_tokens_handles_mixed_text():
+    assert count_tokens("") == 0
+    assert count_tokens("你好世界") >= 4
+    assert count_tokens("hello world") >= 2
+
+
+def test_message_tokens_cached_on_entry():
+    entry = {"role": "user", "content": "cache me"}
+    first = message_tokens(entry)
+    assert entry["tokens"] == first
+    entry["content"] = "x" * 1000
+    assert message_tokens(entry) == first
+
+
+def test_builder_keeps_newest_turns_within_budget():
+    history = _history("old " * 200, "reply " * 200, "recent question", "recent answer", "current")
+    plan = PromptBuilder(120).build("current", history, system_prompt="Be concise.")
+    contents = [message["content"] for message in plan.messages]
+    assert contents[0] == "Be concise."
+    assert contents[-1] == "current"
+    assert "recent answer" in contents
+    assert plan.dropped == 2
+    assert plan.tokens <= 120
+
+
+def test_builder_summarises_overflow():
+    history = _history("old " * 200, "reply " * 200, "current")
+    plan = PromptBuilder(60, summariser=lambda text: "short recap").build("current", history)
+    assert plan.summarised
+    assert "short recap" in plan.messages[0]["content"]
+
+
+def test_failed_summary_drops_overflow_and_summaries_are_cached_and_bounded():
+    history = _history("old " * 200, "reply " * 200, "current")
+
+    def broken(text):
+        raise RuntimeError("model down")
+
+    plan = PromptBuilder(60, summariser=broken).build("current", history)
+    assert not plan.summarised and plan.dropped == 2
+    assert all("摘要失败" not in message["content"] for message in plan.messages)
+
+    seen = []
+
+    def recap(text):
+        seen.append(text)
+        return "short recap"
+
+    builder = PromptBuilder(60, summariser=recap, summary_input_budget=450)
+    for _ in range(2):
+        assert builder.build("current", history).summarised
+    # Only the newest overflow turn fits the summary input budget, and it is summarised once.
+    assert seen == ["assistant: " + "reply " * 200]
+
+
+def test_history_entries_carry_token_counts():
+    store = memory.InMemoryHistoryStore()
+    store.save_message("user", "你好")
+    assert isinstance(store.get_history()[0]["tokens"], int)
+
+
+def test_chat_prompt_respects_budget(monkeypatch):
+    memory.clear_history()
+    for idx in range(30):
+        memory.save_message("user", f"message {idx} " + "padding " * 50)
+    captured = {}
+
+    def _create(*_, **kwargs):
+        captured["messages"] = kwargs["messages"]
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="ok"))])
+
+    monkeypatch.setattr(config.client.chat.completions, "create", _create)
+    result = agent_graph.graph.invoke({"input": "普通对话"})
+    assert result["metadata"]["prompt"]["tokens"] <= config.PROMPT_INPUT_BUDGET
+    assert captured["messages"][-1]["content"].startswith("message 29")
+    memory.clear_history()
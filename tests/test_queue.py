@@ -0,0 +1,558 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from agent.queue.dbthread import DatabaseThread
+from agent.queue.engine import _PICK_TENANT_SQL, AsyncTaskQueue
+from agent.queue.models import TaskPriority, TaskStatus
+from agent.queue.notify import IdleBackoff, QueueNotifier
+
+
+def test_concurrent_claimers_never_share_a_task(tmp_path):
+    path = tmp_path / "queue.db"
+
+    async def _fill():
+        queue = AsyncTaskQueue(path)
+        ids = [await queue.enqueue({"input": str(index)}) for index in range(200)]
+        await queue.close()
+        return ids
+
+    ids = asyncio.run(_fill())
+    claimed = []
+    issued = []
+    lock = threading.Lock()
+
+    async def _drain():
+        # Every worker has its own connection, as separate processes would.
+        queue = AsyncTaskQueue(path)
+        queue._connection.set_trace_callback(issued.append)
+        while (task := await queue.acquire()) is not None:
+            with lock:
+                claimed.append(task.id)
+            await queue.complete(int(task.id), {"ok": True})
+        await queue.close()
+
+    workers = [threading.Thread(target=asyncio.run, args=(_drain(),)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(claimed) == ids
+    connection = sqlite3.connect(path)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # The statements acquire() really issued to pick a task are index seeks, never table scans.
+    picks = {sql for sql in issued if sql.lstrip().startswith(("SELECT priority FROM tasks", "WITH RECURSIVE"))}
+    assert len(picks) >= 2
+    for sql in picks:
+        plan = [row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql)]
+        assert any("idx_tasks_due_pick" in step for step in plan)
+        assert not any(step.startswith("SCAN") and "waiting" not in step for step in plan)
+    connection.close()
+
+
+def test_batch_enqueue_acquire_and_complete(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        ids = await queue.enqueue_many({"input": str(index)} for index in range(5))
+        assert ids == sorted(ids) and len(ids) == 5
+
+        batch = await queue.acquire_batch(3)
+        assert [task.id for task in batch] == ids[:3]
+        assert [task.payload["input"] for task in batch] == ["0", "1", "2"]
+        assert [task.id for task in await queue.acquire_batch(10)] == ids[3:]
+        assert await queue.acquire_batch(10) == []
+
+        await queue.complete_many((task_id, {"n": task_id}) for task_id in ids)
+        assert await queue.pending_count() == 0
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_enqueue_wakes_waiting_consumer_in_process(tmp_path):
+    path = tmp_path / "queue.db"
+
+    async def _run():
+        consumer = AsyncTaskQueue(path)
+        producer = AsyncTaskQueue(path)
+        assert await consumer.wait_for_work(0) is True  # first call starts listening
+        assert await consumer.wait_for_work(0.01) is False
+        started = time.perf_counter()
+        waiter = asyncio.create_task(consumer.wait_for_work(5))
+        await asyncio.sleep(0.01)
+        await producer.enqueue({"input": "hi"})
+        assert await waiter is True
+        assert time.perf_counter() - started < 1
+        assert (await consumer.acquire()).payload == {"input": "hi"}
+        await producer.close()
+        await consumer.close()
+
+    asyncio.run(_run())
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX") or "fork" not in multiprocessing.get_all_start_methods(), reason="needs UNIX sockets and fork")
+def test_notification_reaches_other_processes(tmp_path):
+    path = tmp_path / "queue.db"
+
+    async def _run():
+        consumer = AsyncTaskQueue(path)
+        await consumer.wait_for_work(0)
+        sockets = list(consumer._notifier.directory.glob("*.sock"))
+        assert len(sockets) == 1
+        waiter = asyncio.create_task(consumer.wait_for_work(5))
+        await asyncio.sleep(0.01)
+        child = multiprocessing.get_context("fork").Process(target=QueueNotifier(path).notify)
+        child.start()
+        child.join()
+        assert await asyncio.wait_for(waiter, 2) is True
+        await consumer.close()
+        assert not sockets[0].exists()
+
+    asyncio.run(_run())
+
+
+def test_idle_backoff_doubles_up_to_maximum():
+    backoff = IdleBackoff(0.05, 0.3)
+    assert [backoff.next() for _ in range(4)] == [0.05, 0.1, 0.2, 0.3]
+    backoff.reset()
+    assert backoff.next() == 0.05
+
+
+def test_expired_leases_are_requeued_then_dead_lettered(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", lease_seconds=0, max_attempts=2, retry_backoff=0)
+        task_id = await queue.enqueue({"input": "crashy"})
+        first = await queue.acquire()
+        assert first.attempts == 1
+        await asyncio.sleep(0.01)
+        assert await queue.reap_expired() == {"requeued": 1, "dead_letter": 0}
+        second = await queue.acquire()
+        assert second.id == task_id and second.attempts == 2
+        await asyncio.sleep(0.01)
+        assert await queue.reap_expired() == {"requeued": 0, "dead_letter": 1}
+        assert await queue.acquire() is None
+        assert await queue.pending_count() == 0
+        row = queue._connection.execute("SELECT status, error FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        assert (row["status"], row["error"]) == (TaskStatus.DEAD_LETTER.value, "lease expired")
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_heartbeat_keeps_lease_and_failures_back_off(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", lease_seconds=30, max_attempts=2, retry_backoff=60)
+        task_id = await queue.enqueue({"input": "x"})
+        await queue.acquire()
+        await queue.touch([task_id])
+        assert await queue.reap_expired() == {"requeued": 0, "dead_letter": 0}
+
+        assert await queue.fail(task_id, "boom", retry=True) == TaskStatus.PENDING
+        assert await queue.acquire() is None  # not due for another minute
+        queue._connection.execute("UPDATE tasks SET run_at = ?", ("2000-01-01T00:00:00.000000",))
+        queue._connection.commit()
+        assert (await queue.acquire()).attempts == 2
+        assert await queue.fail(task_id, "boom", retry=True) == TaskStatus.DEAD_LETTER
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_old_databases_are_migrated(tmp_path):
+    path = tmp_path / "queue.db"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, status TEXT NOT NULL,"
+        " result TEXT, error TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    connection.execute(
+        "INSERT INTO tasks (payload, status, created_at, updated_at) VALUES ('{\"input\": \"old\"}', 'pending', '2024-01-01', '2024-01-01')"
+    )
+    connection.execute(
+        "INSERT INTO tasks (payload, status, created_at, updated_at) VALUES ('{\"input\": \"stuck\"}', 'in_progress', '2024-01-01', '2024-01-01')"
+    )
+    connection.commit()
+    connection.close()
+
+    async def _run():
+        queue = AsyncTaskQueue(path, retry_backoff=0)
+        task = await queue.acquire()
+        assert task.payload == {"input": "old"} and task.attempts == 1
+        # Claimed before leases existed: recovered by the reaper instead of staying stuck.
+        await asyncio.sleep(0.001)
+        assert await queue.reap_expired() == {"requeued": 1, "dead_letter": 0}
+        assert (await queue.acquire()).payload == {"input": "stuck"}
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_priority_first_then_fair_share_across_tenants(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        await queue.enqueue_many(({"n": index} for index in range(6)), tenant="bulk", priority=TaskPriority.LOW)
+        await queue.enqueue_many(({"n": index} for index in range(6)), tenant="batch")
+        await queue.enqueue_many(({"n": index} for index in range(2)), tenant="alice")
+        await queue.enqueue({"n": 0}, tenant="bob", priority=TaskPriority.HIGH)
+
+        claimed = await queue.acquire_batch(6)
+        order = [(task.tenant, task.priority) for task in claimed]
+        # HIGH first; then NORMAL alternates between tenants instead of draining "batch" first.
+        assert order[0] == ("bob", TaskPriority.HIGH)
+        assert [tenant for tenant, _ in order[1:5]] in (["alice", "batch"] * 2, ["batch", "alice"] * 2)
+        assert all(priority == TaskPriority.NORMAL for _, priority in order[1:])
+
+        stats = await queue.stats()
+        assert list(stats) == [TaskPriority.HIGH, TaskPriority.NORMAL, TaskPriority.LOW]
+        assert stats[TaskPriority.NORMAL] | {"oldest_wait": 0, "avg_wait": 0, "max_wait": 0} == {
+            "pending": 3, "in_progress": 5, "oldest_wait": 0, "started": 5, "avg_wait": 0, "max_wait": 0,
+        }
+        assert stats[TaskPriority.LOW]["pending"] == 6 and stats[TaskPriority.LOW]["oldest_wait"] >= 0
+
+        rest = [task.tenant for task in await queue.acquire_batch(20)]
+        assert rest == ["batch"] * 3 + ["bulk"] * 6
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_tenant_weights_share_workers_proportionally(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        await queue.set_tenant_weight("gold", 3)
+        await queue.enqueue_many(({"n": index} for index in range(10)), tenant="free")
+        await queue.enqueue_many(({"n": index} for index in range(10)), tenant="gold")
+        tenants = [task.tenant for task in await queue.acquire_batch(8)]
+        assert tenants.count("gold") == 6 and tenants.count("free") == 2
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_idle_tenants_are_not_scanned_when_picking(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        # Tenants that were served once and went quiet stay in tenant_usage.
+        for index in range(50):
+            await queue.set_tenant_weight(f"idle-{index:02d}", 1)
+        await queue.enqueue({"n": 1}, tenant="zed")
+        await queue.enqueue({"n": 2}, tenant="amy")
+        assert [task.tenant for task in await queue.acquire_batch(5)] == ["amy", "zed"]
+        await queue.close()
+
+    asyncio.run(_run())
+    connection = sqlite3.connect(tmp_path / "queue.db")
+    plan = [row[-1] for row in connection.execute(
+        "EXPLAIN QUERY PLAN " + _PICK_TENANT_SQL, {"status": "pending", "priority": 1, "now": ""}
+    )]
+    connection.close()
+    assert any("idx_tasks_due_pick" in step for step in plan)
+    assert not any(step.startswith("SCAN u") or step.startswith("SCAN tenant_usage") for step in plan)
+
+
+def test_delayed_tasks_wait_until_due(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", notify=False)
+        assert await queue.next_due_in() is None
+        later = await queue.enqueue({"input": "later"}, run_at=datetime.now(timezone.utc) + timedelta(minutes=10))
+        assert await queue.acquire() is None
+        assert 590 < await queue.next_due_in() <= 600
+
+        soon = await queue.enqueue({"input": "soon"}, run_at=datetime.utcnow() + timedelta(milliseconds=50))
+        assert await queue.acquire() is None
+        await asyncio.sleep(await queue.next_due_in())
+        assert (await queue.acquire()).id == soon
+        assert (await queue.stats())[TaskPriority.NORMAL]["pending"] == 1
+        assert later not in {task.id for task in await queue.acquire_batch(5)}
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_schedules_enqueue_each_run_once(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", notify=False)
+        start = datetime.utcnow() - timedelta(minutes=25)
+        await queue.add_schedule("digest", {"kind": "digest"}, every=timedelta(minutes=10), start_at=start)
+        (task_id,) = await queue.tick_schedules()
+        # Missed runs collapse into one task; the next run is in the future.
+        assert await queue.tick_schedules() == []
+        assert (await queue.acquire()).id == task_id
+        assert 290 < await queue.next_due_in() <= 300
+        assert await queue.remove_schedule("digest")
+        assert not await queue.remove_schedule("digest")
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_concurrent_writes_are_group_committed_off_the_loop(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", notify=False)
+        loop_thread = threading.get_ident()
+        threads = set()
+
+        def broken():
+            threads.add(threading.get_ident())
+            queue._connection.execute("INSERT INTO tasks (payload) VALUES ('missing columns')")
+
+        results = await asyncio.gather(
+            *(queue.enqueue({"input": str(number)}) for number in range(20)),
+            queue._db.write(broken),
+            return_exceptions=True,
+        )
+        ids, failure = results[:20], results[20]
+        # One failing job only rolls back its own savepoint.
+        assert isinstance(failure, sqlite3.IntegrityError)
+        assert len(set(ids)) == 20 and await queue.pending_count() == 20
+        assert queue._db.commits < 20
+        assert threads and loop_thread not in threads
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def _held_thread(tmp_path, schema):
+    connection = sqlite3.connect(tmp_path / "db.sqlite", isolation_level=None, check_same_thread=False)
+    connection.executescript(schema)
+    return connection, DatabaseThread(connection)
+
+
+def test_group_reads_never_see_rolled_back_writes(tmp_path):
+    connection, db = _held_thread(
+        tmp_path,
+        "PRAGMA foreign_keys = ON;"
+        "CREATE TABLE parent (id INTEGER PRIMARY KEY);"
+        "CREATE TABLE child (parent_id INTEGER REFERENCES parent (id) DEFERRABLE INITIALLY DEFERRED);",
+    )
+
+    async def _run():
+        gate = threading.Event()
+        blocker = db.read(gate.wait)
+        # Queued behind the blocker, so all three land in one group.
+        orphan = db.write(lambda: connection.execute("INSERT INTO child VALUES (1)"))
+        count = db.read(lambda: connection.execute("SELECT COUNT(*) FROM child").fetchone()[0])
+        gate.set()
+        await blocker
+        with pytest.raises(sqlite3.IntegrityError):
+            await orphan  # the deferred foreign key fails the COMMIT
+        assert await count == 0
+        await db.close()
+
+    asyncio.run(_run())
+
+
+def test_locked_database_fails_the_group_after_one_begin(tmp_path):
+    connection, db = _held_thread(tmp_path, "PRAGMA busy_timeout = 0; CREATE TABLE items (n INTEGER);")
+    begins = []
+    connection.set_trace_callback(lambda sql: sql.startswith("BEGIN") and begins.append(sql))
+    other = sqlite3.connect(tmp_path / "db.sqlite", isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def _run():
+        gate = threading.Event()
+        blocker = db.read(gate.wait)
+        writes = [db.write(lambda n=n: connection.execute("INSERT INTO items VALUES (?)", (n,))) for n in range(3)]
+        gate.set()
+        await blocker
+        failures = await asyncio.gather(*writes, return_exceptions=True)
+        assert all(isinstance(failure, sqlite3.OperationalError) for failure in failures)
+        assert len(begins) == 1
+        other.rollback()
+        await db.write(lambda: connection.execute("INSERT INTO items VALUES (9)"))
+        assert await db.read(lambda: connection.execute("SELECT n FROM items").fetchall()) == [(9,)]
+        await db.close()
+
+    asyncio.run(_run())
+    other.close()
+
+
+def test_savepoint_errors_fail_their_jobs_and_keep_the_thread(tmp_path):
+    # No statement cache, so the authorizer sees every SAVEPOINT/RELEASE as it is prepared.
+    connection = sqlite3.connect(tmp_path / "db.sqlite", isolation_level=None, check_same_thread=False, cached_statements=0)
+    connection.execute("CREATE TABLE items (n INTEGER)")
+    denied = []
+
+    def authorize(action, operation, *_):
+        if action == sqlite3.SQLITE_SAVEPOINT and denied and denied[0] == operation:
+            denied.pop(0)
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    connection.set_authorizer(authorize)
+    db = DatabaseThread(connection)
+
+    def insert(n):
+        return db.write(lambda: connection.execute("INSERT INTO items VALUES (?)", (n,)))
+
+    async def _group(*values):
+        gate = threading.Event()
+        blocker = db.read(gate.wait)
+        writes = [insert(n) for n in values]
+        gate.set()
+        await blocker
+        return await asyncio.gather(*writes, return_exceptions=True)
+
+    async def _run():
+        denied.append("BEGIN")  # the first job's SAVEPOINT fails; the rest of the group commits
+        first, second = await _group(1, 2)
+        assert isinstance(first, sqlite3.DatabaseError) and not isinstance(second, Exception)
+        denied.append("RELEASE")  # a job can no longer be undone alone, so the group rolls back
+        assert all(isinstance(failure, sqlite3.DatabaseError) for failure in await _group(3, 4))
+        await insert(5)
+        assert await db.read(lambda: connection.execute("SELECT n FROM items ORDER BY n").fetchall()) == [(2,), (5,)]
+        await db.close()
+
+    asyncio.run(_run())
+
+
+def test_wait_and_completion_events(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        first, second = await queue.enqueue_many([{"input": "a"}, {"input": "b"}])
+        assert (await queue.get(first)).status == TaskStatus.PENDING
+        assert await queue.get(999) is None and await queue.wait(999, 0.1) is None
+
+        events = queue.completions()
+        received = asyncio.ensure_future(events.__anext__())
+        waiter = asyncio.create_task(queue.wait(first, 5))
+        timed_out = await queue.wait(second, 0.05)
+        assert timed_out.status == TaskStatus.PENDING
+
+        await queue.acquire_batch(2)
+        await queue.complete(first, {"response": "A"})
+        done = await asyncio.wait_for(waiter, 2)
+        assert done.status == TaskStatus.COMPLETED and done.result == {"response": "A"} and done.finished_at
+        assert (await asyncio.wait_for(received, 2)).id == first
+        await queue.fail(second, "boom")
+        failed = await asyncio.wait_for(events.__anext__(), 2)
+        assert (failed.id, failed.status, failed.error) == (second, TaskStatus.FAILED, "boom")
+        # Finished tasks are returned at once.
+        assert (await queue.wait(second, 0)).status == TaskStatus.FAILED
+        await events.aclose()
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX") or "fork" not in multiprocessing.get_all_start_methods(), reason="needs UNIX sockets and fork")
+def test_completion_in_other_process_wakes_waiter(tmp_path):
+    path = tmp_path / "queue.db"
+
+    async def _run():
+        queue = AsyncTaskQueue(path)
+        task_id = await queue.enqueue({"input": "x"})
+        waiter = asyncio.create_task(queue.wait(task_id, 30))
+        await asyncio.sleep(0.3)  # the watcher's poll interval has backed off by now
+        # A queue without notifications stands in for the other process's database work ...
+        other = AsyncTaskQueue(path, notify=False)
+        await other.acquire()
+        await other.complete(task_id, {"ok": True})
+        await other.close()
+        # ... and a forked child delivers its completion notification.
+        started = time.monotonic()
+        child = multiprocessing.get_context("fork").Process(target=QueueNotifier(path, channel="done").notify)
+        child.start()
+        child.join()
+        task = await asyncio.wait_for(waiter, 5)
+        assert task.result == {"ok": True}
+        assert time.monotonic() - started < 0.3
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_dedup_key_returns_existing_task(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", notify=False, dedup_window=60)
+        task, created = await queue.enqueue_or_get({"input": "x"}, dedup_key="form-1")
+        assert created and task.dedup_key == "form-1"
+        assert await queue.enqueue({"input": "x"}, dedup_key="form-1") == task.id
+        await queue.acquire()
+        await queue.complete(task.id, {"response": "X"})
+        again, created = await queue.enqueue_or_get({"input": "x"}, dedup_key="form-1")
+        assert not created and (again.id, again.status, again.result) == (task.id, TaskStatus.COMPLETED, {"response": "X"})
+        assert await queue.enqueue({"input": "y"}, dedup_key="form-2") != task.id
+        assert queue._connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 2
+
+        # Outside the window a finished task releases its key; an unfinished one never does.
+        queue.dedup_window = 0
+        fresh, created = await queue.enqueue_or_get({"input": "x"}, dedup_key="form-1")
+        assert created and fresh.id != task.id and (await queue.get(task.id)).dedup_key is None
+        assert await queue.enqueue({"input": "x"}, dedup_key="form-1") == fresh.id
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_cancel_drops_a_pending_task_and_releases_its_key(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db")
+        task_id = await queue.enqueue({"n": 1}, dedup_key="task:1")
+        assert await queue.cancel("task:1") == task_id
+        assert await queue.cancel("task:1") is None
+        cancelled = await queue.wait(task_id, timeout=1)
+        assert cancelled.status == TaskStatus.CANCELLED and cancelled.finished_at is not None
+        assert await queue.acquire() is None
+        assert await queue.enqueue({"n": 2}, dedup_key="task:1") != task_id
+        running = await queue.acquire()
+        assert await queue.cancel("task:1") is None  # already running
+        assert (await queue.get(running.id)).status == TaskStatus.IN_PROGRESS
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_stale_worker_cannot_touch_a_reclaimed_task(tmp_path):
+    async def _run():
+        queue = AsyncTaskQueue(tmp_path / "queue.db", lease_seconds=0, retry_backoff=0)
+        task_id = await queue.enqueue({"input": "x"})
+        stale = await queue.acquire()
+        await asyncio.sleep(0.001)
+        assert (await queue.reap_expired())["requeued"] == 1
+        queue.lease_seconds = 60
+        current = await queue.acquire()
+        assert current.attempts == stale.attempts + 1
+
+        # Worker A's lease is gone: its heartbeat, failure and result are all ignored.
+        assert await queue.touch([task_id], attempts={task_id: stale.attempts}) == [task_id]
+        assert await queue.fail(task_id, "boom", retry=True, attempt=stale.attempts) is None
+        assert not await queue.complete(task_id, {"response": "stale"}, attempt=stale.attempts)
+        assert await queue.acquire() is None
+
+        assert await queue.touch([task_id], attempts={task_id: current.attempts}) == []
+        assert await queue.complete(task_id, {"response": "B"}, attempt=current.attempts)
+        assert (await queue.get(task_id)).result == {"response": "B"}
+        await queue.close()
+
+    asyncio.run(_run())
+
+
+def test_wait_sees_completions_committed_late(tmp_path):
+    path = tmp_path / "queue.db"
+
+    async def _run():
+        queue = AsyncTaskQueue(path)
+        task_id = await queue.enqueue({"input": "x"})
+        waiter = asyncio.create_task(queue.wait(task_id))
+        await asyncio.sleep(0.05)
+        # Another process stamped finished_at before the watcher started but committed only now.
+        stamp = (datetime.utcnow() - timedelta(seconds=1)).isoformat(timespec="microseconds")
+        connection = sqlite3.connect(path)
+        connection.execute("UPDATE tasks SET status = 'completed', finished_at = ? WHERE id = ?", (stamp, task_id))
+        connection.commit()
+        connection.close()
+        QueueNotifier(path, channel="done").notify()
+        assert (await asyncio.wait_for(waiter, 2)).status == TaskStatus.COMPLETED
+        await queue.close()
+
+    asyncio.run(_run())
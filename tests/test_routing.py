@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import logging
+import os
+
+from agent.matcher import KeywordMatcher
 from agent.personas.loader import PersonaRegistry
 from agent.routing import KnowledgeRouter
 
@@ -25,3 +29,94 @@ def test_router_selects_persona(tmp_path):
     decision = router.select("需要research")
     assert decision.route == "research"
     assert decision.persona.id == "researcher"
+
+
+def test_router_emits_multiple_routes(tmp_path):
+    registry_path = tmp_path / "registry.yaml"
+    registry_path.write_text(
+        """
+- id: generalist
+  name: Gen
+  description: d
+  style: s
+- id: researcher
+  name: Res
+  description: d
+  style: s
+- id: planner
+  name: Plan
+  description: d
+  style: s
+        """,
+        encoding="utf-8",
+    )
+    registry = PersonaRegistry(registry_path)
+    registry.load()
+    decisions = KnowledgeRouter(registry).select_many("research X and plan Y")
+    assert [decision.route for decision in decisions] == ["research", "plan"]
+    assert [d.route for d in KnowledgeRouter(registry, max_routes=1).select_many("research X and plan Y")] == ["research"]
+
+
+def test_keyword_matcher_finds_overlapping_keywords():
+    matcher = KeywordMatcher([("he", "a"), ("she", "b"), ("hers", "c"), ("总结一下", "d"), ("总结", "e")])
+    assert sorted(matcher.iter_matches("uSHErs")) == [(3, "a"), (3, "b"), (5, "c")]
+    assert matcher.labels("请总结一下") == {"d", "e"}
+    assert matcher.labels("nothing") == set()
+
+
+def test_router_hot_reloads_route_config(tmp_path):
+    registry_path = tmp_path / "registry.yaml"
+    registry_path.write_text(
+        """
+- id: generalist
+  name: Gen
+  description: d
+  style: s
+- id: planner
+  name: Plan
+  description: d
+  style: s
+        """,
+        encoding="utf-8",
+    )
+    registry = PersonaRegistry(registry_path)
+    registry.load()
+    routes_path = tmp_path / "routes.yaml"
+    routes_path.write_text(
+        "- route: plan\n  persona: planner\n  confidence: 0.9\n  keywords: roadmap\n"
+        "- route: chat\n  persona: generalist\n  confidence: 0.5\n  fallback: true\n",
+        encoding="utf-8",
+    )
+    router = KnowledgeRouter(registry, routes_path=routes_path, reload_interval=0)
+    assert router.select("Roadmap please").route == "plan"
+    assert router.select("hello").confidence == 0.5
+
+    routes_path.write_text(
+        "- route: plan\n  persona: planner\n  confidence: 0.9\n  keywords: 路线图, milestone\n"
+        "- route: chat\n  persona: generalist\n  confidence: 0.5\n  fallback: true\n",
+        encoding="utf-8",
+    )
+    stat = routes_path.stat()
+    os.utime(routes_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert router.select("给我一个路线图").route == "plan"
+    assert router.select("Roadmap please").route == "chat"
+
+    routes_path.write_text("- route: plan\n  persona: planner\n  confidence: oops\n", encoding="utf-8")
+    os.utime(routes_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000))
+    assert router.select("milestone").route == "plan"
+
+    # Unknown personas or a missing fallback are rejected like parse errors, and only warned about once.
+    warnings = []
+    router_logger = logging.getLogger("agent.routing")
+    handler = logging.Handler()
+    handler.emit = warnings.append
+    router_logger.addHandler(handler)
+    try:
+        routes_path.write_text("- route: plan\n  persona: ghost\n  confidence: 0.9\n  keywords: milestone\n", encoding="utf-8")
+        os.utime(routes_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 3_000_000))
+        for _ in range(3):
+            assert router.select("milestone").persona.id == "planner"
+        assert router.select("hello").route == "chat"
+        assert len(warnings) == 1 and "ghost" in warnings[0].getMessage()
+    finally:
+        router_logger.removeHandler(handler)
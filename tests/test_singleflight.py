@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from agent.singleflight import CoalescingGraph, SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return {"value": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()["calls"] < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 5
+    assert flight.stats() == {"calls": 5, "executed": 1, "coalesced": 4, "in_flight": 0, "wait_timeouts": 0}
+
+
+def test_follower_runs_itself_when_the_leader_hangs():
+    flight = SingleFlight(wait_timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=("k", lambda: release.wait(2) and "leader"))
+    leader.start()
+    while flight.stats()["in_flight"] < 1:
+        time.sleep(0.01)
+    started = time.perf_counter()
+    assert flight.do_shared("k", lambda: "own") == ("own", False)
+    assert time.perf_counter() - started < 1
+    assert flight.stats()["wait_timeouts"] == 1
+    release.set()
+    leader.join()
+
+
+def test_errors_propagate_and_are_not_cached():
+    flight = SingleFlight()
+
+    def boom():
+        raise RuntimeError("fail")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", boom)
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_coalescing_graph_uses_key_function():
+    seen = []
+    graph = type("G", (), {"invoke": lambda self, state: seen.append(state) or {"response": state["input"]}})()
+    wrapped = CoalescingGraph(graph, key_fn=lambda state: None)
+    assert wrapped.invoke({"input": "hi"}) == {"response": "hi"}
+    assert wrapped.flight.stats()["calls"] == 0
+    assert len(seen) == 1
@@ -0,0 +1,57 @@
+"""Cold-start guard: importing the graph must stay cheap and side-effect free."""
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# Generous ceiling for slow CI machines; the lazy import takes a fraction of this.
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "2.0"))
+
+_PROBE = """
+import json, sys, time
+import conftest
+started = time.perf_counter()
+import agent.graph as graph_module
+elapsed = time.perf_counter() - started
+import config
+from agent.tools import web
+print(json.dumps({
+    "elapsed": elapsed,
+    "initialised": graph_module.components.initialised(),
+    "client_created": config._client is not None,
+    "web_index_built": web._default_search is not None,
+    "pandas_loaded": "pandas" in sys.modules,
+}))
+"""
+
+
+def test_graph_import_is_lazy_and_fast():
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert report["initialised"] == []
+    assert not report["client_created"]
+    assert not report["web_index_built"]
+    assert not report["pandas_loaded"]
+    assert report["elapsed"] < STARTUP_BUDGET_SECONDS
+
+
+def test_components_build_on_first_use():
+    from agent.nodes import GraphComponents
+
+    built = []
+    components = GraphComponents(factories={"planner": lambda: built.append(1) or "planner"})
+    assert components.initialised() == []
+    assert components.planner == "planner"
+    assert components.planner == "planner"
+    assert built == [1]
+    assert components.initialised() == ["planner"]
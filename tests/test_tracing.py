@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import json
+import types
+
+import config
+import memory
+from agent import graph as agent_graph
+from agent.tracing import InMemoryExporter, JsonlExporter, Tracer, tracer, traced_node
+
+
+def _completion(text: str):
+    usage = types.SimpleNamespace(prompt_tokens=12, completion_tokens=3, total_tokens=15)
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))],
+        usage=usage,
+    )
+
+
+def _names(spans):
+    return [span["name"] for span in spans]
+
+
+def test_graph_records_node_spans_with_usage(monkeypatch):
+    memory.clear_history()
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracer, "exporters", [exporter])
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda **kwargs: _completion("hi"))
+    result = agent_graph.graph.invoke({"input": "普通对话"})
+
+    trace = result["metadata"]["trace"]
+    assert _names(trace) == ["route", "execute", "finalize"]
+    assert all(span["duration_ms"] is not None for span in trace)
+    agent_span = trace[1]["children"][0]
+    assert agent_span["name"] == "agent.chat"
+    llm_span = agent_span["children"][0]
+    assert llm_span["kind"] == "llm"
+    assert llm_span["attributes"]["usage"]["total_tokens"] == 15
+    assert {span["trace_id"] for span in exporter.spans} == {result["metadata"]["trace_id"]}
+
+
+def test_branch_spans_are_folded_into_trace(monkeypatch):
+    memory.clear_history()
+    monkeypatch.setattr(agent_graph.components.summarise, "summariser", lambda text: "摘要")
+    result = agent_graph.graph.invoke({"input": "请总结并plan一下"})
+    names = _names(result["metadata"]["trace"])
+    assert "branch_summarise" in names and "branch_plan" in names and names[-1] == "finalize"
+
+
+def test_jsonl_exporter_appends_lines(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    local = Tracer([JsonlExporter(path)])
+    with local.span("unit", kind="node") as span:
+        pass
+    local.export("abc", span.to_dict())
+    local.export("abc", span.to_dict())
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2 and json.loads(lines[0])["trace_id"] == "abc"
+
+
+def test_traced_node_disabled_is_passthrough(monkeypatch):
+    monkeypatch.setattr(tracer, "enabled", False)
+    node = traced_node("noop", lambda state: {**state, "response": "x"})
+    assert node({"input": "a"}) == {"input": "a", "response": "x"}
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import types
+
+import config
+import main
+import memory
+from agent import graph as agent_graph
+from agent.usage import UsageLedger, attribute_usage, estimate_cost, merge_usage, usage_ledger
+
+
+def _completion(text: str, prompt: int = 20, completion: int = 5):
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))],
+        usage=types.SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion),
+    )
+
+
+def test_estimate_cost_uses_base_model_price():
+    prices = {"gpt-4o": (2.0, 8.0), "gpt-4o-mini": (0.1, 0.4)}
+    assert estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0, prices) == 0.1
+    assert estimate_cost("gpt-4o", 0, 500_000, prices) == 4.0
+    assert estimate_cost("unknown", 100, 100, prices) == 0.0
+
+
+def test_ledger_groups_by_attribution():
+    ledger = UsageLedger({"m": (1.0, 2.0)})
+    with attribute_usage(route="chat", persona="generalist") as collector:
+        ledger.record("m", {"prompt_tokens": 10, "completion_tokens": 5})
+    ledger.record("m", {"prompt_tokens": 1, "completion_tokens": 1}, route="summarise")
+    assert collector.as_metadata()["total_tokens"] == 15
+    by_route = {row["route"]: row for row in ledger.summary(group_by=["route"])}
+    assert by_route["chat"]["calls"] == 1 and by_route["chat"]["total_tokens"] == 15
+    assert by_route["summarise"]["prompt_tokens"] == 1
+    assert ledger.summary(group_by=["model"])[0]["calls"] == 2
+    assert len(ledger.summary(window=True)) == 2
+
+
+def test_merge_usage_adds_branch_totals():
+    merged = merge_usage({"calls": 1, "total_tokens": 3, "models": ["a"]}, None, {"calls": 2, "total_tokens": 4, "models": ["b"]})
+    assert merged["calls"] == 3 and merged["total_tokens"] == 7 and merged["models"] == ["a", "b"]
+
+
+def test_graph_reports_real_tokens_and_cli_usage(monkeypatch):
+    memory.clear_history()
+    usage_ledger.reset()
+    monkeypatch.setattr(config.client.chat.completions, "create", lambda **kwargs: _completion("你好"))
+    result = agent_graph.graph.invoke({"input": "普通对话"})
+
+    assert result["metadata"]["tokens"] == 25
+    assert result["metadata"]["usage"]["calls"] == 1
+    (row,) = usage_ledger.summary()
+    assert (row["route"], row["persona"]) == ("chat", "generalist")
+    response, cont = main.handle_user_input("/usage route")
+    assert "chat" in response and "25 tokens" in response and cont
@@ -11,13 +11,33 @@ from agent.tools import (
     parse_datetime,
     parse_due,
 )
+from agent.llm import chat_completion
 from agent.tools.web import search_web as _search_web
-from config import DEFAULT_MODEL, MAX_TOKENS, TEMPERATURE, client
+from agent.tracing import traced
+from config import DEFAULT_MODEL, MAX_TOKENS, ROUTE_MODELS, TEMPERATURE
 
 # 获取 logger
 logger = logging.getLogger(__name__)
 
 
+SUMMARY_FAILED = "[摘要失败]"
+
+
+def summarize_text_or_raise(text: str) -> str:
+    """Like :func:`summarize_text`, but model errors propagate instead of becoming ``SUMMARY_FAILED``."""
+
+    prompt = f"请用简洁的语言总结以下内容：\n\n{text}"
+    resp = chat_completion(
+        route="summarise",
+        model=ROUTE_MODELS.get("summarise", DEFAULT_MODEL),
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=MAX_TOKENS,
+        temperature=TEMPERATURE,
+    )
+    return resp.choices[0].message.content.strip()
+
+
+@traced("tool.summarize_text")
 def summarize_text(text: str) -> str:
     """
     使用 OpenAI 模型对给定文本进行摘要。
@@ -26,21 +46,14 @@ def summarize_text(text: str) -> str:
     Returns:
         str: 摘要结果。
     """
-    prompt = f"请用简洁的语言总结以下内容：\n\n{text}"  
     try:
-        resp = client.chat.completions.create(
-            model=DEFAULT_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE,
-        )
-        summary = resp.choices[0].message.content.strip()
-        return summary
+        return summarize_text_or_raise(text)
     except Exception as e:
         logger.error(f"summarize_text 出错: {e}")
-        return "[摘要失败]"
+        return SUMMARY_FAILED
 
 
+@traced("tool.web_search")
 def web_search(query: str, max_results: int = 5) -> List[str]:
     """Search the bundled offline corpus and return formatted snippets."""
 